@@ -1,20 +1,44 @@
 import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
 from pprint import pprint
+from typing import Dict, Iterator
 
-from database.books import (create_books_data, get_all_books, add_book, find_book, delete_book,
-                            give_book_to_user, get_book_from_user)
+from database import (binary_snapshot, bloom, completion, fixed_width, holders, profiling,
+                      reconcile, sharded_users, sqlite_store, transactions, wal)
+from database.search import search_books
+from database.locking import ConflictError
+from database.books import (BookStore, create_books_data, get_all_books, add_book,
+                            find_book, delete_book, import_books, give_book_to_user,
+                            get_book_from_user, iter_books, set_store as set_books_store,
+                            get_store as get_books_store)
 from database.users import (create_users_data, add_user, get_user_books, delete_user,
-                            get_all_users, get_book_from_library, return_book_to_library)
+                            get_all_users, get_book_from_library, return_book_to_library,
+                            iter_users, set_store as set_users_store,
+                            get_store as get_users_store)
 
 possible_operations = [
-    'get_all_books', 'add_book', 'find_book', 'delete_book',
-    'get_all_users', 'add_user', 'get_user_books', 'delete_user',
-    'get_book_from_library', 'return_book_to_library'
+    'get_all_books', 'add_book', 'find_book', 'delete_book', 'import_books', 'reconcile_catalogue',
+    'get_all_users', 'add_user', 'get_user_books', 'delete_user', 'get_book_holders',
+    'get_book_from_library', 'return_book_to_library',
+    'search_books', 'complete_books', 'find_near_books',
+    'convert_books', 'convert_users', 'compact', 'convert_to_sqlite', 'export_snapshot',
+    'serve', 'serve_http'
 ]
 
+ARGUMENTS = ('book', 'name', 'author', 'quantity', 'user', 'offset', 'limit', 'query',
+             'distance', 'csv', 'catalogue',
+             'shards')
+
 parser = argparse.ArgumentParser()
 
-parser.add_argument('--o', type=str, required=True,
+parser.add_argument('--o', type=str,
                     help='The operation which you want to perform.',
                     choices=possible_operations, metavar=' | '.join(possible_operations))
 parser.add_argument('--book', type=str, help='Book code')
@@ -22,39 +46,283 @@ parser.add_argument('--name', type=str, help='Book name')
 parser.add_argument('--author', type=str, help='Book author')
 parser.add_argument('--quantity', type=int, help='Book quantity')
 parser.add_argument('--user', type=str, help='User code')
+parser.add_argument('--csv', type=str,
+                    help='CSV file with code, name, author, quantity columns for "import_books".')
+parser.add_argument('--catalogue', type=str,
+                    help='Catalogue dump in books.txt format for "reconcile_catalogue".')
+parser.add_argument('--query', type=str,
+                    help='Words of book name or author to search for, or the prefix to complete.')
+parser.add_argument('--distance', type=int, default=1,
+                    help=f'Maximum number of typos in the book code for "find_near_books", at '
+                         f'most {completion.MAX_DISTANCE}.')
+parser.add_argument('--offset', type=int, help='Number of books or users to skip.')
+parser.add_argument('--limit', type=int, help='Maximum number of books or users to return.')
+parser.add_argument('--jsonl', action='store_true',
+                    help='Print books or users as json lines, while they are read.')
+parser.add_argument('--backend', type=str, default='files', choices=['files', 'sqlite'],
+                    help='Storage backend: books.txt and users.json files or SQLite database.')
+parser.add_argument('--books-format', type=str, default='text',
+                    choices=['text', 'fixed', 'snapshot'],
+                    help='Books file format: " $$ " separated lines, fixed-width records or '
+                         'read-only binary snapshot, which is written by "export_snapshot".')
+parser.add_argument('--users-format', type=str, default='json', choices=['json', 'sharded'],
+                    help='Users file format: one users.json file or users split into shard files.')
+parser.add_argument('--shards', type=int,
+                    help=f'Number of shard files for "convert_users", by default '
+                         f'{sharded_users.DEFAULT_SHARDS}.')
+parser.add_argument('--wal', action='store_true',
+                    help='Append changes to the operation log instead of rewriting data files.')
+parser.add_argument('--socket', type=str, default='database/app.sock',
+                    help='Unix socket path, which is used by "serve" operation.')
+parser.add_argument('--host', type=str, default='127.0.0.1',
+                    help='Address, which is used by "serve_http" operation.')
+parser.add_argument('--port', type=int, default=8080,
+                    help='TCP port, which is used by "serve_http" operation.')
+parser.add_argument('--script', type=str,
+                    help='File with operations in json lines, which are executed in one process. '
+                         'Use "-" to read operations from stdin.')
+parser.add_argument('--flush-every', type=int, default=0,
+                    help='Write data files after every N operations of the script. By default '
+                         'they are written once at the end.')
+parser.add_argument('--profile', action='store_true',
+                    help='Print time, CPU time, read and written data, file opens and parsed lines '
+                         'of each operation and database function to stderr.')
+parser.add_argument('--profile-out', type=str,
+                    help='Write cProfile stats of the run to the file, they can be read by pstats.')
 
-if __name__ == '__main__':
-    args = parser.parse_args()
+
+def setup_stores(args: argparse.Namespace):
+    """Creates data files, if they do not exist, and chooses books and users stores."""
+    if args.backend == 'sqlite':
+        connection = sqlite_store.connect()
+        set_books_store(sqlite_store.SqliteBookStore(connection))
+        set_users_store(sqlite_store.SqliteUserStore(connection))
+    else:
+        _setup_file_stores(args)
+    transactions.recover()
+
+
+def _setup_file_stores(args: argparse.Namespace):
+    """
+    Creates data files, if they do not exist, and chooses file stores. Without --wal the logs of
+    previous --wal runs are folded into books.txt and users.json first.
+    """
     create_books_data()
     create_users_data()
+    if not args.wal:
+        wal.fold_logs()
+    if args.books_format == 'fixed':
+        fixed_width.create_books_data()
+        set_books_store(fixed_width.FixedWidthBookStore())
+    if args.books_format == 'snapshot':
+        set_books_store(binary_snapshot.BinaryBookStore())
+    if args.users_format == 'sharded':
+        sharded_users.create_users_data()
+        set_users_store(sharded_users.ShardedUserStore())
+    if args.wal:
+        set_books_store(wal.WalBookStore())
+        set_users_store(wal.WalUserStore())
+
 
+def _loan_count(user_code: str, book_code: str) -> int or None:
+    """Returns the number of copies of the book at the user or None, if there is no user."""
+    users_store = get_users_store()
+    users_store.refresh()
+    return users_store.loan_count(user_code, book_code)
+
+
+def execute(args: argparse.Namespace):
+    """
+    Performs the operation given in args.o and returns its result. Operations, which only change
+    data, return None.
+    """
+    with profiling.measure(f'app.{args.o}'):
+        return _execute(args)
+
+
+def _execute(args: argparse.Namespace):
     operation = args.o
-    if operation == 'get_all_books':
-        pprint(get_all_books())
+    # conversions drop filters of the data files they write, filters of other files stay valid
+    if operation == 'convert_books':
+        fixed_width.convert_to_fixed_width()
+        bloom.reset_filters(bloom.filter_path(fixed_width.BOOKS_FIXED))
+    elif operation == 'convert_users':
+        sharded_users.convert_to_sharded(shards=args.shards or sharded_users.DEFAULT_SHARDS)
+        bloom.reset_filters(bloom.filter_path(sharded_users.USERS_SHARDS))
+        get_users_store().reload()
+    elif operation == 'export_snapshot':
+        binary_snapshot.export_snapshot(iter_books())
+        bloom.reset_filters(bloom.filter_path(binary_snapshot.BOOKS_SNAPSHOT))
+    elif operation == 'convert_to_sqlite':
+        sqlite_store.convert_to_sqlite()
+        bloom.reset_filters(bloom.filter_path(sqlite_store.LIBRARY_DB, 'books'),
+                            bloom.filter_path(sqlite_store.LIBRARY_DB, 'users'))
+    elif operation == 'compact':
+        if not hasattr(get_books_store(), 'compact'):
+            raise ValueError('compact operation can be used only with --wal.')
+        get_books_store().compact()
+        get_users_store().compact()
+        print('Operation logs are compacted.')
+    elif operation == 'get_all_books':
+        if args.offset or args.limit is not None:
+            return list(iter_books(args.offset or 0, args.limit))
+        return get_all_books()
     elif operation == 'add_book':
         add_book(args.book, args.name, args.author, args.quantity)
     elif operation == 'find_book':
-        pprint(find_book(args.book))
+        return find_book(args.book)
+    elif operation == 'import_books':
+        return import_books(args.csv)
+    elif operation == 'reconcile_catalogue':
+        if type(get_books_store()) is not BookStore:
+            raise ValueError('reconcile_catalogue operation can be used only with books.txt file '
+                             'without --wal.')
+        return reconcile.reconcile_catalogue(args.catalogue)
+    elif operation == 'search_books':
+        return search_books(args.query or '')
+    elif operation == 'complete_books':
+        return completion.complete_books(args.query or '', args.limit or completion.DEFAULT_LIMIT)
+    elif operation == 'find_near_books':
+        distance = args.distance if args.distance is not None else 1
+        return completion.find_near_books(args.book, distance,
+                                          args.limit or completion.DEFAULT_LIMIT)
     elif operation == 'delete_book':
         delete_book(args.book)
     elif operation == 'get_all_users':
-        pprint(get_all_users())
+        if args.offset or args.limit is not None:
+            return dict(iter_users(args.offset or 0, args.limit))
+        return get_all_users()
     elif operation == 'add_user':
         add_user(args.user)
     elif operation == 'get_user_books':
-        pprint(get_user_books(args.user))
+        return get_user_books(args.user)
+    elif operation == 'get_book_holders':
+        return holders.get_book_holders(args.book)
     elif operation == 'delete_user':
         delete_user(args.user)
     elif operation == 'get_book_from_library':
-        if get_user_books(args.user) == 'user not in database':
+        if _loan_count(args.user, args.book) is None:
             raise ValueError(f'The user with code="{args.user}" is not in database. Please first '
                              f'call "add_user" operation.')
 
-        give_book_to_user(args.book)
-        get_book_from_library(args.user, args.book)
-    else:
-        if get_user_books(args.user) == 'user not in database':
+        with transactions.transaction(args.user, args.book):
+            give_book_to_user(args.book)
+            get_book_from_library(args.user, args.book)
+    elif operation == 'return_book_to_library':
+        if _loan_count(args.user, args.book) is None:
             raise ValueError(f'The user with code="{args.user}" is not in database')
 
-        return_book_to_library(args.user, args.book)
-        get_book_from_user(args.book)
+        with transactions.transaction(args.user, args.book):
+            return_book_to_library(args.user, args.book)
+            get_book_from_user(args.book)
+    else:
+        raise ValueError(f'Operation "{operation}" can not be executed here.')
+
+
+def stream(args: argparse.Namespace) -> Iterator[Dict]:
+    """Yields records of "get_all_books" or "get_all_users" operation one by one."""
+    if args.o == 'get_all_books':
+        return iter_books(args.offset or 0, args.limit)
+    return ({'user': code, 'books': books}
+            for code, books in iter_users(args.offset or 0, args.limit))
+
+
+class _ThreadOutput:
+    """
+    Replacement of sys.stdout, which sends everything printed by a thread, while it executes a
+    request, to the output of that request, other prints go to the replaced stdout. Unlike
+    `contextlib.redirect_stdout` it keeps outputs of threads apart, so requests can be executed
+    by several threads (see http_service.py).
+    """
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def _target(self):
+        return getattr(self.local, 'output', None) or self.stdout
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+
+
+@contextlib.contextmanager
+def _captured_stdout(output: io.StringIO):
+    """Context manager, which sends prints of the current thread to the given output."""
+    if not isinstance(sys.stdout, _ThreadOutput):
+        sys.stdout = _ThreadOutput(sys.stdout)
+    stdout = sys.stdout
+    stdout.local.output = output
+    try:
+        yield
+    finally:
+        stdout.local.output = None
+
+
+def handle_request(request: Dict) -> Dict:
+    """
+    Executes one operation given as a dict: {"o": operation, "book": ..., "user": ..., ...}.
+    Returns the dict with operation result, everything it printed and the error message, if any.
+    Errors of the request and of reading or writing data files are returned too, so one failed
+    request does not stop the server or the script, which execute it.
+    """
+    if not isinstance(request, dict):
+        return {'result': None, 'output': '', 'error': 'Request must be a json object.'}
+
+    args = argparse.Namespace(o=request.get('o'), **{key: request.get(key) for key in ARGUMENTS})
+    output = io.StringIO()
+    result, error = None, None
+    with _captured_stdout(output):
+        try:
+            result = execute(args)
+        except (ValueError, KeyError, TypeError, ConflictError, OSError, sqlite3.Error) as e:
+            error = str(e)
+    return {'result': result, 'output': output.getvalue(), 'error': error}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if not args.o and not args.script:
+        parser.error('the operation --o or --script is required.')
+    if args.wal and (args.books_format != 'text' or args.users_format == 'sharded'):
+        parser.error('--wal can be used only with text books and json users formats.')
+    if args.backend == 'sqlite' and (args.wal or args.books_format != 'text'
+                                     or args.users_format == 'sharded'):
+        parser.error('--wal, --books-format and --users-format are options of the files backend.')
+    if args.books_format == 'snapshot' and not os.path.exists(binary_snapshot.BOOKS_SNAPSHOT):
+        parser.error('there is no books snapshot yet, call "export_snapshot" operation first.')
+    if args.profile:
+        profiling.enable()
+    profiler = cProfile.Profile() if args.profile_out else None
+    if profiler:
+        profiler.enable()
+
+    try:
+        with profiling.measure('app.setup_stores'):
+            setup_stores(args)
+        if args.script:
+            from batch import run_script_file
+            run_script_file(args.script, args.flush_every)
+        elif args.o == 'serve':
+            from daemon import serve
+            serve(args.socket)
+        elif args.o == 'serve_http':
+            from http_service import serve as serve_http
+            serve_http(args.host, args.port)
+        elif args.jsonl and args.o in ('get_all_books', 'get_all_users'):
+            for record in stream(args):
+                print(json.dumps(record))
+        else:
+            result = execute(args)
+            if result is not None:
+                pprint(result)
+    finally:
+        if args.profile:
+            profiling.disable()
+            profiling.print_report(sys.stderr)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_out)
@@ -0,0 +1,66 @@
+"""
+Batch mode of the application: executes many operations in one process against the same loaded
+stores. Operations are read from the file (or stdin) with one json object per line, in the same
+form as the requests of the application process, for example:
+
+    {"o": "return_book_to_library", "user": "aaaaaa", "book": "a1254"}
+
+The result of each operation is printed as a json line. Data files are written once at the end of
+the script or after every `flush_every` operations; checkouts and returns of books are committed
+in the same groups (see database/transactions.py).
+"""
+import json
+import sys
+from typing import Iterable
+
+from app import handle_request
+from database import transactions
+from database.books import get_store as get_books_store
+from database.users import get_store as get_users_store
+
+
+def _run_operations(lines: Iterable[str], flush_every: int):
+    """Executes operations from the given json lines and prints their results."""
+    executed = 0
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            request = json.loads(line)
+        except ValueError:
+            response = {'result': None, 'output': '', 'error': 'Operation must be a json line.'}
+        else:
+            response = handle_request(request)
+            executed += 1
+
+        print(json.dumps({'line': line_number, **response}))
+        if flush_every and executed % flush_every == 0:
+            transactions.commit()
+
+
+def run_script(lines: Iterable[str], flush_every: int = 0):
+    """
+    Executes operations from the given json lines and prints their results. If flush_every is 0,
+    stores are written only at the end. Data files stay locked for other processes until the
+    script is finished.
+    """
+    books_store, users_store = get_books_store(), get_users_store()
+    with books_store.locked(), users_store.locked():
+        books_store.refresh()
+        users_store.refresh()
+        books_store.deferred = users_store.deferred = True
+        try:
+            with transactions.group():
+                _run_operations(lines, flush_every)
+        finally:
+            books_store.deferred = users_store.deferred = False
+
+
+def run_script_file(path: str, flush_every: int = 0):
+    """Executes operations from the given file, "-" means stdin."""
+    if path == '-':
+        run_script(sys.stdin, flush_every)
+    else:
+        with open(path, 'r') as in_file:
+            run_script(in_file, flush_every)
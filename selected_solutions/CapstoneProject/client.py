@@ -0,0 +1,36 @@
+"""
+Thin client for the application process started with `python app.py --o serve`. It accepts the
+same arguments as app.py, for example:
+
+    python client.py --o get_book_from_library --user "user_code" --book "book_code"
+"""
+import json
+import socket
+import sys
+from pprint import pprint
+from typing import Dict
+
+from app import ARGUMENTS, parser
+
+
+def send(request: Dict, socket_path: str) -> Dict:
+    """Sends one request to the application process and returns its response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        with client.makefile('rb') as in_file:
+            return json.loads(in_file.readline())
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.o == 'serve':
+        parser.error('serve operation can not be sent to the application process.')
+
+    response = send({key: getattr(args, key) for key in ('o',) + ARGUMENTS}, args.socket)
+
+    print(response['output'], end='')
+    if response['error']:
+        sys.exit(f'Error: {response["error"]}')
+    if response['result'] is not None:
+        pprint(response['result'])
@@ -0,0 +1,54 @@
+"""
+Long-lived application process. It keeps books and users stores in memory and executes operations
+received over the local Unix socket, so one operation costs one round trip instead of interpreter
+startup and reading all data files.
+
+The protocol is one json object per line in both directions. Request contains operation and its
+arguments, for example:
+
+    {"o": "get_book_from_library", "user": "aaaaaa", "book": "a1254"}
+
+Response contains the operation result, everything it printed and the error message, if any:
+
+    {"result": null, "output": "Book have been given to user.\\n...", "error": null}
+"""
+import json
+import os
+import signal
+import socketserver
+
+from app import handle_request
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Handles all requests of one client connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = handle_request(json.loads(line))
+            except ValueError:
+                response = {'result': None, 'output': '', 'error': 'Request must be a json line.'}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+def _interrupt(signum, frame):
+    """Signal handler, which stops the server in the same way as Ctrl+C does."""
+    raise KeyboardInterrupt
+
+
+def serve(socket_path: str):
+    """Serves requests on the given Unix socket until the process is interrupted or terminated."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        print(f'Serving on {socket_path}.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
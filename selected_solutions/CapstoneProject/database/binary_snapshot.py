@@ -0,0 +1,159 @@
+"""
+Read-only binary snapshot of books for processes, which only query the catalogue. The file is
+opened with mmap, so it is not parsed on start and all processes share its pages in the page cache.
+
+Layout of the file (all numbers are little-endian):
+
+    header:  magic b'BKS1' | number of books (uint32)
+    index:   codes of all books (5 bytes each), sorted
+    records: code (5) | name (100) | author (45) | quantity (uint32) | available quantity (uint32)
+
+Records are in the same order as codes of the index, so `find` is a binary search over the index
+and decoding of one record. Text fields are utf-8 padded with zero bytes.
+
+The snapshot is written by `export_snapshot` to a temporary file and replaces the old one
+atomically, so readers, which have mapped the old file, keep reading it until they refresh.
+"""
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List
+
+from database.books import Book
+
+BOOKS_SNAPSHOT = "database/books.snapshot"
+
+MAGIC = b'BKS1'
+HEADER = struct.Struct('<4sI')
+CODE_SIZE = 5
+RECORD = struct.Struct('<5s100s45sII')
+
+
+def _pack(book: Dict) -> bytes:
+    """Helper function which packs book data to the record."""
+    fields = []
+    for field, size in (('code', CODE_SIZE), ('name', 100), ('author', 45)):
+        encoded = book[field].encode()
+        if len(encoded) > size:
+            raise ValueError(f'Book {field} must fit into {size} bytes in binary snapshot.')
+        fields.append(encoded)
+    return RECORD.pack(*fields, book['quantity'], book['available_quantity'])
+
+
+def _unpack(record: bytes) -> Book:
+    """Helper function which unpacks the record to book."""
+    code, name, author, quantity, available_quantity = RECORD.unpack(record)
+    return Book(code.rstrip(b'\0').decode(), name.rstrip(b'\0').decode(),
+                author.rstrip(b'\0').decode(), quantity, available_quantity)
+
+
+class _Codes:
+    """Sorted codes of the index as a sequence, so they can be searched with bisect."""
+
+    def __init__(self, data: mmap.mmap, count: int):
+        self.data = data
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = HEADER.size + i * CODE_SIZE
+        return self.data[start:start + CODE_SIZE]
+
+
+class BinaryBookStore:
+    """
+    Read-only books store over the mapped binary snapshot. Methods, which change books, raise
+    ValueError.
+    """
+
+    def __init__(self, path: str = BOOKS_SNAPSHOT):
+        self.path = path
+        self.deferred = False
+        self.dirty = False
+        self.data = None
+        self.stat = None
+        self.generation = 0
+        self.reload()
+
+    def reload(self):
+        """Maps the snapshot file again."""
+        with open(self.path, 'rb') as in_file:
+            stat = os.fstat(in_file.fileno())
+            data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        magic, count = HEADER.unpack_from(data) if data else (MAGIC, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.path} is not a books snapshot.')
+
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data, self.stat = data, (stat.st_ino, stat.st_mtime_ns)
+        self.codes = _Codes(data, count)
+        self.records_offset = HEADER.size + count * CODE_SIZE
+        self.generation += 1
+
+    def refresh(self):
+        """Maps the snapshot again, if it has been replaced by the new export."""
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns) != self.stat:
+            self.reload()
+
+    def locked(self):
+        """The snapshot is not changed, so there is nothing to lock."""
+        return nullcontext()
+
+    def flush(self):
+        """The snapshot is not changed, so there is nothing to write."""
+
+    def sync(self):
+        """The snapshot is not changed, so there is nothing to sync."""
+
+    def _book(self, i: int) -> Book:
+        start = self.records_offset + i * RECORD.size
+        return _unpack(self.data[start:start + RECORD.size])
+
+    def find(self, code: str) -> Dict:
+        """Returns book data or an empty dict, if the book is not in the snapshot."""
+        key = code.encode().ljust(CODE_SIZE, b'\0') if isinstance(code, str) else b''
+        if len(key) != CODE_SIZE:
+            return {}
+        i = bisect_left(self.codes, key)
+        if i < len(self.codes) and self.codes[i] == key:
+            return self._book(i).to_dict()
+        return {}
+
+    def all(self) -> List[Dict]:
+        return list(self.iter())
+
+    def iter(self) -> Iterator[Dict]:
+        return (self._book(i).to_dict() for i in range(len(self.codes)))
+
+    def _read_only(self):
+        raise ValueError('Books snapshot is read-only, change books in the main database and '
+                         'export the snapshot again.')
+
+    def add(self, code: str, name: str, author: str, quantity: int):
+        self._read_only()
+
+    def delete(self, code: str):
+        self._read_only()
+
+    def change_available_quantity(self, code: str, change: int):
+        self._read_only()
+
+
+def export_snapshot(books: Iterable[Dict], path: str = BOOKS_SNAPSHOT):
+    """Writes given books to the binary snapshot, which replaces the old one atomically."""
+    records = sorted(_pack(book) for book in books)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as out_file:
+        out_file.write(HEADER.pack(MAGIC, len(records)))
+        out_file.writelines(record[:CODE_SIZE] for record in records)
+        out_file.writelines(records)
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(tmp_path, path)
+    print(f'{len(records)} books are exported to the binary snapshot.')
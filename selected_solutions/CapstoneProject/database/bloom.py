@@ -0,0 +1,183 @@
+"""
+Counting Bloom filters of book codes and user codes. A filter answers "the code is definitely not
+in the database" without loading the store, so lookups of mistyped codes in find_book and
+get_user_books do not read books or users at all. If the filter answers "maybe", the store is
+asked as usual. add_book and add_user load the store anyway to write the new code, there the
+filter only saves the lookup of the code in the store.
+
+The filter is an array of one-byte counters in the file, which is opened with mmap: a check reads
+HASHES bytes of it. Every code increases HASHES counters and its deletion decreases them back, a
+counter, which has reached 255, is never changed again. Codes are added to the filter before they
+are added to the store and removed after they are deleted from it, and added codes are synced to
+disk before `add` returns, so the filter never misses a code, which is in the store, even if the
+process or the system crashes in between. If the store fails to add codes, they are removed from
+the filter again, so failed and retried writes do not leave counters raised.
+
+Each data file has its own filter next to it, named after it: books.txt.bloom, books.dat.bloom,
+users_shards.bloom, and library.db.books.bloom for the table of the SQLite database. Runs with
+different store formats do not rebuild filters of each other, and the header of the file keeps
+the path of the data file, which the filter is built for. The filter is built again, when the
+number of codes grows bigger than its capacity. Conversions drop filters of the data files they
+write (see `reset_filters`); after editing data files by hand *.bloom files must be deleted.
+"""
+import hashlib
+import mmap
+import os
+import struct
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from database.locking import FileLock
+from database.store import replacing
+
+MAGIC = b'CBF1'
+HEADER = struct.Struct('<4sIII240s')
+COUNTERS_PER_CODE = 10
+HASHES = 7
+MIN_CAPACITY = 1024
+MAX_COUNTER = 255
+
+
+def _positions(code: str, size: int) -> List[int]:
+    """Returns positions of counters of the code, they are computed by double hashing."""
+    digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+    return [HEADER.size + (first + i * second) % size for i in range(HASHES)]
+
+
+class CountingBloomFilter:
+    """Counting Bloom filter of codes, which is kept in the file."""
+
+    def __init__(self, path: str, key: str, codes: Callable[[], Iterable[str]]):
+        self.path = path
+        self.key = key
+        self.codes = codes
+        self.lock = FileLock(path)
+        self.data = None
+        self.inode = None
+        self.size = 0
+        with self.lock.exclusive():
+            self._open()
+
+    def _header(self) -> Tuple[bytes, int, int, int, str]:
+        magic, size, capacity, count, key = HEADER.unpack_from(self.data)
+        return magic, size, capacity, count, key.rstrip(b'\0').decode()
+
+    def _open(self):
+        """Maps the filter file, it is built, if it is missing or is built for another store."""
+        if os.path.exists(self.path):
+            self._map()
+            magic, _, capacity, count, key = self._header()
+            if magic == MAGIC and key == self.key and count <= capacity:
+                return
+        self._build()
+
+    def _map(self):
+        if self.data is not None:
+            self.data.close()
+        with open(self.path, 'r+b') as in_file:
+            self.data = mmap.mmap(in_file.fileno(), 0)
+            self.inode = os.fstat(in_file.fileno()).st_ino
+        self.size = self._header()[1]
+
+    def _build(self, capacity: int = 0):
+        """Writes the new filter with all codes of the store, it must be called locked."""
+        codes = list(self.codes())
+        capacity = max(capacity, 2 * len(codes), MIN_CAPACITY)
+        size = capacity * COUNTERS_PER_CODE
+        counters = bytearray(HEADER.size + size)
+        HEADER.pack_into(counters, 0, MAGIC, size, capacity, len(codes), self.key.encode())
+        for code in codes:
+            for position in _positions(code, size):
+                counters[position] = min(counters[position] + 1, MAX_COUNTER)
+
+        with replacing(self.path, 'wb') as out_file:
+            out_file.write(counters)
+        self._map()
+
+    def _check_file(self):
+        """Maps the filter again, if it has been built again or deleted by another process."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self.inode:
+            with self.lock.exclusive():
+                self._open()
+
+    def might_contain(self, code: str) -> bool:
+        """Returns False, if the code is definitely not in the store."""
+        if not isinstance(code, str):
+            return False
+        self._check_file()
+        return all(self.data[position] for position in _positions(code, self.size))
+
+    def add(self, *codes: str):
+        """
+        Adds codes to the filter, it is called before they are added to the store, and if the store
+        fails to add them, they are removed again. If the filter gets more codes than its capacity,
+        it is built again with the double capacity. Changed counters are synced to disk, before the
+        store can write the codes.
+        """
+        with self.lock.exclusive():
+            self._check_file()
+            _, _, capacity, count, _ = self._header()
+            if count + len(codes) > capacity:
+                self._build(2 * capacity)
+
+            for code in codes:
+                for position in _positions(code, self.size):
+                    if self.data[position] < MAX_COUNTER:
+                        self.data[position] += 1
+            self._set_count(len(codes))
+            self.data.flush()
+
+    def remove(self, *codes: str):
+        """Removes codes from the filter, it is called after they are deleted from the store."""
+        with self.lock.exclusive():
+            self._check_file()
+            for code in codes:
+                for position in _positions(code, self.size):
+                    if 0 < self.data[position] < MAX_COUNTER:
+                        self.data[position] -= 1
+            self._set_count(-len(codes))
+
+    def _set_count(self, change: int):
+        magic, size, capacity, count, key = self._header()
+        HEADER.pack_into(self.data, 0, magic, size, capacity, max(count + change, 0), key.encode())
+
+
+_filters: Dict[str, CountingBloomFilter] = {}
+
+
+def filter_path(path: str, table: str = None) -> str:
+    """Returns the path of the filter of the data file or of the table of the database file."""
+    return f'{path}.{table}.bloom' if table else f'{path}.bloom'
+
+
+def store_filter_path(store) -> str:
+    """Returns the path of the filter of the store, SQLite stores have the table attribute."""
+    return filter_path(store.path, getattr(store, 'table', None))
+
+
+def get_filter(store, default: str, codes: Callable[[], Iterable[str]]) -> CountingBloomFilter:
+    """
+    Returns the filter of the store, `default` is the data file of the store, which is not created
+    yet. The codes function is called, when the filter has to be built.
+    """
+    if store is None:
+        key, path = default, filter_path(default)
+    else:
+        key, path = store.path, store_filter_path(store)
+    bloom_filter = _filters.get(path)
+    if bloom_filter is None:
+        bloom_filter = _filters[path] = CountingBloomFilter(path, key, codes)
+    return bloom_filter
+
+
+def reset_filters(*paths: str):
+    """Deletes filters, they are built again on the next use."""
+    for path in paths:
+        _filters.pop(path, None)
+        with FileLock(path).exclusive():
+            if os.path.exists(path):
+                os.remove(path)
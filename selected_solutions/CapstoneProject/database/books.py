@@ -1,9 +1,16 @@
+import csv
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List
+
+from database import bloom, completion, holders, profiling, search
+from database.locking import FileLock, optimistic
+from database.store import FileStore
 
 BOOKS = "database/books.txt"
 
 
+@profiling.instrumented
 def create_books_data():
     """
     Creates an empty txt file for storing books data. If the file already exists, it should
@@ -15,16 +22,45 @@ def create_books_data():
             pass
 
 
-def _parse_from_line(line: str) -> Dict:
+class Book:
+    """
+    Data of one book. It is used inside the database instead of dict, because with __slots__ it
+    takes 72 bytes instead of 184 bytes of a dict. Functions of this module still return books
+    as dicts.
+    """
+    __slots__ = ('code', 'name', 'author', 'quantity', 'available_quantity')
+
+    def __init__(self, code: str, name: str, author: str, quantity: int, available_quantity: int):
+        self.code = code
+        self.name = name
+        self.author = author
+        self.quantity = quantity
+        self.available_quantity = available_quantity
+
+    def __iter__(self):
+        return iter((self.code, self.name, self.author, self.quantity, self.available_quantity))
+
+    def __eq__(self, other):
+        return isinstance(other, Book) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f'Book{tuple(self)}'
+
+    def to_dict(self) -> Dict:
+        """Returns book data in the form of dict."""
+        return {
+            'code': self.code,
+            'name': self.name,
+            'author': self.author,
+            'quantity': self.quantity,
+            'available_quantity': self.available_quantity
+        }
+
+
+def _parse_from_line(line: str) -> Book:
     """Helper function which parses one line of books.txt"""
     [code, name, author, quantity, available_quantity] = line.split(" $$ ")
-    return {
-        'code': code,
-        'name': name,
-        'author': author,
-        'quantity': int(quantity),
-        'available_quantity': int(available_quantity.replace('\n', ''))
-    }
+    return Book(code, name, author, int(quantity), int(available_quantity.replace('\n', '')))
 
 
 def _parse_to_line(code: str,
@@ -38,12 +74,133 @@ def _parse_to_line(code: str,
     return " $$ ".join([code, name, author, str(quantity), str(available_quantity)]) + '\n'
 
 
+class BookStore(FileStore):
+    """
+    In-memory books storage. It reads books.txt only once and keeps books in the dict, where keys
+    are book codes and values are books data, so finding a book by its code costs O(1). Every
+    change is written back to the file. Parsed books are not cached (see parse_cache.py).
+    """
+
+    def __init__(self, path: str = BOOKS):
+        super().__init__(path)
+
+    @property
+    def books(self) -> Dict[str, Book]:
+        return self.data
+
+    def _load(self) -> Dict[str, Book]:
+        """Reads all books from the file into the dict: {code: book}."""
+        with open(self.path, 'r') as in_file:
+            books = {book.code: book for book in map(_parse_from_line, in_file)}
+        profiling.count_parses(len(books))
+        return books
+
+    def _dump(self, out_file):
+        """Writes all books, which are currently in the store, to the given file object."""
+        out_file.writelines(_parse_to_line(*book) for book in self.books.values())
+
+    def find(self, code: str) -> Dict:
+        """Returns book data or an empty dict, if the book is not in the store."""
+        book = self.books.get(code)
+        return book.to_dict() if book else {}
+
+    def all(self) -> List[Dict]:
+        """Returns the list of all books data."""
+        return [book.to_dict() for book in self.books.values()]
+
+    def iter(self) -> Iterator[Dict]:
+        """Yields books data one by one."""
+        return (book.to_dict() for book in self.books.values())
+
+    def add(self, code: str, name: str, author: str, quantity: int):
+        """Adds new book to the store, its available quantity is equal to quantity."""
+        book = Book(code, name, author, quantity, quantity)
+        self.books[code] = book
+        if self.deferred:
+            self.dirty = True
+            return
+
+        with self._writing(), open(self.path, mode='a') as in_file:
+            in_file.write(_parse_to_line(*book))
+
+    def delete(self, code: str):
+        """Deletes book from the store."""
+        del self.books[code]
+        self._changed()
+
+    def change_available_quantity(self, code: str, change: int):
+        """Changes book available_quantity by the given value."""
+        self.books[code].available_quantity += change
+        self._changed()
+
+
+_store = None
+
+
+def get_store() -> BookStore:
+    """Returns the books store. The store is created and loaded from BOOKS on the first call."""
+    global _store
+    if _store is None:
+        _store = BookStore(BOOKS)
+    return _store
+
+
+def set_store(store: BookStore or None):
+    """Replaces the books store, which is used by module functions. None resets it."""
+    global _store
+    _store = store
+
+
+def loaded_version() -> tuple:
+    """
+    Returns the key of books data loaded in this process: the store and its generation. It changes,
+    when the store is replaced or reads changes written by other processes.
+    """
+    store = get_store()
+    store.refresh()
+    return store, store.generation
+
+
+_optimistic = optimistic(get_store)
+
+
+def _filter() -> bloom.CountingBloomFilter:
+    """Returns the Bloom filter of book codes of the current store, without loading the store."""
+    return bloom.get_filter(_store, BOOKS, lambda: (book['code'] for book in iter_books()))
+
+
+@profiling.instrumented
+@_optimistic
 def get_all_books() -> List[Dict]:
     """Returns all books data in a list, where each item in a list is one book."""
-    with open(BOOKS, 'r') as in_file:
-        return [_parse_from_line(line) for line in in_file]
+    return get_store().all()
+
+
+@profiling.instrumented
+def _iter_file(path: str) -> Iterator[Dict]:
+    """Reads books one by one from the file, without keeping them in memory."""
+    with FileLock(path).shared(), open(path, 'r') as in_file:
+        for line in in_file:
+            profiling.count_parses()
+            yield _parse_from_line(line).to_dict()
+
+
+@profiling.instrumented
+def iter_books(offset: int = 0, limit: int = None) -> Iterator[Dict]:
+    """
+    Yields books data one by one: skips first `offset` books and stops after `limit` books. If the
+    books store is not loaded yet, books are read directly from the file as they are parsed, so
+    memory usage does not depend on the number of books.
+    """
+    if _store is None:
+        books = _iter_file(BOOKS)
+    else:
+        _store.refresh()
+        books = _store.iter()
+    return islice(books, offset, None if limit is None else offset + limit)
 
 
+@profiling.instrumented
 def find_book(code: str) -> Dict:
     """
     Finds book by its code in library and returns it's data in the form of dict. If the book is not
@@ -57,16 +214,23 @@ def find_book(code: str) -> Dict:
         'quantity': 4,
         'available_quantity': 2
     }
+
+    Codes, which are definitely not in the library, are answered by the Bloom filter without
+    reading books.
     """
-    for book in get_all_books():
-        if book['code'] == code:
-            return book
-    return {}
+    if not _filter().might_contain(code):
+        return {}
+    return _find_book(code)
 
 
-def add_book(code: str, name: str, author: str, quantity: int):
-    """Adds given book to the database, which is a txt file, where each row is book."""
+@profiling.instrumented
+@_optimistic
+def _find_book(code: str) -> Dict:
+    return get_store().find(code)
+
 
+def _validate_book(code: str, name: str, author: str, quantity: int):
+    """Checks constraints on book data and raises an error, if any of them is not met."""
     if not code or not isinstance(code, str) or len(code) != 5:
         raise ValueError('Book code must be a string with length 5.')
 
@@ -88,14 +252,89 @@ def add_book(code: str, name: str, author: str, quantity: int):
     if not quantity or not isinstance(quantity, int) or quantity <= 0:
         raise ValueError('Book quantity must be positive integer.')
 
+
+@profiling.instrumented
+@_optimistic
+def add_book(code: str, name: str, author: str, quantity: int):
+    """Adds given book to the database, which is a txt file, where each row is book."""
+    _validate_book(code, name, author, quantity)
+
     if find_book(code):
         raise ValueError('Book already in library.')
 
-    with open(BOOKS, mode='a') as in_file:
-        in_file.write(_parse_to_line(code, name, author, quantity, quantity))
+    _filter().add(code)
+    try:
+        get_store().add(code, name, author, quantity)
+    except BaseException:
+        _filter().remove(code)
+        raise
+    search.book_added(code, name, author)
+    completion.book_added(code, name)
     print('Book is added.')
 
 
+@profiling.instrumented
+@_optimistic
+def import_books(csv_path: str) -> Dict:
+    """
+    Adds books from the csv file with columns: code, name, author, quantity (the header line with
+    these names is optional). Every row is checked with the same rules as in add_book, rows with
+    invalid data or codes, which are already in the library or in the previous rows, are rejected.
+    Accepted books are written to the database all together.
+
+    Returns the number of imported books and the list of rejected rows with line numbers and error
+    messages.
+    """
+    store = get_store()
+    accepted, rejected, codes = [], [], {}
+
+    with open(csv_path, 'r', newline='') as in_file:
+        for line_number, row in enumerate(csv.reader(in_file), start=1):
+            profiling.count_parses()
+            if line_number == 1 and row == ['code', 'name', 'author', 'quantity']:
+                continue
+
+            try:
+                if len(row) != 4:
+                    raise ValueError('Row must contain code, name, author and quantity.')
+                code, name, author, quantity = row
+                quantity = int(quantity) if quantity.strip().isdigit() else None
+                _validate_book(code, name, author, quantity)
+                if code in codes:
+                    raise ValueError(f'Duplicate code in CSV (row {codes[code]}).')
+                if find_book(code):
+                    raise ValueError('Book already in library.')
+            except ValueError as e:
+                rejected.append({'line': line_number, 'error': str(e)})
+                continue
+
+            codes[code] = line_number
+            accepted.append((code, name, author, quantity))
+
+    _filter().add(*codes)
+    deferred = store.deferred
+    try:
+        with store.locked():
+            store.deferred = True
+            try:
+                for book in accepted:
+                    store.add(*book)
+            finally:
+                store.deferred = deferred
+            if not deferred:
+                store.flush()
+    except BaseException:
+        _filter().remove(*codes)
+        raise
+
+    search.books_added([(code, name, author) for code, name, author, _ in accepted])
+    completion.set_index(None)
+    print(f'{len(accepted)} books are imported, {len(rejected)} rows are rejected.')
+    return {'imported': len(accepted), 'rejected': rejected}
+
+
+@profiling.instrumented
+@_optimistic
 def delete_book(code: str):
     """Deletes book from database."""
     book_data = find_book(code)
@@ -103,14 +342,13 @@ def delete_book(code: str):
     if not book_data:
         raise ValueError(f'The book with code="{code}" is not in library.')
 
-    if book_data['quantity'] != book_data['available_quantity']:
+    if book_data['quantity'] != book_data['available_quantity'] or holders.get_book_holders(code):
         raise ValueError('There are users, who have not returned books.')
 
-    with open(BOOKS, 'r') as in_file:
-        books = [line for line in in_file if line[:5] != code]
-
-    with open(BOOKS, 'w') as in_file:
-        in_file.writelines(books)
+    get_store().delete(code)
+    _filter().remove(code)
+    search.book_deleted(code, book_data['name'], book_data['author'])
+    completion.book_deleted(code, book_data['name'])
     print('Book is deleted.')
 
 
@@ -119,20 +357,11 @@ def _interact_with_user(code: str, increase: bool):
     Helper function for interacting with user. It increases or decreases available_quantity by 1.
     """
     change = +1 if increase else -1
-
-    books = []
-    with open(BOOKS, 'r') as in_file:
-        for line in in_file:
-            if line[:5] == code:
-                line_data = _parse_from_line(line)
-                line_data['available_quantity'] += change
-                line = _parse_to_line(*list(line_data.values()))
-            books.append(line)
-
-    with open(BOOKS, 'w') as in_file:
-        in_file.writelines(books)
+    get_store().change_available_quantity(code, change)
 
 
+@profiling.instrumented
+@_optimistic
 def give_book_to_user(code: str):
     """
     Gives book to user from library: decreases book available_quantity by 1.
@@ -149,6 +378,8 @@ def give_book_to_user(code: str):
         print('Book have been given to user.')
 
 
+@profiling.instrumented
+@_optimistic
 def get_book_from_user(code: str):
     """
     Gets book from user back to library: increases book available_quantity by 1.
@@ -0,0 +1,162 @@
+"""
+Prefix completion of book codes and names and search of mistyped codes.
+
+Codes and names are kept in sorted lists, so all values with the given prefix are found by binary
+search of the first one and reading the next ones.
+
+Codes are short and have the fixed length 5, so near codes are found by generating all strings
+within the given edit distance from the typed code and looking them up in the set of codes: for one
+edit it is a few hundred set lookups, no matter how many books there are. (A BK-tree does not help
+here: distances between 5-character codes take only values 1..5, so the tree is so wide that a
+search visits a big part of it.) The number of candidates grows exponentially with the distance:
+on 200k books distance 2 takes tens of milliseconds and distance 3 takes seconds, so the distance
+is limited by MAX_DISTANCE.
+
+The index is built in memory from books on the first use and is updated by add_book and
+delete_book, so it pays off in long-lived processes (serve mode). It is built again, when the books
+store reads changes of other processes.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, Iterator, List, Set
+
+DEFAULT_LIMIT = 10
+CODE_LENGTH = 5
+MAX_DISTANCE = 2
+
+
+def _edits(word: str, alphabet: str) -> Iterator[str]:
+    """Yields all strings, which differ from the word by one deletion, substitution or insertion."""
+    for i in range(len(word) + 1):
+        head, tail = word[:i], word[i:]
+        if tail:
+            yield head + tail[1:]
+            for char in alphabet:
+                if char != tail[0]:
+                    yield head + char + tail[1:]
+        for char in alphabet:
+            yield head + char + tail
+
+
+def near_words(word: str, words: Set[str], alphabet: str, length: int,
+               max_distance: int) -> List[str]:
+    """
+    Returns words of the given length from the set, which differ from the word by at most
+    max_distance edits, ordered by the distance. Candidates are generated by edits of the word,
+    the ones which can not get the needed length with remaining edits are dropped.
+    """
+    found = {word: 0} if word in words else {}
+    level = {word}
+    for distance in range(1, max_distance + 1):
+        remaining = max_distance - distance
+        level = {candidate for previous in level for candidate in _edits(previous, alphabet)
+                 if abs(len(candidate) - length) <= remaining}
+        for candidate in level:
+            if candidate in words and candidate not in found:
+                found[candidate] = distance
+    return sorted(found, key=lambda candidate: (found[candidate], candidate))
+
+
+class CompletionIndex:
+    """Sorted codes, sorted names and the set of codes of all books."""
+
+    def __init__(self, books: Iterable[Dict] = ()):
+        self.codes = []
+        self.names = []
+        for book in books:
+            self.codes.append(book['code'])
+            self.names.append((book['name'].lower(), book['code']))
+        self.codes.sort()
+        self.names.sort()
+        self.code_set = set(self.codes)
+        self.alphabet = ''.join(sorted(set(''.join(self.codes))))
+
+    def add(self, code: str, name: str):
+        insort(self.codes, code)
+        insort(self.names, (name.lower(), code))
+        self.code_set.add(code)
+        self.alphabet += ''.join(sorted(set(code) - set(self.alphabet)))
+
+    def delete(self, code: str, name: str):
+        for values, value in ((self.codes, code), (self.names, (name.lower(), code))):
+            i = bisect_left(values, value)
+            if i < len(values) and values[i] == value:
+                del values[i]
+        self.code_set.discard(code)
+
+    def complete(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[str]:
+        """
+        Returns codes of books, which codes or names start with the prefix (case insensitive for
+        names): books with matching codes go first, then books with matching names.
+        """
+        found = []
+        i = bisect_left(self.codes, prefix)
+        while i < len(self.codes) and self.codes[i].startswith(prefix) and len(found) < limit:
+            found.append(self.codes[i])
+            i += 1
+
+        prefix = prefix.lower()
+        i = bisect_left(self.names, (prefix, ''))
+        while i < len(self.names) and self.names[i][0].startswith(prefix) and len(found) < limit:
+            if self.names[i][1] not in found:
+                found.append(self.names[i][1])
+            i += 1
+        return found
+
+    def near_codes(self, code: str, max_distance: int = 1, limit: int = DEFAULT_LIMIT) -> List[str]:
+        """Returns codes, which differ from the given one by at most max_distance edits."""
+        return near_words(code, self.code_set, self.alphabet, CODE_LENGTH, max_distance)[:limit]
+
+
+_index = None
+_version = None
+
+
+def get_index() -> CompletionIndex:
+    """
+    Returns the completion index, it is built from all books on the first call and when books have
+    been changed by other processes.
+    """
+    global _index, _version
+    from database.books import iter_books, loaded_version
+    version = loaded_version()
+    if _index is None or version != _version:
+        _index = CompletionIndex(iter_books())
+        _version = version
+    return _index
+
+
+def set_index(index: CompletionIndex or None):
+    """Replaces the completion index. None resets it, so it is built again on the next call."""
+    global _index, _version
+    from database.books import loaded_version
+    _index = index
+    _version = loaded_version() if index is not None else None
+
+
+def book_added(code: str, name: str):
+    """Adds the book to the index, if it is built. It is called by add_book."""
+    if _index is not None:
+        _index.add(code, name)
+
+
+def book_deleted(code: str, name: str):
+    """Removes the book from the index, if it is built. It is called by delete_book."""
+    if _index is not None:
+        _index.delete(code, name)
+
+
+def complete_books(prefix: str, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """Returns data of books, which codes or names start with the prefix."""
+    from database.books import find_book
+    return [book for book in map(find_book, get_index().complete(prefix, limit)) if book]
+
+
+def find_near_books(code: str, max_distance: int = 1, limit: int = DEFAULT_LIMIT) -> List[Dict]:
+    """Returns data of books, which codes differ from the given code by at most max_distance."""
+    from database.books import find_book
+    if not isinstance(code, str) or not code:
+        raise ValueError('Book code must be a non-empty string.')
+    if type(max_distance) is not int or not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f'Distance must be integer from 0 to {MAX_DISTANCE}.')
+    found = get_index().near_codes(code, max_distance, limit)
+    return [book for book in map(find_book, found) if book]
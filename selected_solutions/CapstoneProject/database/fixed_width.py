@@ -0,0 +1,165 @@
+"""
+Alternative layout of books file, where each book is stored as a fixed-width record:
+
+    code (5) | name (100) | author (45) | quantity (10) | available quantity (10) | '\n'
+
+Text fields are padded with spaces, numbers are right aligned. As every record has the same size,
+the position of book in the file is known from its index, so giving book to user or getting it back
+is one `seek` and one write of the available quantity field, instead of rewriting all the file.
+Values, which do not fit into their fields, are rejected with ValueError, so they never shift the
+following fields and records.
+"""
+import os
+from pathlib import Path
+from typing import Dict
+
+from database import profiling
+from database.books import BOOKS, Book, BookStore, _parse_from_line
+
+BOOKS_FIXED = "database/books.dat"
+
+CODE_WIDTH = 5
+NAME_WIDTH = 100
+AUTHOR_WIDTH = 45
+QUANTITY_WIDTH = 10
+
+AVAILABLE_OFFSET = CODE_WIDTH + NAME_WIDTH + AUTHOR_WIDTH + QUANTITY_WIDTH
+RECORD_SIZE = AVAILABLE_OFFSET + QUANTITY_WIDTH + 1
+
+
+def create_books_data():
+    """
+    Creates an empty file for storing books data in fixed-width records. If the file already
+    exists, it should not do anything.
+    """
+    p = Path(BOOKS_FIXED)
+    if not p.exists():
+        with open(BOOKS_FIXED, 'wb'):
+            pass
+
+
+def _encode_field(value: str, width: int, field: str) -> bytes:
+    """Helper function which encodes text field and pads it to the given width."""
+    encoded = value.encode()
+    if len(encoded) > width:
+        raise ValueError(f'Book {field} must fit into {width} bytes in fixed-width format.')
+    return encoded.ljust(width)
+
+
+def _encode_number(value: int, width: int, field: str) -> bytes:
+    """Helper function which encodes number field and pads it to the given width."""
+    encoded = str(value).encode()
+    if len(encoded) > width:
+        raise ValueError(f'Book {field} must fit into {width} digits in fixed-width format.')
+    return encoded.rjust(width)
+
+
+def _parse_from_record(record: bytes) -> Book:
+    """Helper function which parses one fixed-width record."""
+    name_end = CODE_WIDTH + NAME_WIDTH
+    author_end = name_end + AUTHOR_WIDTH
+    return Book(record[:CODE_WIDTH].decode(),
+                record[CODE_WIDTH:name_end].decode().rstrip(),
+                record[name_end:author_end].decode().rstrip(),
+                int(record[author_end:AVAILABLE_OFFSET]),
+                int(record[AVAILABLE_OFFSET:RECORD_SIZE - 1]))
+
+
+def _parse_to_record(code: str,
+                     name: str,
+                     author: str,
+                     quantity: int,
+                     available_quantity: int) -> bytes:
+    """Helper function which parses given book data to the fixed-width record."""
+    return b''.join([
+        _encode_field(code, CODE_WIDTH, 'code'),
+        _encode_field(name, NAME_WIDTH, 'name'),
+        _encode_field(author, AUTHOR_WIDTH, 'author'),
+        _encode_number(quantity, QUANTITY_WIDTH, 'quantity'),
+        _encode_number(available_quantity, QUANTITY_WIDTH, 'available quantity'),
+        b'\n'
+    ])
+
+
+class FixedWidthBookStore(BookStore):
+    """
+    Books store backed by the file with fixed-width records. It remembers the position of each
+    book record in the file, so changes of one book touch only its record. Codes of changed books
+    are collected in `changed` set and their records are written in place by `_save`, so if saving
+    is deferred, flush writes only the records changed since the last one, not the whole file.
+    Parsed data is not cached, because positions of records are filled only while the file is
+    parsed.
+    """
+    cache_parsed = False
+
+    def __init__(self, path: str = BOOKS_FIXED):
+        self.codes = []
+        self.positions = {}
+        self.changed = set()
+        super().__init__(path)
+
+    def _load(self) -> Dict[str, Book]:
+        books = {}
+        self.codes = []
+        self.positions = {}
+        self.changed = set()
+        with open(self.path, 'rb') as in_file:
+            for i, record in enumerate(iter(lambda: in_file.read(RECORD_SIZE), b'')):
+                book = _parse_from_record(record)
+                books[book.code] = book
+                self.codes.append(book.code)
+                self.positions[book.code] = i
+        profiling.count_parses(len(books))
+        return books
+
+    def _save(self):
+        """Writes records of changed books in place and cuts off records of deleted ones."""
+        with self._writing(), open(self.path, 'r+b') as out_file:
+            for position in sorted(self.positions[code] for code in self.changed):
+                out_file.seek(position * RECORD_SIZE)
+                out_file.write(_parse_to_record(*self.books[self.codes[position]]))
+            out_file.truncate(len(self.codes) * RECORD_SIZE)
+        self.changed = set()
+
+    def add(self, code: str, name: str, author: str, quantity: int):
+        record = _parse_to_record(code, name, author, quantity, quantity)
+        self.books[code] = _parse_from_record(record)
+        self.positions[code] = len(self.codes)
+        self.codes.append(code)
+        self.changed.add(code)
+        self._changed()
+
+    def delete(self, code: str):
+        """
+        Deletes book from the store: the last record of the file is moved to the place of deleted
+        one and the file is truncated by one record.
+        """
+        position = self.positions.pop(code)
+        del self.books[code]
+        self.changed.discard(code)
+        last_code = self.codes.pop()
+        if last_code != code:
+            self.codes[position] = last_code
+            self.positions[last_code] = position
+            self.changed.add(last_code)
+        self._changed()
+
+    def change_available_quantity(self, code: str, change: int):
+        book = self.books[code]
+        _encode_number(book.available_quantity + change, QUANTITY_WIDTH, 'available quantity')
+        book.available_quantity += change
+        self.changed.add(code)
+        self._changed()
+
+
+def convert_to_fixed_width(source: str = BOOKS, target: str = BOOKS_FIXED):
+    """
+    Converts books file from " $$ " separated lines to the fixed-width records. The target file is
+    written next to the source one and replaces it only when all books are converted.
+    """
+    tmp_target = target + '.tmp'
+    with open(source, 'r') as in_file, open(tmp_target, 'wb') as out_file:
+        for line in in_file:
+            out_file.write(_parse_to_record(*_parse_from_line(line)))
+    os.replace(tmp_target, target)
+    print('Books are converted to fixed-width format.')
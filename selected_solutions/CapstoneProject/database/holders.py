@@ -0,0 +1,169 @@
+"""
+Reverse index of loans: {book_code: {user_code: count}}, so users, who hold the book, are found
+without reading books of all users.
+
+The index is kept in holders.index next to users.json . Giving book to user and getting it back do
+not rewrite it: the new number of copies of the book at the user is appended to holders.index.log
+and the log is folded into holders.index from time to time. Inside transactions it is appended
+only when the transaction is committed, from its journal record, after the journal is synced: so
+a transaction, which is rolled back or lost in a crash, does not leave its loan in the index, and
+a committed one is applied again by the recovery of the journal. Log records contain final
+values, so applying them twice is safe.
+
+Other processes append to the same log, so before answering a query the index reads log records
+written after its last read. If the index file has been replaced by compaction, it is loaded again.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+from database.locking import FileLock
+
+INDEX = "database/holders.index"
+COMPACT_THRESHOLD = 10000
+
+
+class HoldersIndex:
+    """Index {book_code: {user_code: count}}, persisted in the file with its log."""
+
+    def __init__(self, path: str = INDEX):
+        self.path = path
+        self.log_path = path + '.log'
+        self.lock = FileLock(path)
+        self.holders: Dict[str, Dict[str, int]] = {}
+        self.log_size = 0
+        self.log_offset = 0
+        self.index_stat = None
+
+    def _apply(self, book_code: str, user_code: str, count: int):
+        users = self.holders.setdefault(book_code, {})
+        if count:
+            users[user_code] = count
+        else:
+            users.pop(user_code, None)
+            if not users:
+                del self.holders[book_code]
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_log(self):
+        """Applies log records, which are written after the last read, it must be called locked."""
+        if not os.path.exists(self.log_path):
+            return
+
+        with open(self.log_path, 'r') as in_file:
+            in_file.seek(self.log_offset)
+            for line in iter(in_file.readline, ''):
+                try:
+                    self._apply(*json.loads(line))
+                except ValueError:
+                    break
+                self.log_size += 1
+                self.log_offset = in_file.tell()
+
+    def load(self, users: Iterable[Tuple[str, List[str]]]) -> 'HoldersIndex':
+        """
+        Loads the index from its file and log. If there is no index file yet, the index is built
+        from the given users and saved.
+        """
+        with self.lock.exclusive():
+            self.holders = {}
+            if not os.path.exists(self.path):
+                for user_code, books in users:
+                    for book_code in books:
+                        users_of_book = self.holders.setdefault(book_code, {})
+                        users_of_book[user_code] = users_of_book.get(user_code, 0) + 1
+                self._save()
+                return self
+
+            with open(self.path, 'r') as in_file:
+                self.holders = json.load(in_file)
+            self.index_stat = self._stat()
+            self.log_size = self.log_offset = 0
+            self._read_log()
+        return self
+
+    def _save(self):
+        """Writes the index file and clears the log, it must be called locked."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as out_file:
+            json.dump(self.holders, out_file, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        with open(self.log_path, 'w'):
+            pass
+        self.index_stat = self._stat()
+        self.log_size = self.log_offset = 0
+
+    def refresh(self):
+        """Reads changes, which are done by other processes."""
+        with self.lock.shared():
+            if self._stat() == self.index_stat:
+                self._read_log()
+                return
+        self.load(())
+
+    def update(self, changes: Iterable[Tuple[str, str, int]]):
+        """
+        Sets numbers of copies of books at users: (book_code, user_code, count), and appends them
+        to the log.
+        """
+        changes = list(changes)
+        with self.lock.exclusive():
+            if self._stat() != self.index_stat:
+                self.load(())
+            self._read_log()
+            for change in changes:
+                self._apply(*change)
+            with open(self.log_path, 'a') as out_file:
+                out_file.writelines(json.dumps(change) + '\n' for change in changes)
+                self.log_offset = out_file.tell()
+            self.log_size += len(changes)
+            if self.log_size >= COMPACT_THRESHOLD:
+                self._save()
+
+    def holders_of(self, book_code: str) -> Dict[str, int]:
+        """Returns the copy of {user_code: count} of the book."""
+        return dict(self.holders.get(book_code, {}))
+
+
+_index = None
+
+
+def get_index() -> HoldersIndex:
+    """Returns the holders index, it is loaded from INDEX on the first call."""
+    global _index
+    if _index is None:
+        from database.users import iter_users
+        _index = HoldersIndex(INDEX).load(iter_users())
+    return _index
+
+
+def set_index(index: HoldersIndex or None):
+    """Replaces the holders index. None resets it, so it is loaded again on the next call."""
+    global _index
+    _index = index
+
+
+def loan_changed(user_code: str, book_code: str, count: int):
+    """
+    Sets the number of copies of the book at the user, it is called by get_book_from_library and
+    return_book_to_library, when they are not a part of a transaction.
+    """
+    get_index().update([(book_code, user_code, count)])
+
+
+def loans_changed(records: Iterable[Dict]):
+    """
+    Sets numbers of copies of books at users from records of the transactions journal, it is
+    called, when transactions are committed or recovered.
+    """
+    get_index().update((record['book'], record['user'], record['count']) for record in records)
+
+
+def get_book_holders(book_code: str) -> Dict[str, int]:
+    """Returns users, who hold the book, with numbers of their copies: {user_code: count}."""
+    index = get_index()
+    index.refresh()
+    return index.holders_of(book_code)
@@ -0,0 +1,107 @@
+"""
+Safe access to data files from many processes. Each data file has a lock file next to it (for
+example books.txt.lock), which is locked with `fcntl.flock`: shared lock for reading the data file
+and exclusive lock for writing it. The lock file also stores the version of the data file, which
+is increased by every write.
+
+A store remembers the version of data it has loaded. Before writing, under the exclusive lock, it
+checks that the version in the lock file is still the same; if another process has written the file
+in between, ConflictError is raised. Functions wrapped with `optimistic` then reload the store and
+run again, so their checks (for example available quantity) are done against the fresh data.
+
+On systems without fcntl (Windows) locks do nothing, but versions are still checked.
+"""
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAX_RETRIES = 20
+
+
+class ConflictError(Exception):
+    """Raised when data file was changed by another process after the store had loaded it."""
+
+
+class FileLock:
+    """
+    Reader/writer lock of the data file, which also keeps its version. The lock is reentrant in
+    the same thread: nested locks only count depth, and a shared lock inside an exclusive one
+    keeps the exclusive lock. Other threads of the process wait, until the thread, which holds
+    the lock, releases it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path + '.lock'
+        self.depth = 0
+        self.file = None
+        self.thread_lock = threading.RLock()
+
+    @contextmanager
+    def _locked(self, operation: int):
+        with self.thread_lock:
+            if self.depth == 0:
+                self.file = open(self.path, 'a+')
+                if fcntl:
+                    fcntl.flock(self.file.fileno(), operation)
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.file.close()
+                    self.file = None
+
+    def shared(self):
+        """Context manager of the shared lock, which is used for reading."""
+        return self._locked(fcntl.LOCK_SH if fcntl else 0)
+
+    def exclusive(self):
+        """Context manager of the exclusive lock, which is used for writing."""
+        return self._locked(fcntl.LOCK_EX if fcntl else 0)
+
+    def read_version(self) -> int:
+        """Returns the version of data file, it must be called under the lock."""
+        self.file.seek(0)
+        content = self.file.read()
+        return int(content) if content else 0
+
+    def write_version(self, version: int):
+        """Stores the version of data file, it must be called under the exclusive lock."""
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(version))
+        self.file.flush()
+
+
+def optimistic(get_store: Callable) -> Callable:
+    """
+    Decorator factory for functions, which read or change the store returned by get_store. Before
+    each call the store is refreshed from disk, if another process has changed it. If the function
+    fails with ConflictError, the store is reloaded and the function is called again.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            for attempt in range(MAX_RETRIES):
+                store = get_store()
+                store.refresh()
+                try:
+                    return function(*args, **kwargs)
+                except ConflictError:
+                    store.reload()
+                    time.sleep(random.uniform(0, 0.001 * 2 ** min(attempt, 6)))
+            raise ConflictError(f'Could not write {store.path}: it is changed by other processes.')
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,200 @@
+"""
+Instrumentation of operations. When profiling is enabled, each measured call records its wall
+time, CPU time, bytes read and written, the number of opened files and the number of parsed
+lines, and the paths of opened files are counted:
+
+    profiling.enable()
+    with profiling.measure('find_book'):
+        ...
+    profiling.print_report()
+
+Functions are measured with the `instrumented` decorator. Numbers of a call include the numbers
+of all calls made inside it. Files are counted by replacing the builtin `open` while profiling is
+enabled, so reads of mapped files and of the SQLite database are not counted, and reads and
+writes of text files are counted in characters. Parsed lines are lines of books files, records
+of users files and of operation logs, which are reported by the stores with `count_parses`.
+
+When profiling is disabled, `measure` and `instrumented` functions only check the flag.
+"""
+import builtins
+import inspect
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterator, TextIO
+
+COLUMNS = ('calls', 'wall_ms', 'cpu_ms', 'read', 'written', 'opens', 'parses')
+
+_enabled = False
+_builtin_open = builtins.open
+_counters = {'read': 0, 'written': 0, 'opens': 0, 'parses': 0}
+_opened_paths = Counter()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+class _CountingFile:
+    """Wrapper of the file object, which counts read and written data."""
+
+    def __init__(self, file):
+        self._file = file
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._file.__exit__(*exc_info)
+
+    def __iter__(self):
+        for line in self._file:
+            _counters['read'] += len(line)
+            yield line
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        _counters['read'] += len(data)
+        return data
+
+    def readline(self, *args):
+        line = self._file.readline(*args)
+        _counters['read'] += len(line)
+        return line
+
+    def readinto(self, buffer) -> int:
+        size = self._file.readinto(buffer)
+        _counters['read'] += size or 0
+        return size
+
+    def write(self, data) -> int:
+        _counters['written'] += len(data)
+        return self._file.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def _open(file, *args, **kwargs):
+    """Replacement of the builtin open, which counts opened files."""
+    _counters['opens'] += 1
+    _opened_paths[str(file)] += 1
+    return _CountingFile(_builtin_open(file, *args, **kwargs))
+
+
+def enable():
+    """Starts recording of measured calls and counting of files."""
+    global _enabled
+    _enabled = True
+    builtins.open = _open
+
+
+def disable():
+    """Stops recording, recorded numbers are kept."""
+    global _enabled
+    _enabled = False
+    builtins.open = _builtin_open
+
+
+def reset():
+    """Drops all recorded numbers."""
+    for name in _counters:
+        _counters[name] = 0
+    _opened_paths.clear()
+    _stats.clear()
+
+
+def count_parses(count: int = 1):
+    """Stores call it with the number of lines or records, which they have parsed."""
+    _counters['parses'] += count
+
+
+def _snapshot() -> Dict[str, float]:
+    return {'wall_ms': time.perf_counter() * 1000, 'cpu_ms': time.process_time() * 1000,
+            **_counters}
+
+
+@contextmanager
+def measure(name: str, calls: int = 1):
+    """Context manager, which adds numbers of its body to the stats of the name."""
+    if not _enabled:
+        yield
+        return
+
+    start = _snapshot()
+    try:
+        yield
+    finally:
+        end = _snapshot()
+        stats = _stats.setdefault(name, dict.fromkeys(COLUMNS, 0))
+        stats['calls'] += calls
+        for column in COLUMNS[1:]:
+            stats[column] += end[column] - start[column]
+
+
+def _iterate(name: str, iterator: Iterator) -> Iterator:
+    """Yields items of the iterator, each step of it is measured, but it is counted as one call."""
+    calls = 1
+    while True:
+        with measure(name, calls):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        calls = 0
+        yield item
+
+
+def instrumented(function: Callable) -> Callable:
+    """
+    Decorator, which measures calls of the function under the name "module.function". Steps of
+    generator functions are measured separately, so the time of the code, which consumes the
+    generator, is not included.
+    """
+    name = f'{function.__module__.rsplit(".", 1)[-1]}.{function.__qualname__}'
+
+    if inspect.isgeneratorfunction(function):
+        @wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            return _iterate(name, function(*args, **kwargs))
+        return generator_wrapper
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with measure(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """Returns recorded numbers: {name: {column: value}}."""
+    return {name: dict(values) for name, values in _stats.items()}
+
+
+def opened_paths() -> Dict[str, int]:
+    """Returns the number of opens of each file."""
+    return dict(_opened_paths)
+
+
+def print_report(out: TextIO = None):
+    """Prints the table of recorded numbers and the numbers of opens of each file."""
+    out = out or sys.stderr
+    print(f'{"call":<40} {"calls":>6} {"wall, ms":>10} {"cpu, ms":>10} {"read":>10} '
+          f'{"written":>10} {"opens":>6} {"parses":>8}', file=out)
+    for name, values in sorted(_stats.items(), key=lambda item: -item[1]['wall_ms']):
+        print(f'{name:<40} {values["calls"]:>6} {values["wall_ms"]:>10.3f} '
+              f'{values["cpu_ms"]:>10.3f} {values["read"]:>10} {values["written"]:>10} '
+              f'{values["opens"]:>6} {values["parses"]:>8}', file=out)
+
+    if _opened_paths:
+        print(f'\n{"file":<40} {"opens":>6}', file=out)
+        for path, count in _opened_paths.most_common():
+            print(f'{path:<40} {count:>6}', file=out)
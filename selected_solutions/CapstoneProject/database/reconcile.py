@@ -0,0 +1,127 @@
+"""
+Comparison of books.txt with an external catalogue dump, which has the same line format:
+
+    code $$ name $$ author $$ quantity $$ available quantity
+
+Both files are split into byte ranges, which are read in parallel by a pool of processes. Each
+range starts at the first line beginning inside it, so every line is read exactly once. Workers
+do not send parsed books back: they divide lines of their range into partitions by the hash of the
+book code and write each partition into its own temporary file. Then a worker of each partition
+parses its lines of both files and compares them: books of the catalogue, which are not in the
+library, are added, books of the library, which are not in the catalogue, are removed, and books
+with different name, author or quantity are changed. Only these codes are returned to the main
+process. Available quantity is the state of the library, not of the catalogue, so it is not
+compared.
+"""
+import multiprocessing
+import os
+import tempfile
+import zlib
+from typing import Dict, List, Tuple
+
+from database.books import BOOKS, _parse_from_line
+from database.locking import FileLock
+
+MIN_CHUNK_SIZE = 1 << 20
+CHUNKS_PER_PROCESS = 4
+
+
+def _chunks(path: str, processes: int) -> List[Tuple[str, int, int]]:
+    """Splits the file into byte ranges (path, start, end) for the given number of processes."""
+    size = os.path.getsize(path)
+    chunk_size = max(MIN_CHUNK_SIZE, -(-size // (processes * CHUNKS_PER_PROCESS)))
+    return [(path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def _partition_chunk(path: str, start: int, end: int, prefix: str, partitions: int):
+    """
+    Reads lines of the file, which begin in the byte range [start, end), and appends each of them
+    to the file "prefix.partition" of the partition of its book code.
+    """
+    lines = [[] for _ in range(partitions)]
+    with open(path, 'rb') as in_file:
+        if start:
+            in_file.seek(start - 1)
+            in_file.readline()
+        position = in_file.tell()
+        while position < end:
+            line = in_file.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                code = line.split(b' $$ ', 1)[0]
+                lines[zlib.crc32(code) % partitions].append(
+                    line if line.endswith(b'\n') else line + b'\n')
+
+    for partition, partition_lines in enumerate(lines):
+        if partition_lines:
+            with open(f'{prefix}.{partition}', 'wb') as out_file:
+                out_file.writelines(partition_lines)
+
+
+def _read_partition(prefixes: List[str], partition: int) -> Dict[str, Tuple[str, str, int]]:
+    """Parses lines of the partition written by chunks of one file, later lines win."""
+    books = {}
+    for prefix in prefixes:
+        path = f'{prefix}.{partition}'
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as in_file:
+            for line in in_file:
+                book = _parse_from_line(line.decode())
+                books[book.code] = (book.name, book.author, book.quantity)
+    return books
+
+
+def _compare_partition(library_prefixes: List[str], catalogue_prefixes: List[str],
+                       partition: int) -> Tuple[List[str], List[str], List[str]]:
+    """Returns codes of added, removed and changed books of the partition."""
+    library = _read_partition(library_prefixes, partition)
+    catalogue = _read_partition(catalogue_prefixes, partition)
+    added = [code for code in catalogue if code not in library]
+    removed = [code for code in library if code not in catalogue]
+    changed = [code for code, book in catalogue.items()
+               if code in library and library[code] != book]
+    return added, removed, changed
+
+
+def _partition_file(pool: multiprocessing.Pool, path: str, directory: str, name: str,
+                    processes: int) -> List[str]:
+    """Writes partitions of the file chunks, returns prefixes of their files in the file order."""
+    chunks = _chunks(path, processes)
+    prefixes = [os.path.join(directory, f'{name}.{i}') for i in range(len(chunks))]
+    pool.starmap(_partition_chunk, [(path, start, end, prefix, processes)
+                                    for (path, start, end), prefix in zip(chunks, prefixes)])
+    return prefixes
+
+
+def reconcile_catalogue(catalogue_path: str, books_path: str = BOOKS,
+                        processes: int = None) -> Dict[str, List]:
+    """
+    Compares books of the library with the catalogue dump. Returns codes of books, which should be
+    added to the library and removed from it, and codes of books, which data is changed, each list
+    is sorted.
+    """
+    if not catalogue_path or not os.path.exists(catalogue_path):
+        raise ValueError(f'Catalogue file "{catalogue_path}" does not exist.')
+
+    processes = processes or os.cpu_count() or 1
+    added, removed, changed = [], [], []
+    with tempfile.TemporaryDirectory(prefix='reconcile-',
+                                     dir=os.path.dirname(books_path) or '.') as directory, \
+            multiprocessing.Pool(processes) as pool:
+        with FileLock(books_path).shared():
+            library = _partition_file(pool, books_path, directory, 'library', processes)
+        catalogue = _partition_file(pool, catalogue_path, directory, 'catalogue', processes)
+
+        for partition_added, partition_removed, partition_changed in pool.starmap(
+                _compare_partition,
+                [(library, catalogue, partition) for partition in range(processes)]):
+            added += partition_added
+            removed += partition_removed
+            changed += partition_changed
+
+    print(f'{len(added)} books are added, {len(removed)} books are removed, '
+          f'{len(changed)} books are changed in the catalogue.')
+    return {'added': sorted(added), 'removed': sorted(removed), 'changed': sorted(changed)}
@@ -0,0 +1,205 @@
+"""
+Full-text search of books by words of their names and authors. The inverted index maps every word
+(token) to the set of codes of books, which have this word in their name or author, so the query
+of several words is answered by intersecting these sets, without reading all books.
+
+Book names and authors are alphanumeric strings without spaces, like "TheIdiot", so they are split
+into words by case and digits: "TheIdiot" -> "the", "idiot".
+
+The index is kept in books.index next to books.txt . add_book and delete_book do not rewrite it:
+they append one line to books.index.log, and the log is applied when the index is loaded and
+folded into books.index from time to time. The loaded index is kept for the version of books it
+has been loaded with, and it is loaded again, when the books store reads changes of other
+processes, so lines appended by them are applied too.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Set
+
+from database.locking import FileLock
+
+INDEX = "database/books.index"
+COMPACT_THRESHOLD = 10000
+
+
+def tokenize(text: str) -> Set[str]:
+    """Splits text into lowercase words: by non alphanumeric characters, case changes and digits."""
+    tokens, token = set(), ''
+    for char in text:
+        if not char.isalnum():
+            boundary, char = True, ''
+        elif not token:
+            boundary = False
+        else:
+            previous = token[-1]
+            boundary = (char.isdigit() != previous.isdigit()
+                        or (previous.islower() and char.isupper()))
+        if boundary and token:
+            tokens.add(token.lower())
+            token = ''
+        token += char
+    if token:
+        tokens.add(token.lower())
+    return tokens
+
+
+class InvertedIndex:
+    """Inverted index of books: {token: {book_code, ...}}, persisted in the file with its log."""
+
+    def __init__(self, path: str = INDEX):
+        self.path = path
+        self.log_path = path + '.log'
+        self.lock = FileLock(path)
+        self.postings: Dict[str, Set[str]] = {}
+        self.log_size = 0
+
+    def _apply(self, added: bool, code: str, name: str, author: str):
+        for token in tokenize(name) | tokenize(author):
+            if added:
+                self.postings.setdefault(token, set()).add(code)
+            else:
+                codes = self.postings.get(token, set())
+                codes.discard(code)
+                if not codes:
+                    self.postings.pop(token, None)
+
+    def load(self, books: Iterable[Dict]) -> 'InvertedIndex':
+        """
+        Loads the index from its file and log. If there is no index file yet, the index is built
+        from the given books and saved.
+        """
+        with self.lock.exclusive():
+            if not os.path.exists(self.path):
+                self.postings = {}
+                for book in books:
+                    self._apply(True, book['code'], book['name'], book['author'])
+                self._save()
+                return self
+
+            with open(self.path, 'r') as in_file:
+                self.postings = {token: set(codes) for token, codes in json.load(in_file).items()}
+
+            self.log_size = 0
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'r') as in_file:
+                    for line in in_file:
+                        try:
+                            self._apply(*json.loads(line))
+                        except ValueError:
+                            break
+                        self.log_size += 1
+        return self
+
+    def _save(self):
+        """Writes all postings to the index file and clears the log, it must be called locked."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as out_file:
+            json.dump({token: sorted(codes) for token, codes in self.postings.items()}, out_file,
+                      separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        with open(self.log_path, 'w'):
+            pass
+        self.log_size = 0
+
+    def update(self, changes: List[tuple], loaded: bool = True):
+        """
+        Adds or removes books, each change is (added, code, name, author). Changes are appended to
+        the log, and if the index is loaded, they are applied in memory as well.
+        """
+        with self.lock.exclusive():
+            if loaded:
+                for change in changes:
+                    self._apply(*change)
+            with open(self.log_path, 'a') as out_file:
+                out_file.writelines(json.dumps(change) + '\n' for change in changes)
+            self.log_size += len(changes)
+            if loaded and self.log_size >= COMPACT_THRESHOLD:
+                self._save()
+
+    def search(self, query: str) -> List[str]:
+        """Returns sorted codes of books, which contain all words of the query."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        postings = sorted((self.postings.get(token, set()) for token in tokens), key=len)
+        codes = set(postings[0])
+        for other in postings[1:]:
+            codes &= other
+            if not codes:
+                break
+        return sorted(codes)
+
+
+_index = None
+_version = None
+
+
+def _books() -> Iterable[Dict]:
+    from database.books import iter_books
+    return iter_books()
+
+
+def get_index() -> InvertedIndex:
+    """
+    Returns the books index, it is loaded from INDEX on the first call and when books have been
+    changed by other processes.
+    """
+    global _index, _version
+    from database.books import loaded_version
+    version = loaded_version()
+    if _index is None or version != _version:
+        _index = InvertedIndex(INDEX).load(_books())
+        _version = version
+    return _index
+
+
+def set_index(index: InvertedIndex or None):
+    """Replaces the books index. None resets it, so it is loaded again on the next call."""
+    global _index, _version
+    from database.books import loaded_version
+    _index = index
+    _version = loaded_version() if index is not None else None
+
+
+def reset_index():
+    """Deletes the index files, the index is built again from books on the next use."""
+    global _index, _version
+    with FileLock(INDEX).exclusive():
+        for path in (INDEX, INDEX + '.log'):
+            if os.path.exists(path):
+                os.remove(path)
+    _index = _version = None
+
+
+def book_added(code: str, name: str, author: str):
+    """Adds the book to the index, it is called by add_book."""
+    _update([(True, code, name, author)])
+
+
+def books_added(books: List[tuple]):
+    """Adds books given as (code, name, author) to the index, it is called by import_books."""
+    _update([(True, code, name, author) for code, name, author in books])
+
+
+def book_deleted(code: str, name: str, author: str):
+    """Removes the book from the index, it is called by delete_book."""
+    _update([(False, code, name, author)])
+
+
+def _update(changes: List[tuple]):
+    if not changes:
+        return
+    if _index is not None:
+        _index.update(changes)
+    elif os.path.exists(INDEX):
+        InvertedIndex(INDEX).update(changes, loaded=False)
+
+
+def search_books(query: str) -> List[Dict]:
+    """
+    Finds books, which names or authors contain all words of the query, for example
+    "dostoyevsky idiot". Returns the list of books data.
+    """
+    from database.books import find_book
+    return [book for book in map(find_book, get_index().search(query)) if book]
@@ -0,0 +1,221 @@
+"""
+Sharded layout of users data. Users are partitioned by crc32 of their codes into N shard files:
+
+    database/users_shards/meta.json         {"shards": N}
+    database/users_shards/users.0000.json   users with crc32(code) % N == 0
+    ...
+
+Each shard has the format of users.json and is a separate store with its own lock and version, so
+an operation with one user loads and rewrites only the shard of this user. Shards are loaded
+lazily, when they are used for the first time.
+
+`locked` of the whole store holds the lock of meta.json exclusively, and every write of a shard
+holds it shared, so while one process holds the store locked (transactions, batch scripts), other
+processes wait before writing any shard. The lock of meta.json also keeps the version of the
+layout: `convert_users` increases it, and running processes, which find a new version on refresh,
+drop their shards and read the new number of shards.
+"""
+import json
+import os
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from database.locking import FileLock
+from database.users import USERS, UserStore, _iter_file, _iter_json_object, _parse_loans
+
+USERS_SHARDS = "database/users_shards"
+DEFAULT_SHARDS = 16
+
+
+def _meta_path(directory: str) -> str:
+    return os.path.join(directory, 'meta.json')
+
+
+def _shard_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f'users.{index:04d}.json')
+
+
+def shard_of(code: str, shards: int) -> int:
+    """Returns the index of the shard, which keeps the user."""
+    return zlib.crc32(code.encode()) % shards
+
+
+def create_users_data(directory: str = USERS_SHARDS, shards: int = DEFAULT_SHARDS):
+    """
+    Creates an empty directory of shards with meta.json . If the directory already exists, it
+    should not do anything.
+    """
+    if not Path(_meta_path(directory)).exists():
+        os.makedirs(directory, exist_ok=True)
+        with open(_meta_path(directory), 'w') as out_file:
+            json.dump({'shards': shards}, out_file)
+
+
+class _Shard(UserStore):
+    """One shard of users. A shard file, which does not exist yet, has no users."""
+
+    def __init__(self, path: str, store_lock: FileLock):
+        self.store_lock = store_lock
+        super().__init__(path)
+
+    def _load(self) -> Dict[str, Dict[str, int]]:
+        if not os.path.exists(self.path):
+            return {}
+        return super()._load()
+
+    @contextmanager
+    def _writing(self):
+        with self.store_lock.shared(), super()._writing():
+            yield
+
+    def sync(self):
+        if os.path.exists(self.path):
+            super().sync()
+
+
+class ShardedUserStore:
+    """
+    Users store, which keeps users in shard files and has the same methods as UserStore. Shards
+    are loaded, when they are used first, also by reads of the HTTP service, while its writer
+    thread flushes the store, so methods go through a copy of the loaded shards.
+    """
+
+    def __init__(self, directory: str = USERS_SHARDS):
+        self.path = directory
+        self.lock = FileLock(_meta_path(directory))
+        self.shards: Dict[int, _Shard] = {}
+        self._deferred = False
+        self.version = 0
+        self.reload()
+
+    @property
+    def deferred(self) -> bool:
+        return self._deferred
+
+    @deferred.setter
+    def deferred(self, deferred: bool):
+        self._deferred = deferred
+        for shard in list(self.shards.values()):
+            shard.deferred = deferred
+
+    @property
+    def dirty(self) -> bool:
+        return any(shard.dirty for shard in list(self.shards.values()))
+
+    def _shard_at(self, index: int) -> _Shard:
+        if index not in self.shards:
+            shard = _Shard(_shard_path(self.path, index), self.lock)
+            shard.deferred = self._deferred
+            self.shards[index] = shard
+        return self.shards[index]
+
+    def _shard(self, code: str) -> _Shard:
+        return self._shard_at(shard_of(code, self.shard_count))
+
+    def reload(self):
+        """Drops all loaded shards, they are read again when they are used."""
+        with self.lock.shared(), open(_meta_path(self.path), 'r') as in_file:
+            self.version = self.lock.read_version()
+            self.shard_count = json.load(in_file)['shards']
+        self.shards = {}
+
+    def refresh(self):
+        """
+        Reloads the store, if the layout of shards has been changed by another process, otherwise
+        reloads loaded shards, which have been changed.
+        """
+        if self.dirty or self.deferred:
+            return
+        with self.lock.shared():
+            if self.lock.read_version() != self.version:
+                self.reload()
+                return
+        for shard in list(self.shards.values()):
+            shard.refresh()
+
+    def locked(self):
+        """
+        Context manager, which holds the exclusive lock of the store, so other processes can not
+        change any shard while the store is used.
+        """
+        return self.lock.exclusive()
+
+    def flush(self):
+        """Writes deferred changes of all shards."""
+        for shard in list(self.shards.values()):
+            shard.flush()
+
+    def sync(self):
+        """Forces written data of loaded shards to be stored on disk."""
+        for shard in list(self.shards.values()):
+            shard.sync()
+
+    def all(self) -> Dict[str, List[str]]:
+        return dict(self.iter())
+
+    def iter(self) -> Iterator[Tuple[str, List[str]]]:
+        """Yields users shard by shard, shards which are not loaded are read from their files."""
+        for index in range(self.shard_count):
+            if index in self.shards:
+                yield from self.shards[index].iter()
+            elif os.path.exists(_shard_path(self.path, index)):
+                yield from _iter_file(_shard_path(self.path, index))
+
+    def books(self, code: str) -> List[str] or None:
+        return self._shard(code).books(code)
+
+    def loan_count(self, user_code: str, book_code: str) -> int or None:
+        return self._shard(user_code).loan_count(user_code, book_code)
+
+    def add(self, code: str):
+        self._shard(code).add(code)
+
+    def delete(self, code: str):
+        self._shard(code).delete(code)
+
+    def add_loan(self, user_code: str, book_code: str):
+        self._shard(user_code).add_loan(user_code, book_code)
+
+    def remove_loan(self, user_code: str, book_code: str):
+        self._shard(user_code).remove_loan(user_code, book_code)
+
+
+def convert_to_sharded(source: str = USERS, directory: str = USERS_SHARDS,
+                       shards: int = DEFAULT_SHARDS):
+    """
+    Splits users.json into the given number of shards. Each shard file is replaced atomically and
+    its version is increased, so processes, which have loaded old shards, reload them. Shard files
+    of the previous layout with bigger number of shards are removed.
+    """
+    if not shards or shards <= 0:
+        raise ValueError('Number of shards must be positive integer.')
+
+    partitions = [{} for _ in range(shards)]
+    with FileLock(source).shared(), open(source, 'r') as in_file:
+        for code, books in _iter_json_object(in_file):
+            partitions[shard_of(code, shards)][code] = _parse_loans(books)
+
+    os.makedirs(directory, exist_ok=True)
+    store_lock = FileLock(_meta_path(directory))
+    with store_lock.exclusive():
+        for index, users in enumerate(partitions):
+            path = _shard_path(directory, index)
+            lock = FileLock(path)
+            with lock.exclusive():
+                with open(path + '.tmp', 'w') as out_file:
+                    json.dump(users, out_file, separators=(',', ':'))
+                os.replace(path + '.tmp', path)
+                lock.write_version(lock.read_version() + 1)
+
+        with open(_meta_path(directory) + '.tmp', 'w') as out_file:
+            json.dump({'shards': shards}, out_file)
+        os.replace(_meta_path(directory) + '.tmp', _meta_path(directory))
+        store_lock.write_version(store_lock.read_version() + 1)
+
+        for name in os.listdir(directory):
+            if name.startswith('users.') and name.endswith('.json') and int(name[6:10]) >= shards:
+                os.remove(os.path.join(directory, name))
+
+    print(f'Users are split into {shards} shards.')
@@ -0,0 +1,254 @@
+"""
+SQLite storage backend for books and users. The stores have the same methods as BookStore and
+UserStore, so functions of books.py and users.py work with them without changes, including all
+validations.
+
+Books and users are tables with primary keys on their codes. Books of users are stored in the
+loans table, one row per given book, instead of lists in users.json . The database works in WAL
+journal mode, so readers do not block the writer. Checkouts and returns lock the lock file of the
+database, like file stores do, so their transactions and the journal are not interleaved with ones
+of other processes, and they run inside one `BEGIN IMMEDIATE` transaction of SQLite. Available
+quantity is decreased by the conditional UPDATE, so it never becomes negative, even if the check
+of the book has read an outdated value.
+"""
+import sqlite3
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Dict, Iterator, List, Tuple
+
+from database.books import BOOKS, BookStore
+from database.locking import FileLock
+from database.users import USERS, UserStore
+
+LIBRARY_DB = "database/library.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    author TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    available_quantity INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS users (
+    code TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS loans (
+    id INTEGER PRIMARY KEY,
+    user_code TEXT NOT NULL REFERENCES users (code),
+    book_code TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS loans_user_code ON loans (user_code, book_code);
+"""
+
+BOOK_COLUMNS = ('code', 'name', 'author', 'quantity', 'available_quantity')
+
+# both stores of one database must use the same lock, locks of one file, which are taken through
+# different file objects, block each other even in the same process
+_locks: Dict[str, FileLock] = {}
+
+
+def connect(path: str = LIBRARY_DB) -> sqlite3.Connection:
+    """
+    Opens the library database and creates its tables, if they do not exist. The connection can
+    be used by other threads: the HTTP service writes from its writer thread.
+    """
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('PRAGMA foreign_keys=ON')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class _SqliteStore:
+    """
+    Base class of SQLite stores. Every change is committed immediately, unless the store is
+    deferred, in that case changes are committed by flush.
+    """
+
+    table = None
+
+    def __init__(self, connection: sqlite3.Connection, path: str = LIBRARY_DB):
+        self.connection = connection
+        self.path = path
+        self.lock = _locks.setdefault(path, FileLock(path))
+        self.deferred = False
+        self._dirty = False
+
+    @property
+    def dirty(self) -> bool:
+        """Both stores share the connection, so a commit of one store commits changes of both."""
+        return self._dirty and self.connection.in_transaction
+
+    @dirty.setter
+    def dirty(self, dirty: bool):
+        self._dirty = dirty
+
+    def refresh(self):
+        """SQLite reads committed data itself, so there is nothing to refresh."""
+
+    def reload(self):
+        """
+        Rolls back changes, which are not committed yet. SQLite reads committed data itself, so
+        there is nothing else to reload.
+        """
+        self.connection.rollback()
+        self.dirty = False
+
+    @property
+    def generation(self) -> int:
+        """Changes, when other connections commit changes of the database, see FileStore."""
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextmanager
+    def locked(self):
+        """
+        Context manager, which holds the exclusive lock of the database file and the write
+        transaction of SQLite. SQLite locks the database itself only while writing, but checks
+        and changes of a transaction must not be interleaved with ones of other processes. Changes,
+        which are not committed by flush inside, are committed at the end, or rolled back, if an
+        exception is raised.
+        """
+        with self.lock.exclusive():
+            if self.connection.in_transaction:
+                yield
+                return
+
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    def _changed(self):
+        if self.deferred:
+            self.dirty = True
+        else:
+            self.connection.commit()
+
+    def flush(self):
+        """Commits all deferred changes."""
+        if self.dirty:
+            self.connection.commit()
+            self.dirty = False
+
+    def sync(self):
+        """SQLite syncs the database file itself on commit."""
+
+
+class SqliteBookStore(_SqliteStore):
+    """Books store backed by the books table."""
+    table = 'books'
+
+    def find(self, code: str) -> Dict:
+        row = self.connection.execute(
+            'SELECT code, name, author, quantity, available_quantity FROM books WHERE code = ?',
+            (code,)
+        ).fetchone()
+        return dict(zip(BOOK_COLUMNS, row)) if row else {}
+
+    def all(self) -> List[Dict]:
+        rows = self.connection.execute(
+            'SELECT code, name, author, quantity, available_quantity FROM books')
+        return [dict(zip(BOOK_COLUMNS, row)) for row in rows]
+
+    def iter(self) -> Iterator[Dict]:
+        rows = self.connection.execute(
+            'SELECT code, name, author, quantity, available_quantity FROM books')
+        return (dict(zip(BOOK_COLUMNS, row)) for row in rows)
+
+    def add(self, code: str, name: str, author: str, quantity: int):
+        self.connection.execute('INSERT INTO books VALUES (?, ?, ?, ?, ?)',
+                                (code, name, author, quantity, quantity))
+        self._changed()
+
+    def delete(self, code: str):
+        self.connection.execute('DELETE FROM books WHERE code = ?', (code,))
+        self._changed()
+
+    def change_available_quantity(self, code: str, change: int):
+        cursor = self.connection.execute(
+            'UPDATE books SET available_quantity = available_quantity + ? '
+            'WHERE code = ? AND available_quantity + ? >= 0',
+            (change, code, change))
+        if not cursor.rowcount:
+            raise ValueError('Sorry there is no available book at this moment.')
+        self._changed()
+
+
+class SqliteUserStore(_SqliteStore):
+    """Users store backed by the users and loans tables."""
+    table = 'users'
+
+    def all(self) -> Dict[str, List[str]]:
+        users = {code: [] for (code,) in self.connection.execute('SELECT code FROM users')}
+        for user_code, book_code in self.connection.execute(
+                'SELECT user_code, book_code FROM loans ORDER BY id'):
+            users[user_code].append(book_code)
+        return users
+
+    def iter(self) -> Iterator[Tuple[str, List[str]]]:
+        rows = self.connection.execute(
+            'SELECT users.code, loans.book_code FROM users '
+            'LEFT JOIN loans ON loans.user_code = users.code ORDER BY users.code, loans.id')
+        for code, user_rows in groupby(rows, key=lambda row: row[0]):
+            yield code, [book_code for _, book_code in user_rows if book_code is not None]
+
+    def books(self, code: str) -> List[str] or None:
+        if not self.connection.execute('SELECT 1 FROM users WHERE code = ?', (code,)).fetchone():
+            return None
+        rows = self.connection.execute(
+            'SELECT book_code FROM loans WHERE user_code = ? ORDER BY id', (code,))
+        return [book_code for (book_code,) in rows]
+
+    def loan_count(self, user_code: str, book_code: str) -> int or None:
+        if not self.connection.execute('SELECT 1 FROM users WHERE code = ?',
+                                       (user_code,)).fetchone():
+            return None
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM loans WHERE user_code = ? AND book_code = ?',
+            (user_code, book_code)).fetchone()[0]
+
+    def add(self, code: str):
+        self.connection.execute('INSERT INTO users VALUES (?)', (code,))
+        self._changed()
+
+    def delete(self, code: str):
+        self.connection.execute('DELETE FROM users WHERE code = ?', (code,))
+        self._changed()
+
+    def add_loan(self, user_code: str, book_code: str):
+        self.connection.execute('INSERT INTO loans (user_code, book_code) VALUES (?, ?)',
+                                (user_code, book_code))
+        self._changed()
+
+    def remove_loan(self, user_code: str, book_code: str):
+        self.connection.execute(
+            'DELETE FROM loans WHERE id = '
+            '(SELECT id FROM loans WHERE user_code = ? AND book_code = ? LIMIT 1)',
+            (user_code, book_code))
+        self._changed()
+
+
+def convert_to_sqlite(books_path: str = BOOKS, users_path: str = USERS, path: str = LIBRARY_DB):
+    """Copies books and users from books.txt and users.json to the library database."""
+    books_store, users_store = BookStore(books_path), UserStore(users_path)
+    with connect(path) as connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?)',
+            ([book[column] for column in BOOK_COLUMNS] for book in books_store.all()))
+        connection.executemany('INSERT OR IGNORE INTO users VALUES (?)',
+                               ((code,) for code in users_store.users))
+        connection.execute('DELETE FROM loans')
+        connection.executemany(
+            'INSERT INTO loans (user_code, book_code) VALUES (?, ?)',
+            ((user_code, book_code)
+             for user_code, books in users_store.iter() for book_code in books))
+    connection.close()
+    print('Books and users are copied to SQLite database.')
@@ -0,0 +1,128 @@
+import os
+from contextlib import contextmanager
+from typing import Any
+
+from database import parse_cache, profiling
+from database.locking import ConflictError, FileLock
+
+
+@contextmanager
+def replacing(path: str, mode: str = 'w'):
+    """
+    Context manager, which yields the temporary file. When the block ends, the file is synced to
+    disk and atomically replaces the file of the path, so a crash leaves the old file or the new
+    one, never a partially written one.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as out_file:
+        yield out_file
+        out_file.flush()
+        os.fsync(out_file.fileno())
+    os.replace(tmp_path, path)
+    directory = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class FileStore:
+    """
+    Base class of stores, which keep the data of one file in memory. Subclasses define how data
+    is loaded from the file and written back to it, this class handles locking of the file, its
+    version and deferred saving.
+
+    If `cache_parsed` is True, the loaded data must be exactly the data of the file, and it is
+    cached in the sidecar file (see parse_cache.py).
+
+    `generation` counts loads of the file. It changes, when the store reads changes of other
+    processes, but not with writes of the store itself, so indexes built from the data of the
+    store (see search.py and completion.py) know, when they have to be built again.
+    """
+    cache_parsed = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.deferred = False
+        self.dirty = False
+        self.lock = FileLock(path)
+        self.version = 0
+        self.generation = 0
+        self.data = None
+        self.reload()
+
+    def _load(self) -> Any:
+        """Reads the data from the file."""
+        raise NotImplementedError
+
+    def _dump(self, out_file):
+        """Writes the data, which is currently in the store, to the given file object."""
+        raise NotImplementedError
+
+    @profiling.instrumented
+    def reload(self):
+        """Reads the file again, all changes, which are not written yet, are dropped."""
+        with self.lock.shared():
+            self.version = self.lock.read_version()
+            if self.cache_parsed:
+                self.data = parse_cache.load(self.path, self.version, self._load)
+            else:
+                self.data = self._load()
+        self.generation += 1
+        self.dirty = False
+
+    def refresh(self):
+        """
+        Reloads the store, if the file has been changed by another process. Deferred stores are
+        not refreshed: their writer holds the lock of the file and has refreshed them before
+        deferring saving.
+        """
+        if self.dirty or self.deferred:
+            return
+        with self.lock.shared():
+            if self.lock.read_version() != self.version:
+                self.reload()
+
+    def locked(self):
+        """
+        Context manager, which holds the exclusive lock of the file, so other processes can not
+        change it while the store is used.
+        """
+        return self.lock.exclusive()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Context manager for writing the file. Raises ConflictError, if the file was changed by
+        another process after the store had loaded it.
+        """
+        with self.lock.exclusive():
+            if self.lock.read_version() != self.version:
+                raise ConflictError(f'{self.path} is changed by another process.')
+            yield
+            self.version += 1
+            self.lock.write_version(self.version)
+
+    @profiling.instrumented
+    def _save(self):
+        """Replaces the file with the data, which is currently in the store."""
+        with self._writing(), replacing(self.path) as out_file:
+            self._dump(out_file)
+
+    def _changed(self):
+        """Saves the store or only marks it as changed, if saving is deferred."""
+        if self.deferred:
+            self.dirty = True
+        else:
+            self._save()
+
+    def flush(self):
+        """Writes all deferred changes to the file."""
+        if self.dirty:
+            self._save()
+            self.dirty = False
+
+    def sync(self):
+        """Forces written data of the file to be stored on disk."""
+        with open(self.path, 'rb') as in_file:
+            os.fsync(in_file.fileno())
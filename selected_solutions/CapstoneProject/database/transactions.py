@@ -0,0 +1,203 @@
+"""
+Atomic checkout and return of books. Giving book to user changes two stores: available quantity
+of the book and books of the user. Both changes are done inside a transaction:
+
+1. both stores are locked and saving of them is deferred, so changes stay in memory,
+2. the new state of the book and of the user is appended to the journal and the journal is synced
+   to disk,
+3. stores are flushed and synced, the holders index gets new numbers of copies of books at users
+   (see holders.py) and the journal is truncated.
+
+If the process crashes after step 2, the next process finds records in the journal and applies
+them again before doing anything else. Records contain final values (available quantity of the
+book and number of its copies at the user), so applying them twice is safe.
+
+Inside `group` transactions are not committed one by one: their records are collected in the
+journal and one `commit` syncs all of them together, so many transactions cost one fsync.
+"""
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from database import holders
+from database.books import get_store as get_books_store
+from database.users import get_store as get_users_store
+
+JOURNAL = "database/journal.log"
+
+_grouped = False
+_pending: List[Dict] = []
+
+
+def _state(user_code: str, book_code: str) -> Dict:
+    """Returns the part of stores state, which is changed by checkout or return of the book."""
+    return {
+        'book': book_code,
+        'available_quantity': get_books_store().find(book_code).get('available_quantity'),
+        'user': user_code,
+        'count': get_users_store().loan_count(user_code, book_code) or 0
+    }
+
+
+def _apply(record: Dict):
+    """Changes stores so that they have the state given in the journal record."""
+    books_store, users_store = get_books_store(), get_users_store()
+
+    book = books_store.find(record['book'])
+    if book and record['available_quantity'] is not None:
+        change = record['available_quantity'] - book['available_quantity']
+        if change:
+            books_store.change_available_quantity(record['book'], change)
+
+    count = users_store.loan_count(record['user'], record['book'])
+    if count is not None:
+        for _ in range(record['count'], count):
+            users_store.remove_loan(record['user'], record['book'])
+        for _ in range(count, record['count']):
+            users_store.add_loan(record['user'], record['book'])
+
+
+def _read_journal(path: str = JOURNAL) -> Iterator[Dict]:
+    """Yields records of the journal, partially written last line is skipped."""
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'r') as in_file:
+        for line in in_file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+def _append(records: List[Dict]):
+    """Appends records to the journal."""
+    with open(JOURNAL, 'a') as out_file:
+        out_file.writelines(json.dumps(record) + '\n' for record in records)
+
+
+def _sync_journal():
+    """Forces written records of the journal to be stored on disk."""
+    with open(JOURNAL, 'a') as out_file:
+        os.fsync(out_file.fileno())
+
+
+@contextmanager
+def _deferred():
+    """Defers saving of both stores and restores previous behaviour at the end."""
+    books_store, users_store = get_books_store(), get_users_store()
+    previous = books_store.deferred, users_store.deferred
+    books_store.deferred = users_store.deferred = True
+    try:
+        yield
+    finally:
+        books_store.deferred, users_store.deferred = previous
+
+
+def commit():
+    """
+    Makes all transactions, which are in the journal, durable: syncs the journal, writes and syncs
+    both stores, updates the holders index and truncates the journal. Stores must be locked by the
+    caller.
+    """
+    global _pending
+    books_store, users_store = get_books_store(), get_users_store()
+
+    if _pending:
+        _sync_journal()
+    books_store.flush()
+    users_store.flush()
+    if _pending:
+        books_store.sync()
+        users_store.sync()
+        holders.loans_changed(_pending)
+        with open(JOURNAL, 'w'):
+            pass
+    _pending = []
+
+
+def abort() -> Tuple[bool, bool]:
+    """
+    Drops changes, which have not been committed because of an error: both stores are loaded
+    again and transactions, whose records have reached the journal, are applied, as after a crash.
+    Returns whether other deferred changes of the books store and of the users store had been
+    written before the error. Stores must be locked by the caller.
+    """
+    global _pending
+    books_store, users_store = get_books_store(), get_users_store()
+    written = not books_store.dirty, not users_store.dirty
+    _pending = []
+    books_store.reload()
+    users_store.reload()
+    recover()
+    return written
+
+
+def recover():
+    """Applies transactions, which are left in the journal by a crashed process."""
+    if _pending or not os.path.exists(JOURNAL) or not os.path.getsize(JOURNAL):
+        return
+
+    books_store, users_store = get_books_store(), get_users_store()
+    with books_store.locked(), users_store.locked():
+        books_store.refresh()
+        users_store.refresh()
+        records = list(_read_journal())
+        with _deferred():
+            for record in records:
+                _apply(record)
+        books_store.flush()
+        users_store.flush()
+        books_store.sync()
+        users_store.sync()
+        holders.loans_changed(records)
+        with open(JOURNAL, 'w'):
+            pass
+
+
+@contextmanager
+def transaction(user_code: str, book_code: str):
+    """
+    Context manager, which makes changes of the book and the user done inside it atomic. If an
+    exception is raised inside, both stores get back their previous state.
+    """
+    global _pending
+    books_store, users_store = get_books_store(), get_users_store()
+
+    with books_store.locked(), users_store.locked():
+        recover()
+        books_store.refresh()
+        users_store.refresh()
+        before = _state(user_code, book_code)
+
+        with _deferred():
+            try:
+                yield
+            except Exception:
+                _apply(before)
+                if not _grouped:
+                    commit()
+                raise
+
+            record = _state(user_code, book_code)
+            _append([record])
+            _pending.append(record)
+
+        if not _grouped:
+            commit()
+
+
+@contextmanager
+def group():
+    """
+    Context manager, inside which transactions are not committed one by one, but all together by
+    `commit` calls and at the end.
+    """
+    global _grouped
+    _grouped = True
+    try:
+        yield
+    finally:
+        _grouped = False
+        commit()
@@ -1,10 +1,16 @@
 import json
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, TextIO, Tuple
+
+from database import bloom, holders, profiling
+from database.locking import FileLock, optimistic
+from database.store import FileStore
 
 USERS = "database/users.json"
 
 
+@profiling.instrumented
 def create_users_data():
     """
     Creates an empty json file for storing users data. If the file already exists, it should
@@ -16,22 +22,209 @@ def create_users_data():
             json.dump({}, infile)
 
 
+def _parse_loans(books: List[str] or Dict[str, int]) -> Dict[str, int]:
+    """
+    Helper function which converts user's books from users.json to loans: {book_code: count}.
+    Old files keep books as lists with one item per given book, they are converted as well.
+    """
+    if isinstance(books, dict):
+        return books
+
+    loans = {}
+    for book_code in books:
+        loans[book_code] = loans.get(book_code, 0) + 1
+    return loans
+
+
+def _loans_to_list(loans: Dict[str, int]) -> List[str]:
+    """Helper function which converts loans to the list of user's books, one item per book."""
+    return [book_code for book_code, count in loans.items() for _ in range(count)]
+
+
+class UserStore(FileStore):
+    """
+    In-memory users storage. It reads users.json only once and keeps users in the dict:
+    {user_code: {book_code_1: count_1, book_code_2: count_2, ...}}, so giving book to user and
+    getting it back cost O(1) for any number of user's books. Every change is written back to the
+    file, which is written without indentation to keep it small.
+    """
+    cache_parsed = True
+
+    def __init__(self, path: str = USERS):
+        super().__init__(path)
+
+    @property
+    def users(self) -> Dict[str, Dict[str, int]]:
+        return self.data
+
+    def _load(self) -> Dict[str, Dict[str, int]]:
+        """Reads all users from the file."""
+        with open(self.path, 'r') as infile:
+            users = {code: _parse_loans(books) for code, books in json.load(infile).items()}
+        profiling.count_parses(len(users))
+        return users
+
+    def _dump(self, out_file):
+        """Writes all users, which are currently in the store, to the given file object."""
+        json.dump(self.users, out_file, separators=(',', ':'))
+
+    def all(self) -> Dict[str, List[str]]:
+        """Returns the copy of all users data."""
+        return {code: _loans_to_list(loans) for code, loans in self.users.items()}
+
+    def iter(self) -> Iterator[Tuple[str, List[str]]]:
+        """Yields users one by one: (user_code, user_books)."""
+        return ((code, _loans_to_list(loans)) for code, loans in self.users.items())
+
+    def books(self, code: str) -> List[str] or None:
+        """Returns the copy of user's books or None, if the user is not in the store."""
+        loans = self.users.get(code)
+        return None if loans is None else _loans_to_list(loans)
+
+    def loan_count(self, user_code: str, book_code: str) -> int or None:
+        """Returns the number of copies of the book at the user or None, if there is no user."""
+        loans = self.users.get(user_code)
+        return None if loans is None else loans.get(book_code, 0)
+
+    def add(self, code: str):
+        """Adds new user without books to the store."""
+        self.users[code] = {}
+        self._changed()
+
+    def delete(self, code: str):
+        """Deletes user from the store."""
+        del self.users[code]
+        self._changed()
+
+    def add_loan(self, user_code: str, book_code: str):
+        """Adds book code to user's books."""
+        loans = self.users[user_code]
+        loans[book_code] = loans.get(book_code, 0) + 1
+        self._changed()
+
+    def remove_loan(self, user_code: str, book_code: str):
+        """Removes one book code from user's books."""
+        loans = self.users[user_code]
+        if loans[book_code] == 1:
+            del loans[book_code]
+        else:
+            loans[book_code] -= 1
+        self._changed()
+
+
+_store = None
+
+
+def get_store() -> UserStore:
+    """Returns the users store. The store is created and loaded from USERS on the first call."""
+    global _store
+    if _store is None:
+        _store = UserStore(USERS)
+    return _store
+
+
+def set_store(store: UserStore or None):
+    """Replaces the users store, which is used by module functions. None resets it."""
+    global _store
+    _store = store
+
+
+_optimistic = optimistic(get_store)
+
+
+def _filter() -> bloom.CountingBloomFilter:
+    """Returns the Bloom filter of user codes of the current store, without loading the store."""
+    return bloom.get_filter(_store, USERS, lambda: (code for code, _ in iter_users()))
+
+
+@profiling.instrumented
+@_optimistic
 def get_all_users() -> Dict[str, List[str]]:
     """Returns all users data in a dict: {user: [user_books]}."""
-    with open(USERS, 'r') as infile:
-        return json.load(infile)
+    return get_store().all()
 
 
+def _iter_json_object(in_file: TextIO, chunk_size: int = 65536) -> Iterator[Tuple[str, List]]:
+    """
+    Yields (key, value) pairs of the json object from the file, reading it by chunks, so the whole
+    object is never kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = in_file.read(chunk_size)
+    position = buffer.find('{') + 1
+    if not position:
+        return
+    key = None
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,:':
+            position += 1
+
+        if position < len(buffer) and buffer[position] == '}':
+            return
+
+        try:
+            value, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = in_file.read(chunk_size)
+            if not chunk:
+                return
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        if key is None:
+            key = value
+        else:
+            yield key, value
+            key = None
+
+
+@profiling.instrumented
+def _iter_file(path: str) -> Iterator[Tuple[str, List[str]]]:
+    """Reads users one by one from the file, without keeping them in memory."""
+    with FileLock(path).shared(), open(path, 'r') as in_file:
+        for code, books in _iter_json_object(in_file):
+            profiling.count_parses()
+            yield code, _loans_to_list(_parse_loans(books))
+
+
+@profiling.instrumented
+def iter_users(offset: int = 0, limit: int = None) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yields users one by one as (user_code, user_books): skips first `offset` users and stops after
+    `limit` users. If the users store is not loaded yet, users are read directly from the file as
+    they are parsed, so memory usage does not depend on the number of users.
+    """
+    if _store is None:
+        users = _iter_file(USERS)
+    else:
+        _store.refresh()
+        users = _store.iter()
+    return islice(users, offset, None if limit is None else offset + limit)
+
+
+@profiling.instrumented
 def get_user_books(code: str) -> List[str] or str:
     """
     Finds user by its code in users database and returns it's books data: the list of books, which
     user have been taken from library. If user does not exist in user database, returns string:
-    "user not in database".
+    "user not in database". Codes, which are definitely not in the database, are answered by the
+    Bloom filter without reading users.
     """
-    all_users = get_all_users()
-    return all_users.get(code, 'user not in database')
+    if not _filter().might_contain(code):
+        return 'user not in database'
+    return _get_user_books(code)
+
 
+@profiling.instrumented
+@_optimistic
+def _get_user_books(code: str) -> List[str] or str:
+    books = get_store().books(code)
+    return 'user not in database' if books is None else books
 
+
+@profiling.instrumented
+@_optimistic
 def add_user(code: str):
     """Adds given user to the database."""
 
@@ -41,63 +234,70 @@ def add_user(code: str):
     if not code.isalnum():
         raise ValueError('User code must be alphanumeric.')
 
-    all_users = get_all_users()
-    if code in all_users:
+    store = get_store()
+    if _filter().might_contain(code) and store.books(code) is not None:
         raise ValueError('User already is in database.')
 
-    all_users[code] = []
-
-    with open(USERS, mode='w') as in_file:
-        json.dump(all_users, in_file, indent=2)
+    _filter().add(code)
+    try:
+        store.add(code)
+    except BaseException:
+        _filter().remove(code)
+        raise
     print('User is added.')
 
 
+@profiling.instrumented
+@_optimistic
 def delete_user(code: str):
     """Deletes user from database."""
-    all_users = get_all_users()
+    store = get_store()
+    books = store.books(code)
 
-    if code not in all_users:
+    if books is None:
         raise ValueError(f'The user with code="{code}" is not in database.')
 
-    if all_users[code]:
+    if books:
         raise ValueError('User has not returned books.')
 
-    all_users.pop(code)
-
-    with open(USERS, 'w') as in_file:
-        json.dump(all_users, in_file, indent=2)
+    store.delete(code)
+    _filter().remove(code)
     print('User is deleted.')
 
 
+@profiling.instrumented
+@_optimistic
 def get_book_from_library(user_code: str, book_code: str):
     """Gets book from library: adds book code to user books data."""
 
-    all_users = get_all_users()
+    store = get_store()
 
-    if user_code not in all_users:
+    if store.loan_count(user_code, book_code) is None:
         raise ValueError(f'The user with code="{user_code}" is not in database.')
 
-    all_users[user_code].append(book_code)
-
-    with open(USERS, 'w') as in_file:
-        json.dump(all_users, in_file, indent=2)
+    store.add_loan(user_code, book_code)
+    if not store.deferred:
+        # inside transactions the index is updated by their commit
+        holders.loan_changed(user_code, book_code, store.loan_count(user_code, book_code))
     print('User have been gotten book.')
 
 
+@profiling.instrumented
+@_optimistic
 def return_book_to_library(user_code: str, book_code: str):
     """Return book to library: deletes book code from user books data."""
 
-    all_users = get_all_users()
+    store = get_store()
+    count = store.loan_count(user_code, book_code)
 
-    if user_code not in all_users:
+    if count is None:
         raise ValueError(f'The user with code="{user_code}" is not in database.')
 
-    if book_code not in all_users[user_code]:
+    if not count:
         raise ValueError(
             f'The user with code="{user_code}" does not have the book with code="{book_code}".')
 
-    all_users[user_code].remove(book_code)
-
-    with open(USERS, 'w') as in_file:
-        json.dump(all_users, in_file, indent=2)
+    store.remove_loan(user_code, book_code)
+    if not store.deferred:
+        holders.loan_changed(user_code, book_code, count - 1)
     print('User have been returned book.')
@@ -0,0 +1,256 @@
+"""
+Write-ahead log mode for books and users stores. Instead of rewriting books.txt or users.json on
+every change, each change is appended to the log file as one small json line. The state is
+rebuilt on start by reading the last snapshot (books.txt / users.json) and replaying the log on top
+of it. Compaction folds the log into a new snapshot and truncates the log.
+
+Each log record stores the whole new value of one book or one user (or its deletion), or the new
+number of copies of one book at one user, so replaying the same record twice gives the same
+state. Thanks to that, a crash between writing the snapshot and truncating the log does not break
+anything: a loan record of the user, who is deleted in the snapshot, is skipped.
+
+Runs without --wal read only the snapshots, so before them the logs left by --wal runs are folded
+into the snapshots with `fold_logs`.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from database import profiling
+from database.books import BOOKS, Book, BookStore
+from database.store import replacing
+from database.users import USERS, UserStore, _parse_loans
+
+BOOKS_LOG = "database/books.log"
+USERS_LOG = "database/users.log"
+
+COMPACT_THRESHOLD = 10000
+
+
+def _read_log(path: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yields records from the log file with the byte offset of the end of each one. The last line
+    could be written partially, if the process was killed while writing it, such line is skipped.
+    """
+    if not Path(path).exists():
+        return
+
+    end = 0
+    with open(path, 'rb') as in_file:
+        for line in in_file:
+            profiling.count_parses()
+            if not line.endswith(b'\n'):
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            end += len(line)
+            yield end, record
+
+
+class _OperationLog:
+    """
+    Append-only log file of json records. Records of deferred stores are kept in pending list and
+    written all together.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.end = 0
+        self.pending = []
+
+    def replay(self) -> Iterator[Dict]:
+        """
+        Yields all records of the log and counts them. The offset of the end of the last whole
+        record is kept, the torn tail after it is cut off before the next append.
+        """
+        self.size = 0
+        self.end = 0
+        self.pending = []
+        for end, record in _read_log(self.path):
+            self.size += 1
+            self.end = end
+            yield record
+
+    def append(self, record: Dict):
+        """Appends one record to the end of the log."""
+        self.extend([record])
+
+    def extend(self, records: List[Dict]):
+        """
+        Appends records to the end of the last whole record of the log. It must be called with
+        the exclusive lock of the store, which has replayed the log.
+        """
+        with open(self.path, 'a') as out_file:
+            if out_file.tell() > self.end:
+                out_file.truncate(self.end)
+            data = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+            out_file.write(data)
+        self.size += len(records)
+        self.end += len(data.encode())
+
+    def sync(self):
+        """Forces written records to be stored on disk."""
+        with open(self.path, 'a') as out_file:
+            os.fsync(out_file.fileno())
+
+    def truncate(self):
+        """Removes all written records from the log."""
+        with open(self.path, 'w'):
+            pass
+        self.size = 0
+        self.end = 0
+
+
+def _write_snapshot(store, path: str):
+    """Writes the store state to the snapshot file, replacing it atomically."""
+    with replacing(path) as out_file:
+        store._dump(out_file)
+
+
+class _LoggedStore:
+    """
+    Mixin for stores, which append their changes to the operation log. If saving is deferred,
+    records wait in the pending list of the log and flush appends them all together. Loaded data
+    includes the log, so it is not cached as the data of the snapshot file.
+    """
+    cache_parsed = False
+
+    def _log_record(self, record: Dict):
+        self.log.pending.append(record)
+        self._changed()
+
+    def _save(self):
+        """
+        Appends pending records to the log. The log is compacted under the same lock, so the
+        compaction can not fail with ConflictError after the records are written.
+        """
+        with self._writing():
+            self.log.extend(self.log.pending)
+            self.log.pending = []
+            if self.log.size >= self.compact_threshold:
+                self._compact()
+
+    def sync(self):
+        super().sync()
+        self.log.sync()
+
+    def _compact(self):
+        _write_snapshot(self, self.path)
+        self.log.pending = []
+        self.log.truncate()
+
+    def compact(self):
+        """Folds the log into the new snapshot of the store."""
+        with self._writing():
+            self._compact()
+        self.dirty = False
+
+
+class WalBookStore(_LoggedStore, BookStore):
+    """Books store, which appends changes to the log instead of rewriting books.txt ."""
+
+    def __init__(self,
+                 path: str = BOOKS,
+                 log_path: str = BOOKS_LOG,
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        self.log = _OperationLog(log_path)
+        self.compact_threshold = compact_threshold
+        super().__init__(path)
+
+    def _load(self) -> Dict[str, Dict]:
+        books = super()._load()
+        for record in self.log.replay():
+            if record['op'] == 'put':
+                books[record['book']['code']] = Book(**record['book'])
+            else:
+                books.pop(record['code'], None)
+        return books
+
+    def _put(self, code: str):
+        self._log_record({'op': 'put', 'book': self.books[code].to_dict()})
+
+    def add(self, code: str, name: str, author: str, quantity: int):
+        self.books[code] = Book(code, name, author, quantity, quantity)
+        self._put(code)
+
+    def delete(self, code: str):
+        del self.books[code]
+        self._log_record({'op': 'delete', 'code': code})
+
+    def change_available_quantity(self, code: str, change: int):
+        self.books[code].available_quantity += change
+        self._put(code)
+
+
+class WalUserStore(_LoggedStore, UserStore):
+    """Users store, which appends changes to the log instead of rewriting users.json ."""
+
+    def __init__(self,
+                 path: str = USERS,
+                 log_path: str = USERS_LOG,
+                 compact_threshold: int = COMPACT_THRESHOLD):
+        self.log = _OperationLog(log_path)
+        self.compact_threshold = compact_threshold
+        super().__init__(path)
+
+    def _load(self) -> Dict[str, Dict[str, int]]:
+        users = super()._load()
+        for record in self.log.replay():
+            if record['op'] == 'put':
+                users[record['code']] = _parse_loans(record['books'])
+            elif record['op'] == 'loan':
+                loans = users.get(record['code'])
+                if loans is None:
+                    continue
+                if record['count']:
+                    loans[record['book']] = record['count']
+                else:
+                    loans.pop(record['book'], None)
+            else:
+                users.pop(record['code'], None)
+        return users
+
+    def _put_loan(self, user_code: str, book_code: str):
+        """Logs the new number of copies of the book at the user, not all user's books."""
+        count = self.users[user_code].get(book_code, 0)
+        self._log_record({'op': 'loan', 'code': user_code, 'book': book_code, 'count': count})
+
+    def add(self, code: str):
+        self.users[code] = {}
+        self._log_record({'op': 'put', 'code': code, 'books': {}})
+
+    def delete(self, code: str):
+        del self.users[code]
+        self._log_record({'op': 'delete', 'code': code})
+
+    def add_loan(self, user_code: str, book_code: str):
+        loans = self.users[user_code]
+        loans[book_code] = loans.get(book_code, 0) + 1
+        self._put_loan(user_code, book_code)
+
+    def remove_loan(self, user_code: str, book_code: str):
+        loans = self.users[user_code]
+        if loans[book_code] == 1:
+            del loans[book_code]
+        else:
+            loans[book_code] -= 1
+        self._put_loan(user_code, book_code)
+
+
+def fold_logs(books_path: str = BOOKS, books_log_path: str = BOOKS_LOG, users_path: str = USERS,
+              users_log_path: str = USERS_LOG):
+    """
+    Compacts logs, which are not empty, into books.txt and users.json, so that stores, which do not
+    read the logs, get all changes and do not overwrite them.
+    """
+    for store_class, path, log_path in ((WalBookStore, books_path, books_log_path),
+                                        (WalUserStore, users_path, users_log_path)):
+        if os.path.exists(log_path) and os.path.getsize(log_path):
+            store = store_class(path, log_path)
+            with store.locked():
+                store.refresh()
+                store.compact()
@@ -0,0 +1,128 @@
+"""
+Stand-in client of the HTTP service started with `python app.py --o serve_http`. It sends one
+operation with the same arguments as app.py:
+
+    python http_client.py --o get_book_from_library --user "user_code" --book "book_code"
+
+or sends operations of the workload file (see tools/workload.py) over many concurrent connections
+and reports throughput and latency:
+
+    python http_client.py --load workload.jsonl --connections 2000
+
+Leading add_book and add_user operations of the workload are sent first over one connection, the
+rest is divided between connections, each of them sends its requests one after another.
+"""
+import asyncio
+import json
+import sys
+import time
+from pprint import pprint
+from typing import Dict, List, Tuple
+
+from app import ARGUMENTS, parser
+from http_service import raise_open_files_limit
+
+SETUP_OPERATIONS = ('add_book', 'add_user')
+
+
+async def _send(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                request: Dict) -> Tuple[int, Dict]:
+    """Sends one request over the open connection and returns its status and response."""
+    body = json.dumps(request).encode()
+    writer.write(f'POST / HTTP/1.1\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+
+    status_line = (await reader.readline()).split()
+    if len(status_line) < 2:
+        raise ConnectionError('The service has closed the connection without a response.')
+    status = int(status_line[1])
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if not header.strip():
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+
+async def send(request: Dict, host: str, port: int) -> Dict:
+    """Sends one request to the service and returns its response."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await _send(reader, writer, request))[1]
+    finally:
+        writer.close()
+
+
+async def _run_connection(host: str, port: int, requests: List[Dict],
+                          latencies: List[float]) -> int:
+    """Sends requests over one connection, returns the number of failed ones."""
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+    try:
+        for request in requests:
+            start = time.perf_counter()
+            status, _ = await _send(reader, writer, request)
+            latencies.append(time.perf_counter() - start)
+            errors += status != 200
+    finally:
+        writer.close()
+    return errors
+
+
+async def load(path: str, host: str, port: int, connections: int) -> Dict:
+    """Sends operations of the workload file and returns the report."""
+    with open(path, 'r') as in_file:
+        requests = [json.loads(line) for line in in_file if line.strip()]
+    setup = 0
+    while setup < len(requests) and requests[setup].get('o') in SETUP_OPERATIONS:
+        setup += 1
+
+    setup_errors = await _run_connection(host, port, requests[:setup], [])
+    latencies = []
+    start = time.perf_counter()
+    errors = await asyncio.gather(*(
+        _run_connection(host, port, requests[setup + i::connections], latencies)
+        for i in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'connections': connections,
+        'setup_requests': setup,
+        'setup_errors': setup_errors,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        **{f'p{q}_ms': round(latencies[min(len(latencies) - 1, len(latencies) * q // 100)] * 1000,
+                             3) if latencies else None
+           for q in (50, 90, 99)},
+    }
+
+
+if __name__ == '__main__':
+    parser.add_argument('--load', type=str,
+                        help='Workload file with operations in json lines to send concurrently.')
+    parser.add_argument('--connections', type=int, default=100,
+                        help='Number of concurrent connections, which send the workload.')
+    args = parser.parse_args()
+
+    if args.load:
+        raise_open_files_limit()
+        print(json.dumps(asyncio.run(load(args.load, args.host, args.port, args.connections))))
+        sys.exit()
+    if args.o in ('serve', 'serve_http'):
+        parser.error(f'{args.o} operation can not be sent to the service.')
+
+    response = asyncio.run(send({key: getattr(args, key) for key in ('o',) + ARGUMENTS},
+                                args.host, args.port))
+
+    print(response['output'], end='')
+    if response['error']:
+        sys.exit(f'Error: {response["error"]}')
+    if response['result'] is not None:
+        pprint(response['result'])
@@ -0,0 +1,318 @@
+"""
+HTTP/JSON service of the library for many concurrent clients (kiosks, desks, web front end). It
+is started with `python app.py --o serve_http --port 8080` and keeps books and users stores in
+memory, like the Unix socket process of daemon.py, but it serves all connections in one asyncio
+event loop, so thousands of open connections cost only their sockets.
+
+Requests are `POST /` with the same json object as requests of daemon.py:
+
+    {"o": "get_book_from_library", "user": "aaaaaa", "book": "a1254"}
+
+or `GET /?o=find_book&book=a1254` with arguments in the query. The response body is the json
+object with the operation result, everything it printed and the error message; its status is 200
+or 400, if the operation has failed. Connections are kept alive, unless the client asks to close.
+
+Reads are executed as soon as they arrive, from the data in memory, in the reader thread: a read
+could reload the store changed by another process or build the search index, and the event loop
+must not wait for it. Writes are put into one queue
+and executed by the writer in the order of arrival, so writes of the same book (or user) are never
+interleaved. The stores rewrite whole files, so writes of different books can not run in parallel
+either; instead, all writes, which have been queued while the previous batch was written, are
+executed as one batch: the stores are locked once, transactions of the batch are committed
+together with one fsync (see database/transactions.py) and only then their responses are sent.
+
+The writer runs in its own thread, so waiting for the locks of other processes and the commit
+with its fsyncs do not stop the event loop. One request at a time is executed in memory: reads
+and writes of the batch take turns on the service mutex, so reads see changes of the batch before
+they are committed. While the batch is written, stores are deferred and reads do not refresh them.
+
+If the commit of the batch fails, stores are loaded again and transactions of the journal are
+applied, as after a crash (see `transactions.abort`). Each request is answered with its real
+outcome: checkouts and returns, which have reached the journal, are committed, other writes are
+committed, if their store has been written before the error.
+"""
+import asyncio
+import json
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+from app import handle_request
+from database import bloom, completion, search, transactions
+from database.books import get_store as get_books_store
+from database.users import get_store as get_users_store
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TRANSACTION_OPERATIONS = {'get_book_from_library', 'return_book_to_library'}
+BOOKS_OPERATIONS = {'add_book', 'delete_book', 'import_books'}
+USERS_OPERATIONS = {'add_user', 'delete_user'}
+WRITE_OPERATIONS = TRANSACTION_OPERATIONS | BOOKS_OPERATIONS | USERS_OPERATIONS
+# reconcile_catalogue reads books.txt under its own lock, which would wait for the writer, while
+# the writer waits for the mutex held by the read
+REJECTED_OPERATIONS = {'convert_books', 'convert_users', 'compact', 'convert_to_sqlite',
+                       'export_snapshot', 'reconcile_catalogue', 'serve', 'serve_http'}
+INT_ARGUMENTS = ('quantity', 'offset', 'limit', 'distance', 'shards')
+
+MAX_BATCH = 1000
+BACKLOG = 4096
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large'}
+
+
+class _BodyTooLarge(Exception):
+    """Raised when the request announces the body bigger than MAX_BODY."""
+
+
+def _error(message: str) -> Dict:
+    return {'result': None, 'output': '', 'error': message}
+
+
+class LibraryService:
+    """Executes requests of all connections: reads at once, writes by batches."""
+
+    def __init__(self, max_batch: int = MAX_BATCH):
+        self.max_batch = max_batch
+        self.writes = asyncio.Queue()
+        self.mutex = threading.Lock()
+        self.reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reader')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+
+    async def execute(self, request: Dict) -> Dict:
+        """Executes the operation and returns the response, writes wait for their batch."""
+        operation = request.get('o')
+        if not isinstance(operation, str):
+            return _error('Operation "o" must be a string.')
+        if operation in REJECTED_OPERATIONS:
+            return _error(f'Operation "{operation}" can not be executed by the service.')
+        if operation not in WRITE_OPERATIONS:
+            return await asyncio.get_running_loop().run_in_executor(self.reader, self._read,
+                                                                    request)
+
+        response = asyncio.get_running_loop().create_future()
+        await self.writes.put((request, response))
+        return await response
+
+    async def write_batches(self):
+        """Takes all queued writes and executes them as one batch, until it is cancelled."""
+        while True:
+            batch = [await self.writes.get()]
+            while len(batch) < self.max_batch and not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+
+            try:
+                responses = await asyncio.get_running_loop().run_in_executor(
+                    self.writer, self._write, [request for request, _ in batch])
+            except Exception as e:
+                # the batch is not committed, so none of its requests is done
+                responses = [_error(f'Changes are not written: {e}')] * len(batch)
+            for (_, response), result in zip(batch, responses):
+                if not response.done():
+                    response.set_result(result)
+
+    def _read(self, request: Dict) -> Dict:
+        """Executes the read request in the reader thread."""
+        with self.mutex:
+            return handle_request(request)
+
+    def _write(self, requests: List[Dict]) -> List[Dict]:
+        """
+        Executes write requests in the writer thread with locked and deferred stores, they are
+        committed together at the end of the batch.
+        """
+        books_store, users_store = get_books_store(), get_users_store()
+        responses = []
+        # stores are deferred before they are locked, so reads do not wait for the locks
+        with self.mutex:
+            books_store.deferred = users_store.deferred = True
+        try:
+            with books_store.locked(), users_store.locked():
+                with self.mutex:
+                    books_store.deferred = users_store.deferred = False
+                    books_store.refresh()
+                    users_store.refresh()
+                    books_store.deferred = users_store.deferred = True
+                try:
+                    with transactions.group():
+                        for request in requests:
+                            with self.mutex:
+                                responses.append(handle_request(request))
+                except Exception as e:
+                    with self.mutex:
+                        return _aborted(requests, responses, e)
+        finally:
+            with self.mutex:
+                books_store.deferred = users_store.deferred = False
+        return responses
+
+    def close(self):
+        """Waits for requests, which are being executed, it is called when the service stops."""
+        self.reader.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+    async def _respond(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        """Returns the status and the response of one HTTP request."""
+        path, _, query = target.partition('?')
+        if path != '/':
+            return 404, _error(f'There is nothing at {path}, send operations to "/".')
+
+        if method == 'GET':
+            request = dict(parse_qsl(query))
+            for key in INT_ARGUMENTS:
+                if key in request and request[key].isdigit():
+                    request[key] = int(request[key])
+        elif method == 'POST':
+            try:
+                request = json.loads(body)
+            except ValueError:
+                request = None
+            if not isinstance(request, dict):
+                return 400, _error('Request body must be a json object.')
+        else:
+            return 405, _error('Use GET or POST.')
+
+        response = await self.execute(request)
+        return (200 if response['error'] is None else 400), response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves HTTP requests of one connection until the client closes it."""
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    writer.write(_response(400, _error('Malformed HTTP request.'), False))
+                    break
+                except _BodyTooLarge:
+                    writer.write(_response(413, _error(f'Request body must not be bigger than '
+                                                       f'{MAX_BODY} bytes.'), False))
+                    break
+                if request is None:
+                    break
+
+                method, target, version, headers, body = request
+                status, response = await self._respond(method, target, body)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1'
+                                                             and connection != 'close')
+                writer.write(_response(status, response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def _aborted(requests: List[Dict], responses: List[Dict], error: Exception) -> List[Dict]:
+    """
+    Drops changes of the failed batch, which have not been written, and returns responses with
+    the real outcome of its requests. Indexes and filters, which could have got dropped changes,
+    are built again.
+    """
+    try:
+        books_written, users_written = transactions.abort()
+    except Exception as e:
+        return [_error(f'Changes could be written partially: {error}, and they are not recovered: '
+                       f'{e}')] * len(requests)
+    if not books_written:
+        search.reset_index()
+        completion.set_index(None)
+        bloom.reset_filters(bloom.store_filter_path(get_books_store()))
+    if not users_written:
+        bloom.reset_filters(bloom.store_filter_path(get_users_store()))
+
+    written = {operation: True for operation in TRANSACTION_OPERATIONS}
+    written.update({operation: books_written for operation in BOOKS_OPERATIONS})
+    written.update({operation: users_written for operation in USERS_OPERATIONS})
+    not_written = _error(f'Changes are not written: {error}')
+    return [response if response['error'] is not None or written[request['o']] else not_written
+            for request, response in zip(requests, responses)] + \
+        [not_written] * (len(requests) - len(responses))
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple or None:
+    """
+    Reads one HTTP request: returns its method, target, version, headers and body or None, if the
+    connection is closed. The body is not read, if its length is bigger than MAX_BODY.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, target, version = line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if not header.strip():
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise ValueError('Too many headers.')
+        name, _, value = header.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError('Negative content length.')
+    if length > MAX_BODY:
+        raise _BodyTooLarge
+    body = await reader.readexactly(length)
+    return method, target, version, headers, body
+
+
+def _response(status: int, response: Dict, keep_alive: bool) -> bytes:
+    """Returns HTTP response with the json body."""
+    body = json.dumps(response, default=str).encode()
+    return (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n').encode() + body
+
+
+def raise_open_files_limit():
+    """Raises the limit of open files up to the hard one, every connection is an open file."""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    limit = hard if hard != resource.RLIM_INFINITY else max(soft, 65536)
+    if soft != resource.RLIM_INFINITY and soft < limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def _interrupt(signum, frame):
+    """Signal handler, which stops the service in the same way as Ctrl+C does."""
+    raise KeyboardInterrupt
+
+
+async def _serve(host: str, port: int):
+    service = LibraryService()
+    writer = asyncio.create_task(service.write_batches())
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=BACKLOG)
+    print(f'Serving on http://{host}:{port}.', flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        writer.cancel()
+        service.close()
+
+
+def serve(host: str, port: int):
+    """Serves HTTP requests on the given address until the process is interrupted or terminated."""
+    signal.signal(signal.SIGTERM, _interrupt)
+    raise_open_files_limit()
+    try:
+        asyncio.run(_serve(host, port))
+    except KeyboardInterrupt:
+        pass
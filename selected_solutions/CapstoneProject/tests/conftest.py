@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import bloom, books, completion, holders, search, transactions, users  # noqa: E402
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """
+    Runs the test in the empty temporary directory with the database directory, like app.py runs
+    in the project one. Stores, indexes and filters of the previous test are dropped.
+    """
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('database')
+    books.create_books_data()
+    users.create_users_data()
+    books.set_store(None)
+    users.set_store(None)
+    search.set_index(None)
+    completion.set_index(None)
+    holders.set_index(None)
+    bloom._filters.clear()
+    transactions._pending.clear()
+    yield tmp_path
+    books.set_store(None)
+    users.set_store(None)
@@ -0,0 +1,60 @@
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database.binary_snapshot import BOOKS_SNAPSHOT, BinaryBookStore, export_snapshot
+from database.books import BookStore
+
+CODES = ['c1234', 'a1234', 'b5678', 'a0000']
+
+
+@pytest.fixture
+def snapshot(library):
+    for i, code in enumerate(CODES, start=1):
+        handle_request({'o': 'add_book', 'book': code, 'name': f'Name{code}', 'author': 'Author',
+                        'quantity': i})
+    handle_request({'o': 'export_snapshot'})
+    return BinaryBookStore()
+
+
+def test_books_are_found_by_their_codes(snapshot):
+    for book in BookStore().all():
+        assert snapshot.find(book['code']) == book
+    assert snapshot.find('a1233') == {}
+    assert snapshot.find('zzzzz') == {}
+    assert snapshot.find('a123') == {}
+    assert [book['code'] for book in snapshot.all()] == sorted(CODES)
+
+
+def test_changes_are_rejected(snapshot):
+    setup_stores(parser.parse_args(['--o', 'find_book', '--books-format', 'snapshot']))
+
+    response = handle_request({'o': 'add_book', 'book': 'd1234', 'name': 'Name',
+                               'author': 'Author', 'quantity': 1})
+    assert response['error'].startswith('Books snapshot is read-only')
+    assert handle_request({'o': 'find_book', 'book': 'd1234'})['result'] == {}
+    assert handle_request({'o': 'find_book', 'book': 'b5678'})['result']['quantity'] == 3
+
+
+def test_store_maps_new_export_on_refresh(snapshot):
+    books = snapshot.all()
+    export_snapshot(books + [{'code': 'd1234', 'name': 'New', 'author': 'Author', 'quantity': 1,
+                              'available_quantity': 1}])
+    assert snapshot.find('d1234') == {}
+
+    snapshot.refresh()
+
+    assert snapshot.find('d1234')['name'] == 'New'
+    assert snapshot.all()[:len(books)] == books
+
+
+def test_empty_snapshot_has_no_books(library):
+    export_snapshot([])
+    assert BinaryBookStore().all() == []
+    assert BinaryBookStore().find('a1234') == {}
+
+
+def test_other_files_are_rejected(library):
+    with open(BOOKS_SNAPSHOT, 'wb') as out_file:
+        out_file.write(b'not a snapshot')
+    with pytest.raises(ValueError, match='is not a books snapshot'):
+        BinaryBookStore()
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database import bloom, books, users
+from database.books import BookStore, add_book, get_store as get_books_store
+from database.locking import ConflictError
+
+
+def _run(*store_args: str):
+    """Chooses stores like a new process of app.py with the given arguments."""
+    books.set_store(None)
+    users.set_store(None)
+    bloom._filters.clear()
+    setup_stores(parser.parse_args(['--o', 'find_book', *store_args]))
+
+
+def _filter_state(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def test_filter_finds_added_codes_and_drops_deleted_ones(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+
+    assert books._filter().might_contain('a1234')
+    assert users._filter().might_contain('user01')
+    handle_request({'o': 'delete_book', 'book': 'a1234'})
+    assert not books._filter().might_contain('a1234')
+    assert handle_request({'o': 'find_book', 'book': 'a1234'})['result'] == {}
+
+
+def test_each_store_format_has_its_own_filter(library):
+    _run()
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    handle_request({'o': 'convert_books'})
+    handle_request({'o': 'export_snapshot'})
+    handle_request({'o': 'convert_to_sqlite'})
+    text_filter = _filter_state('database/books.txt.bloom')
+
+    for store_args in (['--books-format', 'fixed'], ['--books-format', 'snapshot'], ['--wal'],
+                       ['--backend', 'sqlite'], []):
+        _run(*store_args)
+        response = handle_request({'o': 'find_book', 'book': 'a1234'})
+        assert response['result']['code'] == 'a1234', store_args
+
+    assert _filter_state('database/books.txt.bloom') == text_filter
+    assert os.path.exists('database/books.dat.bloom')
+    assert os.path.exists('database/books.snapshot.bloom')
+    assert os.path.exists('database/library.db.books.bloom')
+
+
+def test_export_snapshot_keeps_filter_of_books(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    text_filter = _filter_state('database/books.txt.bloom')
+
+    handle_request({'o': 'export_snapshot'})
+
+    assert _filter_state('database/books.txt.bloom') == text_filter
+
+
+def test_export_snapshot_drops_outdated_filter_of_snapshot(library):
+    handle_request({'o': 'export_snapshot'})
+    _run('--books-format', 'snapshot')
+    assert handle_request({'o': 'find_book', 'book': 'a1234'})['result'] == {}
+
+    _run()
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    handle_request({'o': 'export_snapshot'})
+    _run('--books-format', 'snapshot')
+    assert handle_request({'o': 'find_book', 'book': 'a1234'})['result']['code'] == 'a1234'
+
+
+def test_failed_add_leaves_no_counters(library, monkeypatch):
+    add_book('a1234', 'Name', 'Author', 1)
+    counters = bytes(books._filter().data)
+
+    def failing(*args):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(get_books_store(), 'add', failing)
+    with pytest.raises(OSError):
+        add_book('b1234', 'Other', 'Author', 1)
+
+    assert bytes(books._filter().data) == counters
+
+
+def test_retried_add_raises_counters_once(library):
+    add_book('a1234', 'Name', 'Author', 1)
+    counters = bytes(books._filter().data)
+    store = get_books_store()
+    add = store.add
+    conflicts = []
+
+    def conflicting(*args):
+        if not conflicts:
+            conflicts.append(args)
+            BookStore().add('c1234', 'Third', 'Author', 1)
+            raise ConflictError('books.txt is changed by another process.')
+        add(*args)
+
+    store.add = conflicting
+    add_book('b1234', 'Other', 'Author', 1)
+
+    assert conflicts
+    after_retry = bytes(books._filter().data)
+    books._filter().remove('b1234')
+    assert bytes(books._filter().data) == counters
+    assert after_retry != counters
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import handle_request
+from database.completion import MAX_DISTANCE, complete_books, find_near_books
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+@pytest.fixture
+def books(library):
+    for code in ('a1234', 'a1235', 'b1234'):
+        handle_request({'o': 'add_book', 'book': code, 'name': f'Name{code}', 'author': 'Author',
+                        'quantity': 1})
+
+
+def test_distance_zero_finds_only_the_code(books):
+    assert [book['code'] for book in find_near_books('a1234', 0)] == ['a1234']
+    response = handle_request({'o': 'find_near_books', 'book': 'a1234', 'distance': 0})
+    assert [book['code'] for book in response['result']] == ['a1234']
+
+
+@pytest.mark.parametrize('code, distance', [
+    (None, 1), ('', 1), ('a1234', -1), ('a1234', '1'), ('a1234', MAX_DISTANCE + 1),
+])
+def test_invalid_arguments_are_rejected(books, code, distance):
+    with pytest.raises(ValueError):
+        find_near_books(code, distance)
+    response = handle_request({'o': 'find_near_books', 'book': code, 'distance': distance})
+    assert response['error'] is not None
+
+
+def _codes(found: list) -> list:
+    return [book['code'] for book in found]
+
+
+def test_prefix_completes_codes_before_names(books):
+    handle_request({'o': 'add_book', 'book': 'n0000', 'name': 'Other', 'author': 'Author',
+                    'quantity': 1})
+
+    assert _codes(complete_books('a123')) == ['a1234', 'a1235']
+    assert _codes(complete_books('NameA')) == ['a1234', 'a1235']
+    assert _codes(complete_books('n')) == ['n0000', 'a1234', 'a1235', 'b1234']
+    assert _codes(complete_books('n', limit=2)) == ['n0000', 'a1234']
+    assert _codes(complete_books('z')) == []
+
+
+def test_near_codes_are_ordered_by_distance(books):
+    assert _codes(find_near_books('a1234', 1)) == ['a1234', 'a1235', 'b1234']
+    assert _codes(find_near_books('a12', 1)) == []
+    assert _codes(find_near_books('a12', 2)) == ['a1234', 'a1235']
+    assert _codes(find_near_books('x1235', 1)) == ['a1235']
+    assert _codes(find_near_books('x1236', 2)) == ['a1234', 'a1235', 'b1234']
+
+
+def test_index_follows_adds_and_deletes(books):
+    assert _codes(complete_books('b')) == ['b1234']
+    handle_request({'o': 'delete_book', 'book': 'b1234'})
+    handle_request({'o': 'add_book', 'book': 'b5678', 'name': 'Other', 'author': 'Author',
+                    'quantity': 1})
+
+    assert _codes(complete_books('b')) == ['b5678']
+    assert _codes(find_near_books('b1234', 0)) == []
+
+
+def test_books_added_by_other_process_are_completed(books):
+    assert _codes(complete_books('c')) == []
+    subprocess.run([sys.executable, APP, '--o', 'add_book', '--book', 'c1234', '--name', 'Other',
+                    '--author', 'Author', '--quantity', '1'], check=True, capture_output=True)
+
+    assert _codes(complete_books('c')) == ['c1234']
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database.books import BookStore, get_store
+from database.fixed_width import (AVAILABLE_OFFSET, BOOKS_FIXED, CODE_WIDTH, QUANTITY_WIDTH,
+                                  RECORD_SIZE, FixedWidthBookStore)
+
+
+@pytest.fixture
+def store(library):
+    setup_stores(parser.parse_args(['--o', 'find_book', '--books-format', 'fixed']))
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 3})
+    return get_store()
+
+
+def test_too_big_quantity_is_rejected(store):
+    response = handle_request({'o': 'add_book', 'book': 'b1234', 'name': 'Other',
+                               'author': 'Author', 'quantity': 10 ** 10})
+
+    assert response['error'] == 'Book quantity must fit into 10 digits in fixed-width format.'
+    assert os.path.getsize(BOOKS_FIXED) == RECORD_SIZE
+    assert handle_request({'o': 'find_book', 'book': 'b1234'})['result'] == {}
+    assert [book['code'] for book in FixedWidthBookStore().all()] == ['a1234']
+
+
+def test_too_big_available_quantity_is_rejected(store):
+    with pytest.raises(ValueError, match='available quantity must fit'):
+        store.change_available_quantity('a1234', 10 ** 10)
+
+    assert store.find('a1234')['available_quantity'] == 3
+    assert FixedWidthBookStore().find('a1234')['available_quantity'] == 3
+
+
+def _read_file() -> bytes:
+    with open(BOOKS_FIXED, 'rb') as in_file:
+        return in_file.read()
+
+
+@pytest.fixture
+def three_books(store):
+    for code in ('b1234', 'c1234'):
+        handle_request({'o': 'add_book', 'book': code, 'name': 'Other', 'author': 'Author',
+                        'quantity': 3})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    return store
+
+
+def test_checkout_rewrites_only_available_quantity(three_books):
+    before = _read_file()
+    handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'b1234'})
+    after = _read_file()
+
+    start = RECORD_SIZE + AVAILABLE_OFFSET
+    assert len(after) == len(before) == 3 * RECORD_SIZE
+    assert after[:start] == before[:start]
+    assert after[start:start + QUANTITY_WIDTH] == b'2'.rjust(QUANTITY_WIDTH)
+    assert after[start + QUANTITY_WIDTH:] == before[start + QUANTITY_WIDTH:]
+
+
+def test_delete_moves_last_record_into_its_place(three_books):
+    before = _read_file()
+    handle_request({'o': 'delete_book', 'book': 'a1234'})
+
+    assert _read_file() == before[2 * RECORD_SIZE:] + before[RECORD_SIZE:2 * RECORD_SIZE]
+    assert [book['code'] for book in FixedWidthBookStore().all()] == ['c1234', 'b1234']
+
+
+def test_flush_writes_only_changed_records(three_books):
+    three_books.deferred = True
+    three_books.change_available_quantity('c1234', -1)
+    # a record, which is not changed in the store, is not written by flush
+    with open(BOOKS_FIXED, 'r+b') as out_file:
+        out_file.seek(RECORD_SIZE + CODE_WIDTH)
+        out_file.write(b'Marker')
+    three_books.flush()
+
+    books = {book['code']: book for book in FixedWidthBookStore().all()}
+    assert books['b1234']['name'] == 'Marker'
+    assert books['c1234']['available_quantity'] == 2
+
+
+def test_text_books_are_converted(library):
+    for code in ('a1234', 'b1234'):
+        handle_request({'o': 'add_book', 'book': code, 'name': f'Name{code}', 'author': 'Author',
+                        'quantity': 2})
+
+    handle_request({'o': 'convert_books'})
+
+    assert FixedWidthBookStore().all() == BookStore().all()
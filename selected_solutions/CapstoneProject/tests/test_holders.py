@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import handle_request
+from database import holders
+from database.holders import INDEX, HoldersIndex, get_book_holders
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+@pytest.fixture
+def loans(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 5})
+    for user in ('user01', 'user02'):
+        handle_request({'o': 'add_user', 'user': user})
+    for user in ('user01', 'user01', 'user02'):
+        handle_request({'o': 'get_book_from_library', 'user': user, 'book': 'a1234'})
+
+
+def test_holders_follow_checkouts_and_returns(loans):
+    assert get_book_holders('a1234') == {'user01': 2, 'user02': 1}
+    assert get_book_holders('b1234') == {}
+
+    handle_request({'o': 'return_book_to_library', 'user': 'user02', 'book': 'a1234'})
+    handle_request({'o': 'return_book_to_library', 'user': 'user01', 'book': 'a1234'})
+    assert handle_request({'o': 'get_book_holders', 'book': 'a1234'})['result'] == {'user01': 1}
+
+
+def test_held_book_is_not_deleted(loans):
+    response = handle_request({'o': 'delete_book', 'book': 'a1234'})
+    assert response['error'] == 'There are users, who have not returned books.'
+
+
+def test_missing_index_is_built_from_users(loans):
+    holders.set_index(None)
+    os.remove(INDEX)
+    os.remove(INDEX + '.log')
+
+    assert get_book_holders('a1234') == {'user01': 2, 'user02': 1}
+    assert os.path.exists(INDEX)
+
+
+def test_checkouts_of_other_process_are_read(loans):
+    assert get_book_holders('a1234') == {'user01': 2, 'user02': 1}
+    subprocess.run([sys.executable, APP, '--o', 'return_book_to_library', '--user', 'user01',
+                    '--book', 'a1234'], check=True, capture_output=True)
+
+    assert get_book_holders('a1234') == {'user01': 1, 'user02': 1}
+
+
+def test_index_is_loaded_again_after_compaction(loans, monkeypatch):
+    assert get_book_holders('a1234') == {'user01': 2, 'user02': 1}
+    monkeypatch.setattr(holders, 'COMPACT_THRESHOLD', 1)
+    # another process compacts the index into a new file
+    HoldersIndex().load(()).update([('a1234', 'user02', 0), ('b1234', 'user02', 1)])
+
+    assert os.path.getsize(INDEX + '.log') == 0
+    assert get_book_holders('a1234') == {'user01': 2}
+    assert get_book_holders('b1234') == {'user02': 1}
@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import pytest
+
+import http_client
+from app import handle_request, parser, setup_stores
+from database import transactions
+from database.books import get_store as get_books_store
+from database.transactions import JOURNAL
+from database.users import get_store as get_users_store
+from http_service import LibraryService
+
+STORE_ARGS = {'files': [], 'wal': ['--wal'], 'sqlite': ['--backend', 'sqlite']}
+
+
+@pytest.fixture(params=list(STORE_ARGS))
+def service(library, request):
+    setup_stores(parser.parse_args(['--o', 'find_book', *STORE_ARGS[request.param]]))
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 2})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    service = LibraryService()
+    service.backend = request.param
+    yield service
+    service.close()
+
+
+def _fail_once(monkeypatch, target, name: str):
+    function = getattr(target, name)
+
+    def failing(*args, **kwargs):
+        monkeypatch.setattr(target, name, function)
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(target, name, failing)
+
+
+def _written(store) -> list:
+    """Returns data of the store, which is written to disk."""
+    store.reload()
+    return store.all()
+
+
+BATCH = [
+    {'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'},
+    {'o': 'add_book', 'book': 'b1234', 'name': 'Other', 'author': 'Author', 'quantity': 1},
+    {'o': 'add_user', 'user': 'user02'},
+]
+
+
+def test_failed_users_flush_answers_real_outcome(service, monkeypatch):
+    _fail_once(monkeypatch, get_users_store(), 'flush')
+
+    responses = service._write(BATCH)
+
+    # the checkout is recovered from the journal, books have been written before the error and
+    # SQLite has committed changes of users together with them
+    assert [response['error'] for response in responses[:2]] == [None, None]
+    if service.backend == 'sqlite':
+        assert responses[2]['error'] is None
+        assert _written(get_users_store()) == {'user01': ['a1234'], 'user02': []}
+    else:
+        assert responses[2]['error'].startswith('Changes are not written: No space left')
+        assert _written(get_users_store()) == {'user01': ['a1234']}
+    assert {book['code']: book['available_quantity'] for book in _written(get_books_store())} \
+        == {'a1234': 1, 'b1234': 1}
+    assert not transactions._pending
+    with open(JOURNAL, 'r') as in_file:
+        assert in_file.read() == ''
+
+
+def test_failed_books_flush_drops_unwritten_changes(service, monkeypatch):
+    _fail_once(monkeypatch, get_books_store(), 'flush')
+
+    responses = service._write(BATCH)
+
+    assert responses[0]['error'] is None
+    assert [response['error'][:25] for response in responses[1:]] == \
+        ['Changes are not written: '] * 2
+    assert handle_request({'o': 'find_book', 'book': 'b1234'})['result'] == {}
+    assert _written(get_users_store()) == {'user01': ['a1234']}
+
+    # the next batch does not write dropped changes
+    assert service._write([{'o': 'add_user', 'user': 'user03'}])[0]['error'] is None
+    assert sorted(_written(get_users_store())) == ['user01', 'user03']
+    assert [book['code'] for book in _written(get_books_store())] == ['a1234']
+
+
+def test_dropped_delete_keeps_book_found(service, monkeypatch):
+    handle_request({'o': 'search_books', 'query': 'name'})
+    _fail_once(monkeypatch, get_books_store(), 'flush')
+
+    responses = service._write([{'o': 'delete_book', 'book': 'a1234'}])
+
+    assert responses[0]['error'].startswith('Changes are not written: ')
+    assert handle_request({'o': 'find_book', 'book': 'a1234'})['result']['code'] == 'a1234'
+    assert [book['code'] for book in
+            handle_request({'o': 'search_books', 'query': 'name'})['result']] == ['a1234']
+    assert handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                           'quantity': 1})['error'] == 'Book already in library.'
+
+
+def test_client_raises_connection_error_when_service_closes(library):
+    async def closing(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.readline()
+        writer.close()
+
+    async def send_to_closing_service():
+        server = await asyncio.start_server(closing, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await http_client.send({'o': 'find_book', 'book': 'a1234'}, '127.0.0.1', port)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(send_to_closing_service())
+
+
+def _run_served(service, client):
+    """Runs the coroutine function client(port) against the service listening on a free port."""
+    async def run():
+        writer = asyncio.create_task(service.write_batches())
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        try:
+            async with server:
+                return await client(server.sockets[0].getsockname()[1])
+        finally:
+            writer.cancel()
+    return asyncio.run(run())
+
+
+async def _http(port: int, request: bytes) -> tuple:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(request)
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (header := await reader.readline()).strip():
+            name, _, value = header.decode().partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+    finally:
+        writer.close()
+
+
+def test_concurrent_checkouts_do_not_overbook(service):
+    users = [f'user{i:02d}' for i in range(2, 12)]
+    for user in users:
+        handle_request({'o': 'add_user', 'user': user})
+
+    async def checkouts(port: int) -> list:
+        return await asyncio.gather(*(
+            http_client.send({'o': 'get_book_from_library', 'user': user, 'book': 'a1234'},
+                             '127.0.0.1', port) for user in users))
+
+    responses = _run_served(service, checkouts)
+
+    holders = sorted(user for user, response in zip(users, responses) if response['error'] is None)
+    assert len(holders) == 2
+    assert {response['error'] for response in responses} == \
+        {None, 'Sorry there is no available book at this moment.'}
+    assert _written(get_books_store())[0]['available_quantity'] == 0
+    assert sorted(user for user, books in _written(get_users_store()).items() if books) == holders
+
+
+def test_get_query_arguments_are_converted(service):
+    async def get(port: int) -> tuple:
+        return await _http(port, b'GET /?o=find_near_books&book=a1235&distance=1 HTTP/1.1\r\n'
+                                 b'Connection: close\r\n\r\n')
+
+    status, response = _run_served(service, get)
+    assert status == 200
+    assert [book['code'] for book in response['result']] == ['a1234']
+
+
+@pytest.mark.parametrize('request_bytes, status, error', [
+    (b'POST / HTTP/1.1\r\nContent-Length: 36\r\n\r\n{"o": "reconcile_catalogue", "x": 1}', 400,
+     'Operation "reconcile_catalogue" can not be executed by the service.'),
+    (b'POST / HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]', 400, 'Request body must be a json object.'),
+    (b'GET /books HTTP/1.1\r\n\r\n', 404, 'There is nothing at /books, send operations to "/".'),
+    (b'DELETE / HTTP/1.1\r\n\r\n', 405, 'Use GET or POST.'),
+    (b'POST / HTTP/1.1\r\nContent-Length: 1048577\r\n\r\n', 413,
+     'Request body must not be bigger than 1048576 bytes.'),
+])
+def test_invalid_requests_are_answered_with_errors(service, request_bytes, status, error):
+    async def send(port: int) -> tuple:
+        return await _http(port, request_bytes)
+
+    assert _run_served(service, send) == (status, {'result': None, 'output': '', 'error': error})
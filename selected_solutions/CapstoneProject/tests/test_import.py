@@ -0,0 +1,61 @@
+import csv
+
+import pytest
+
+from app import handle_request
+from database.books import BookStore, find_book, get_store, import_books
+
+
+@pytest.fixture
+def books(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+
+
+def _write_csv(rows: list) -> str:
+    with open('import.csv', 'w', newline='') as out_file:
+        csv.writer(out_file).writerows(rows)
+    return 'import.csv'
+
+
+def test_valid_rows_are_imported_with_one_write(books):
+    path = _write_csv([['code', 'name', 'author', 'quantity'],
+                       ['b1234', 'Other', 'Author', '2'],
+                       ['c1234', 'Third', 'Author', '3']])
+    version = get_store().version
+
+    assert import_books(path) == {'imported': 2, 'rejected': []}
+    assert get_store().version == version + 1
+    assert find_book('c1234')['available_quantity'] == 3
+    assert [book['code'] for book in BookStore().all()] == ['a1234', 'b1234', 'c1234']
+
+
+def test_invalid_rows_are_rejected_with_line_numbers(books):
+    path = _write_csv([['b1234', 'Other', 'Author', '2'],
+                       ['a1234', 'Name', 'Author', '1'],
+                       ['b1234', 'Copy', 'Author', '1'],
+                       ['c1234', 'Third', 'Author', 'many'],
+                       ['d12', 'Short', 'Author', '1'],
+                       ['e1234', 'Fifth']])
+
+    result = import_books(path)
+
+    assert result['imported'] == 1
+    assert result['rejected'] == [
+        {'line': 2, 'error': 'Book already in library.'},
+        {'line': 3, 'error': 'Duplicate code in CSV (row 1).'},
+        {'line': 4, 'error': 'Book quantity must be positive integer.'},
+        {'line': 5, 'error': 'Book code must be a string with length 5.'},
+        {'line': 6, 'error': 'Row must contain code, name, author and quantity.'},
+    ]
+    assert [book['code'] for book in BookStore().all()] == ['a1234', 'b1234']
+
+
+def test_import_of_only_rejected_rows_changes_nothing(books):
+    path = _write_csv([['a1234', 'Name', 'Author', '1']])
+
+    response = handle_request({'o': 'import_books', 'csv': path})
+
+    assert response['result']['imported'] == 0
+    assert response['output'] == '0 books are imported, 1 rows are rejected.\n'
+    assert [book['code'] for book in BookStore().all()] == ['a1234']
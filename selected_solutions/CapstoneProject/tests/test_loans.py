@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from app import handle_request
+from database.users import USERS, UserStore
+
+
+@pytest.fixture
+def loans(library):
+    for code in ('a1234', 'b1234'):
+        handle_request({'o': 'add_book', 'book': code, 'name': 'Name', 'author': 'Author',
+                        'quantity': 3})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    for code in ('a1234', 'b1234', 'a1234'):
+        handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': code})
+
+
+def _read_users() -> dict:
+    with open(USERS) as in_file:
+        return json.load(in_file)
+
+
+def test_copies_are_counted(loans):
+    assert _read_users() == {'user01': {'a1234': 2, 'b1234': 1}}
+    assert sorted(handle_request({'o': 'get_user_books', 'user': 'user01'})['result']) == \
+        ['a1234', 'a1234', 'b1234']
+
+
+def test_return_removes_one_copy(loans):
+    handle_request({'o': 'return_book_to_library', 'user': 'user01', 'book': 'a1234'})
+    handle_request({'o': 'return_book_to_library', 'user': 'user01', 'book': 'b1234'})
+
+    assert _read_users() == {'user01': {'a1234': 1}}
+    response = handle_request({'o': 'return_book_to_library', 'user': 'user01', 'book': 'b1234'})
+    assert response['error'] == 'The user with code="user01" does not have the book with ' \
+                                'code="b1234".'
+
+
+def test_user_with_books_is_not_deleted(loans):
+    response = handle_request({'o': 'delete_user', 'user': 'user01'})
+    assert response['error'] == 'User has not returned books.'
+
+
+def test_lists_of_old_files_are_read(library):
+    with open(USERS, 'w') as out_file:
+        json.dump({'user01': ['a1234', 'b1234', 'a1234'], 'user02': []}, out_file)
+
+    store = UserStore()
+    assert store.loan_count('user01', 'a1234') == 2
+    assert store.loan_count('user02', 'a1234') == 0
+    assert store.loan_count('user03', 'a1234') is None
+
+    store.remove_loan('user01', 'a1234')
+    assert _read_users() == {'user01': {'a1234': 1, 'b1234': 1}, 'user02': {}}
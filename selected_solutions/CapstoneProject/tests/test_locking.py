@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from database import locking
+from database.books import BookStore, add_book, get_store, set_store
+from database.locking import ConflictError, optimistic
+
+
+def test_write_of_outdated_store_raises_conflict(library):
+    store, other = BookStore(), BookStore()
+    other.add('a1234', 'Name', 'Author', 1)
+
+    with pytest.raises(ConflictError):
+        store.add('b1234', 'Other', 'Author', 1)
+    assert [book['code'] for book in BookStore().all()] == ['a1234']
+
+
+def test_optimistic_retries_after_conflict(library):
+    set_store(BookStore())
+    calls = []
+
+    @optimistic(get_store)
+    def add(code: str):
+        calls.append(code)
+        if len(calls) == 1:
+            # another process writes the file after the store has been refreshed
+            BookStore().add('a1234', 'Name', 'Author', 1)
+        get_store().add(code, 'Other', 'Author', 1)
+
+    add('b1234')
+
+    assert calls == ['b1234', 'b1234']
+    assert sorted(book['code'] for book in BookStore().all()) == ['a1234', 'b1234']
+
+
+def test_optimistic_gives_up_after_retries(library, monkeypatch):
+    monkeypatch.setattr(locking, 'MAX_RETRIES', 3)
+    set_store(BookStore())
+    calls = []
+
+    @optimistic(get_store)
+    def add(code: str):
+        calls.append(code)
+        BookStore().add(f'a{len(calls):04d}', 'Name', 'Author', 1)
+        get_store().add(code, 'Other', 'Author', 1)
+
+    with pytest.raises(ConflictError):
+        add('b1234')
+    assert len(calls) == 3
+
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def test_add_book_sees_book_added_by_other_process(library):
+    add_book('a1234', 'Name', 'Author', 1)
+    subprocess.run([sys.executable, APP, '--o', 'add_book', '--book', 'b1234', '--name', 'Other',
+                    '--author', 'Author', '--quantity', '1'], check=True, capture_output=True)
+
+    with pytest.raises(ValueError, match='already in library'):
+        add_book('b1234', 'Other', 'Author', 1)
@@ -0,0 +1,59 @@
+import io
+import json
+
+import pytest
+
+from app import handle_request
+from database import books, users
+from database.users import _iter_json_object
+
+BOOK_CODES = [f'a{i:04d}' for i in range(7)]
+USER_CODES = [f'user{i:02d}' for i in range(7)]
+
+
+@pytest.fixture
+def library_data(library):
+    for code in BOOK_CODES:
+        handle_request({'o': 'add_book', 'book': code, 'name': 'Name', 'author': 'Author',
+                        'quantity': 1})
+    for code in USER_CODES:
+        handle_request({'o': 'add_user', 'user': code})
+    handle_request({'o': 'get_book_from_library', 'user': 'user03', 'book': 'a0003'})
+
+
+@pytest.mark.parametrize('loaded', [False, True])
+def test_books_are_paginated(library_data, loaded):
+    books.set_store(books.BookStore() if loaded else None)
+
+    assert [book['code'] for book in books.iter_books(2, 3)] == BOOK_CODES[2:5]
+    assert [book['code'] for book in books.iter_books(5)] == BOOK_CODES[5:]
+    assert list(books.iter_books(10, 3)) == []
+    response = handle_request({'o': 'get_all_books', 'offset': 6, 'limit': 5})
+    assert [book['code'] for book in response['result']] == BOOK_CODES[6:]
+
+
+@pytest.mark.parametrize('loaded', [False, True])
+def test_users_are_paginated(library_data, loaded):
+    users.set_store(users.UserStore() if loaded else None)
+
+    assert list(users.iter_users(3, 2)) == [('user03', ['a0003']), ('user04', [])]
+    response = handle_request({'o': 'get_all_users', 'offset': 5})
+    assert response['result'] == {'user05': [], 'user06': []}
+
+
+def test_unloaded_store_is_not_loaded_by_iteration(library_data):
+    books.set_store(None)
+    users.set_store(None)
+
+    assert len(list(books.iter_books())) == len(BOOK_CODES)
+    assert len(list(users.iter_users())) == len(USER_CODES)
+    assert books._store is None and users._store is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 65536])
+def test_json_object_is_read_by_chunks(chunk_size):
+    data = {'user01': ['a1234', 'a1234'], 'user02': {}, 'user03': {'b1234': 2}}
+    text = json.dumps(data, indent=2)
+
+    assert dict(_iter_json_object(io.StringIO(text), chunk_size)) == data
+    assert list(_iter_json_object(io.StringIO('{}'), chunk_size)) == []
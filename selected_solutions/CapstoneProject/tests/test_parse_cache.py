@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from app import handle_request
+from database import parse_cache
+from database.books import BOOKS, BookStore
+from database.locking import FileLock
+from database.parse_cache import SUFFIX
+from database.users import USERS, UserStore
+
+
+@pytest.fixture
+def data_file(library):
+    with open('data.txt', 'w') as out_file:
+        out_file.write('data')
+    return 'data.txt'
+
+
+def _parse(value):
+    calls = []
+
+    def parse():
+        calls.append(value)
+        return value
+    return parse, calls
+
+
+def test_cache_is_used_while_file_and_version_are_the_same(data_file):
+    parse, calls = _parse('parsed')
+    assert parse_cache.load(data_file, 1, parse) == 'parsed'
+    assert parse_cache.load(data_file, 1, parse) == 'parsed'
+    assert calls == ['parsed']
+
+    other, calls = _parse('other')
+    assert parse_cache.load(data_file, 2, other) == 'other'
+    assert calls == ['other']
+
+
+def test_cache_of_changed_file_is_not_used(data_file):
+    parse_cache.load(data_file, 1, lambda: 'parsed')
+    with open(data_file, 'a') as out_file:
+        out_file.write(' changed')
+
+    assert parse_cache.load(data_file, 1, lambda: 'changed') == 'changed'
+
+
+def test_broken_cache_is_replaced(data_file):
+    with open(data_file + SUFFIX, 'wb') as out_file:
+        out_file.write(b'broken')
+
+    assert parse_cache.load(data_file, 1, lambda: 'parsed') == 'parsed'
+    assert parse_cache.load(data_file, 1, lambda: 'other') == 'parsed'
+
+
+def test_users_are_loaded_from_cache(library, monkeypatch):
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    assert UserStore().all() == {'user01': []}
+
+    def _load(store):
+        raise AssertionError('users.json is parsed')
+
+    monkeypatch.setattr(UserStore, '_load', _load)
+    assert UserStore().all() == {'user01': []}
+
+
+def test_users_written_after_caching_are_read(library):
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    UserStore()
+    handle_request({'o': 'add_user', 'user': 'user02'})
+
+    assert UserStore().all() == {'user01': [], 'user02': []}
+
+
+def test_version_guards_writes_with_the_same_size_and_time(library):
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    UserStore()
+    stat = os.stat(USERS)
+    # a write of the same size within the same tick of a coarse file system clock
+    with open(USERS, 'w') as out_file:
+        out_file.write('{"user02":{}}')
+    os.utime(USERS, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    lock = FileLock(USERS)
+    with lock.exclusive():
+        lock.write_version(lock.read_version() + 1)
+
+    assert UserStore().all() == {'user02': []}
+
+
+def test_books_are_not_cached(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    BookStore()
+
+    assert not os.path.exists(BOOKS + SUFFIX)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database import reconcile
+from database.books import _parse_to_line
+from database.reconcile import _chunks, _partition_chunk, reconcile_catalogue
+
+
+@pytest.fixture
+def books(library):
+    for code, quantity in (('a1234', 1), ('b1234', 2), ('c1234', 3), ('d1234', 4)):
+        handle_request({'o': 'add_book', 'book': code, 'name': 'Name', 'author': 'Author',
+                        'quantity': quantity})
+    # a checked out copy changes only available quantity, which is not compared
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+
+
+def _write_catalogue(books: list) -> str:
+    with open('catalogue.txt', 'w') as out_file:
+        out_file.writelines(_parse_to_line(*book) for book in books)
+    return 'catalogue.txt'
+
+
+@pytest.mark.parametrize('processes, chunk_size', [(1, 1 << 20), (3, 16)])
+def test_catalogue_differences_are_found(books, monkeypatch, processes, chunk_size):
+    monkeypatch.setattr(reconcile, 'MIN_CHUNK_SIZE', chunk_size)
+    path = _write_catalogue([('e1234', 'Name', 'Author', 5, 5),
+                             ('a1234', 'Name', 'Author', 1, 1),
+                             ('c1234', 'Name', 'Other', 3, 3),
+                             ('d1234', 'Name', 'Author', 40, 40)])
+
+    assert reconcile_catalogue(path, processes=processes) == {
+        'added': ['e1234'], 'removed': ['b1234'], 'changed': ['c1234', 'd1234']
+    }
+
+
+def test_chunks_read_every_line_once(library, monkeypatch):
+    monkeypatch.setattr(reconcile, 'MIN_CHUNK_SIZE', 7)
+    books = [(f'a{i:04d}', 'Name' * i, 'Author', i, i) for i in range(1, 20)]
+    path = _write_catalogue(books)
+
+    lines = []
+    for i, (chunk_path, start, end) in enumerate(_chunks(path, 2)):
+        _partition_chunk(chunk_path, start, end, f'chunk{i}', 1)
+        # a chunk inside one long line has no lines of its own
+        if os.path.exists(f'chunk{i}.0'):
+            with open(f'chunk{i}.0') as in_file:
+                lines += in_file.readlines()
+    assert lines == [_parse_to_line(*book) for book in books]
+
+
+def test_missing_catalogue_is_rejected(books):
+    response = handle_request({'o': 'reconcile_catalogue', 'catalogue': 'missing.txt'})
+    assert response['error'] == 'Catalogue file "missing.txt" does not exist.'
+
+
+def test_reconcile_needs_books_file(books):
+    setup_stores(parser.parse_args(['--o', 'find_book', '--wal']))
+    path = _write_catalogue([])
+
+    response = handle_request({'o': 'reconcile_catalogue', 'catalogue': path})
+    assert 'can be used only with books.txt' in response['error']
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import handle_request
+from database import search
+from database.search import INDEX, search_books, tokenize
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+@pytest.fixture
+def books(library):
+    for code, name, author in (('a1234', 'TheIdiot', 'FyodorDostoyevsky'),
+                               ('a1235', 'Demons', 'FyodorDostoyevsky'),
+                               ('b1234', 'TheTrial', 'FranzKafka')):
+        handle_request({'o': 'add_book', 'book': code, 'name': name, 'author': author,
+                        'quantity': 1})
+
+
+def _codes(query: str) -> list:
+    return [book['code'] for book in search_books(query)]
+
+
+def test_tokenize_splits_by_case_and_digits():
+    assert tokenize('TheIdiot') == {'the', 'idiot'}
+    assert tokenize('Catch22Heller') == {'catch', '22', 'heller'}
+    assert tokenize('') == set()
+
+
+def test_query_words_are_intersected(books):
+    assert _codes('dostoyevsky') == ['a1234', 'a1235']
+    assert _codes('Dostoyevsky idiot') == ['a1234']
+    assert _codes('the') == ['a1234', 'b1234']
+    assert _codes('kafka idiot') == []
+    assert _codes('') == []
+
+
+def test_index_follows_adds_and_deletes(books):
+    assert _codes('trial') == ['b1234']
+    handle_request({'o': 'delete_book', 'book': 'b1234'})
+    handle_request({'o': 'add_book', 'book': 'c1234', 'name': 'TheCastle', 'author': 'FranzKafka',
+                    'quantity': 1})
+
+    assert _codes('trial') == []
+    assert _codes('kafka') == ['c1234']
+    # the index loaded from its file and log has the same postings
+    search.set_index(None)
+    assert _codes('trial') == []
+    assert _codes('kafka') == ['c1234']
+
+
+def test_missing_index_is_built_from_books(books):
+    search_books('kafka')
+    search.reset_index()
+
+    assert not os.path.exists(INDEX)
+    assert _codes('kafka') == ['b1234']
+    assert os.path.exists(INDEX)
+
+
+def test_books_added_by_other_process_are_found(books):
+    assert _codes('castle') == []
+    subprocess.run([sys.executable, APP, '--o', 'add_book', '--book', 'c1234', '--name',
+                    'TheCastle', '--author', 'FranzKafka', '--quantity', '1'],
+                   check=True, capture_output=True)
+
+    assert _codes('castle') == ['c1234']
+    assert _codes('kafka') == ['b1234', 'c1234']
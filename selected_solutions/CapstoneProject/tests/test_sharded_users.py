@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database.sharded_users import (USERS_SHARDS, ShardedUserStore, _shard_path,
+                                    convert_to_sharded, shard_of)
+
+USER_CODES = [f'user{i:02d}' for i in range(20)]
+
+
+@pytest.fixture
+def users(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 5})
+    for code in USER_CODES:
+        handle_request({'o': 'add_user', 'user': code})
+    for _ in range(2):
+        handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+
+
+def _read_shard(index: int) -> dict:
+    with open(_shard_path(USERS_SHARDS, index)) as in_file:
+        return json.load(in_file)
+
+
+def test_users_are_split_by_their_codes(users):
+    convert_to_sharded(shards=4)
+
+    for code in USER_CODES:
+        assert code in _read_shard(shard_of(code, 4))
+    assert sum(len(_read_shard(index)) for index in range(4)) == len(USER_CODES)
+    assert _read_shard(shard_of('user01', 4))['user01'] == {'a1234': 2}
+
+
+def test_write_rewrites_only_the_shard_of_the_user(users):
+    convert_to_sharded(shards=4)
+    setup_stores(parser.parse_args(['--o', 'find_book', '--users-format', 'sharded']))
+    shard = shard_of('user02', 4)
+    before = [_read_shard(index) for index in range(4)]
+
+    handle_request({'o': 'get_book_from_library', 'user': 'user02', 'book': 'a1234'})
+
+    for index in range(4):
+        expected = dict(before[index])
+        if index == shard:
+            expected['user02'] = {'a1234': 1}
+        assert _read_shard(index) == expected
+    assert handle_request({'o': 'get_user_books', 'user': 'user01'})['result'] == ['a1234'] * 2
+
+
+def test_store_reads_new_layout_after_conversion(users):
+    convert_to_sharded(shards=4)
+    store = ShardedUserStore()
+    assert store.books('user01') == ['a1234', 'a1234']
+
+    convert_to_sharded(shards=2)
+    store.refresh()
+
+    assert store.shard_count == 2
+    assert store.books('user01') == ['a1234', 'a1234']
+    # shard files of the previous layout are removed
+    assert sorted(name for name in os.listdir(USERS_SHARDS) if name.endswith('.json')) == [
+        'meta.json', 'users.0000.json', 'users.0001.json'
+    ]
+
+
+def test_all_users_are_iterated_across_shards(users):
+    convert_to_sharded(shards=4)
+    setup_stores(parser.parse_args(['--o', 'find_book', '--users-format', 'sharded']))
+    handle_request({'o': 'add_user', 'user': 'user99'})
+
+    all_users = handle_request({'o': 'get_all_users'})['result']
+    assert sorted(all_users) == sorted(USER_CODES + ['user99'])
+    assert all_users['user01'] == ['a1234', 'a1234']
+
+
+def test_invalid_number_of_shards_is_rejected(users):
+    response = handle_request({'o': 'convert_users', 'shards': -1})
+    assert response['error'] == 'Number of shards must be positive integer.'
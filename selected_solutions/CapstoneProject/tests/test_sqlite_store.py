@@ -0,0 +1,79 @@
+import pytest
+
+from app import handle_request, parser, setup_stores
+from database.books import BookStore
+from database.sqlite_store import SqliteBookStore, SqliteUserStore, connect
+from database.users import UserStore
+
+
+@pytest.fixture
+def stores(library):
+    setup_stores(parser.parse_args(['--o', 'find_book', '--backend', 'sqlite']))
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 1})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    connection = connect()
+    yield SqliteBookStore(connection), SqliteUserStore(connection)
+    connection.close()
+
+
+def test_available_quantity_never_becomes_negative(stores):
+    books_store, _ = stores
+    books_store.change_available_quantity('a1234', -1)
+
+    with pytest.raises(ValueError, match='no available book'):
+        books_store.change_available_quantity('a1234', -1)
+    assert books_store.find('a1234')['available_quantity'] == 0
+
+
+def test_checkouts_and_returns_keep_loans(stores):
+    books_store, users_store = stores
+    handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+    response = handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+
+    assert response['error'] == 'Sorry there is no available book at this moment.'
+    assert users_store.books('user01') == ['a1234']
+    assert books_store.find('a1234')['available_quantity'] == 0
+
+    handle_request({'o': 'return_book_to_library', 'user': 'user01', 'book': 'a1234'})
+    assert users_store.books('user01') == []
+    assert books_store.find('a1234')['available_quantity'] == 1
+
+
+def test_failed_transaction_is_rolled_back(stores):
+    books_store, users_store = stores
+    # transactions defer commits of the stores to the end of the locked block
+    books_store.deferred = users_store.deferred = True
+    with pytest.raises(RuntimeError):
+        with books_store.locked():
+            books_store.change_available_quantity('a1234', -1)
+            users_store.add_loan('user01', 'a1234')
+            raise RuntimeError
+
+    assert books_store.find('a1234')['available_quantity'] == 1
+    assert users_store.books('user01') == []
+
+
+def test_commits_of_other_connections_are_read(stores):
+    books_store, _ = stores
+    generation = books_store.generation
+    handle_request({'o': 'add_book', 'book': 'b1234', 'name': 'Other', 'author': 'Author',
+                    'quantity': 2})
+
+    assert books_store.generation != generation
+    assert books_store.find('b1234')['quantity'] == 2
+
+
+def test_files_are_converted(library):
+    handle_request({'o': 'add_book', 'book': 'a1234', 'name': 'Name', 'author': 'Author',
+                    'quantity': 2})
+    handle_request({'o': 'add_user', 'user': 'user01'})
+    for _ in range(2):
+        handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+
+    handle_request({'o': 'convert_to_sqlite'})
+
+    connection = connect()
+    assert SqliteBookStore(connection).all() == BookStore().all()
+    assert SqliteUserStore(connection).all() == UserStore().all() == {'user01': ['a1234'] * 2}
+    connection.close()
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from database import transactions
+from database.books import BookStore, get_store as get_books_store
+from database.transactions import JOURNAL
+from database.users import UserStore, get_store as get_users_store
+
+
+@pytest.fixture
+def stores(library):
+    books_store, users_store = get_books_store(), get_users_store()
+    books_store.add('a1234', 'Name', 'Author', 2)
+    users_store.add('user01')
+    return books_store, users_store
+
+
+def _write_journal(*records):
+    with open(JOURNAL, 'w') as out_file:
+        out_file.writelines(json.dumps(record) + '\n' for record in records)
+
+
+def test_recover_applies_journal(stores):
+    # the process has crashed after syncing the journal, before writing the stores
+    record = {'book': 'a1234', 'available_quantity': 1, 'user': 'user01', 'count': 1}
+    _write_journal(record, record)
+
+    transactions.recover()
+
+    assert BookStore().find('a1234')['available_quantity'] == 1
+    assert UserStore().books('user01') == ['a1234']
+    with open(JOURNAL, 'r') as in_file:
+        assert in_file.read() == ''
+
+
+def test_recover_skips_torn_record(stores):
+    record = {'book': 'a1234', 'available_quantity': 1, 'user': 'user01', 'count': 1}
+    _write_journal(record)
+    with open(JOURNAL, 'a') as out_file:
+        out_file.write('{"book": "a1234", "available_quantity": 0, "us')
+
+    transactions.recover()
+
+    assert BookStore().find('a1234')['available_quantity'] == 1
+    assert UserStore().books('user01') == ['a1234']
+
+
+def test_transaction_commits_both_stores(stores):
+    books_store, users_store = stores
+    with transactions.transaction('user01', 'a1234'):
+        books_store.change_available_quantity('a1234', -1)
+        users_store.add_loan('user01', 'a1234')
+
+    assert BookStore().find('a1234')['available_quantity'] == 1
+    assert UserStore().books('user01') == ['a1234']
+    with open(JOURNAL, 'r') as in_file:
+        assert in_file.read() == ''
+
+
+def test_failed_transaction_is_rolled_back(stores):
+    books_store, users_store = stores
+    with pytest.raises(ValueError):
+        with transactions.transaction('user01', 'a1234'):
+            books_store.change_available_quantity('a1234', -1)
+            raise ValueError('User can not take the book.')
+
+    assert books_store.find('a1234')['available_quantity'] == 2
+    assert BookStore().find('a1234')['available_quantity'] == 2
+    assert UserStore().books('user01') == []
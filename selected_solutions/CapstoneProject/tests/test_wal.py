@@ -0,0 +1,109 @@
+import json
+import os
+
+from app import handle_request, parser, setup_stores
+from database.books import BookStore, add_book, find_book, get_store as get_books_store, \
+    set_store as set_books_store
+from database.users import UserStore, add_user, get_user_books, \
+    set_store as set_users_store
+from database.wal import BOOKS_LOG, USERS_LOG, WalBookStore, WalUserStore, fold_logs
+
+
+def test_replay_restores_changes(library):
+    books_store, users_store = WalBookStore(), WalUserStore()
+    books_store.add('a1234', 'Name', 'Author', 3)
+    books_store.add('b1234', 'Other', 'Author', 1)
+    books_store.change_available_quantity('a1234', -1)
+    books_store.delete('b1234')
+    users_store.add('user01')
+    users_store.add_loan('user01', 'a1234')
+
+    books_store, users_store = WalBookStore(), WalUserStore()
+    assert books_store.all() == [{'code': 'a1234', 'name': 'Name', 'author': 'Author',
+                                  'quantity': 3, 'available_quantity': 2}]
+    assert users_store.all() == {'user01': ['a1234']}
+
+
+def test_replay_after_compaction(library):
+    books_store = WalBookStore(compact_threshold=2)
+    books_store.add('a1234', 'Name', 'Author', 3)
+    books_store.add('b1234', 'Other', 'Author', 1)
+    books_store.change_available_quantity('a1234', -1)
+
+    books_store = WalBookStore()
+    assert books_store.find('a1234')['available_quantity'] == 2
+    assert books_store.find('b1234')['quantity'] == 1
+
+
+def test_torn_tail_is_skipped_and_cut_off(library):
+    users_store = WalUserStore()
+    users_store.add('user01')
+    with open(USERS_LOG, 'a') as out_file:
+        out_file.write('{"op": "put", "code": "user02", "bo')
+
+    users_store = WalUserStore()
+    assert users_store.all() == {'user01': []}
+
+    users_store.add('user03')
+    assert WalUserStore().all() == {'user01': [], 'user03': []}
+    with open(USERS_LOG, 'r') as in_file:
+        assert [json.loads(line)['op'] for line in in_file] == ['put', 'put']
+
+
+def test_record_without_newline_is_torn(library):
+    books_store = WalBookStore()
+    books_store.add('a1234', 'Name', 'Author', 3)
+    with open(BOOKS_LOG, 'r') as in_file:
+        record = in_file.read()
+    with open(BOOKS_LOG, 'a') as out_file:
+        out_file.write(record.replace('a1234', 'b1234').rstrip('\n'))
+
+    assert [book['code'] for book in WalBookStore().all()] == ['a1234']
+
+
+def test_loan_of_missing_user_is_skipped(library):
+    with open(USERS_LOG, 'w') as out_file:
+        out_file.write(json.dumps({'op': 'loan', 'code': 'user01', 'book': 'a1234',
+                                   'count': 1}) + '\n')
+
+    assert WalUserStore().all() == {}
+
+
+def test_compaction_at_threshold_folds_log_into_snapshot(library):
+    books_store = WalBookStore(compact_threshold=2)
+    books_store.add('a1234', 'Name', 'Author', 3)
+    books_store.add('b1234', 'Other', 'Author', 1)
+
+    assert os.path.getsize(BOOKS_LOG) == 0
+    assert sorted(book['code'] for book in BookStore().all()) == ['a1234', 'b1234']
+    books_store.add('c1234', 'Third', 'Author', 1)
+    assert sorted(book['code'] for book in WalBookStore().all()) == ['a1234', 'b1234', 'c1234']
+
+
+def test_fold_logs_gives_changes_to_runs_without_wal(library):
+    books_store, users_store = WalBookStore(), WalUserStore()
+    books_store.add('a1234', 'Name', 'Author', 2)
+    books_store.change_available_quantity('a1234', -1)
+    users_store.add('user01')
+    users_store.add_loan('user01', 'a1234')
+
+    fold_logs()
+
+    assert os.path.getsize(BOOKS_LOG) == os.path.getsize(USERS_LOG) == 0
+    assert BookStore().find('a1234')['available_quantity'] == 1
+    assert UserStore().books('user01') == ['a1234']
+
+
+def test_app_without_wal_folds_logs(library):
+    setup_stores(parser.parse_args(['--o', 'find_book', '--wal']))
+    add_book('a1234', 'Name', 'Author', 2)
+    add_user('user01')
+    handle_request({'o': 'get_book_from_library', 'user': 'user01', 'book': 'a1234'})
+
+    # the next run is a new process, which starts with default stores
+    set_books_store(None)
+    set_users_store(None)
+    setup_stores(parser.parse_args(['--o', 'find_book']))
+    assert type(get_books_store()) is BookStore
+    assert find_book('a1234')['available_quantity'] == 1
+    assert get_user_books('user01') == ['a1234']
@@ -0,0 +1,241 @@
+"""
+Benchmark of the library database. For every size it generates synthetic books.txt and users.json
+in a temporary directory, times public functions of database/books.py and database/users.py and
+end-to-end runs of app.py, and reports ops/sec, p50/p99 latency and peak RSS:
+
+    python tools/bench_database.py --sizes 1000 100000 1000000 --out bench.json
+
+Each size is measured in a separate process, so peak RSS of one size does not include the data of
+the previous one. Results are written as json, so runs can be compared with each other.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+from database import books, users  # noqa: E402
+from database.books import BOOKS, _parse_to_line  # noqa: E402
+from database.users import USERS  # noqa: E402
+
+USERS_PER_BOOK = 0.1
+LOANS_PER_USER = 3
+
+
+def book_code(i: int) -> str:
+    return f'{i:05x}'
+
+
+def user_code(i: int) -> str:
+    return f'u{i:05x}'
+
+
+def generate(size: int, seed: int = 0):
+    """Writes books.txt with `size` books and users.json with size / 10 users, who hold books."""
+    rng = random.Random(seed)
+    loans = {}
+    for i in range(max(1, int(size * USERS_PER_BOOK))):
+        user_loans = loans[user_code(i)] = {}
+        for _ in range(rng.randrange(LOANS_PER_USER + 1)):
+            code = book_code(rng.randrange(size))
+            user_loans[code] = user_loans.get(code, 0) + 1
+
+    given = {}
+    for user_loans in loans.values():
+        for code, count in user_loans.items():
+            given[code] = given.get(code, 0) + count
+
+    with open(BOOKS, 'w') as out_file:
+        for i in range(size):
+            quantity = 5 + given.get(book_code(i), 0)
+            out_file.write(_parse_to_line(book_code(i), f'Name{i}', f'Author{i % 1000}',
+                                          quantity, quantity - given.get(book_code(i), 0)))
+    with open(USERS, 'w') as out_file:
+        json.dump(loans, out_file, separators=(',', ':'))
+
+
+def write_csv(path: str, codes: Iterable[str]):
+    """Writes the csv file for import_books with new books of the given codes."""
+    with open(path, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(['code', 'name', 'author', 'quantity'])
+        writer.writerows((code, 'BenchName', 'BenchAuthor', 5) for code in codes)
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(latencies: List[float]) -> Dict:
+    """Returns ops/sec and latency percentiles in milliseconds."""
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'ops_per_sec': round(len(latencies) / total, 1) if total else None,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+    }
+
+
+def measure(function: Callable, calls: Iterable[tuple]) -> Dict:
+    """Calls the function with each arguments tuple, output of the function is dropped."""
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in calls:
+            start = time.perf_counter()
+            function(*args)
+            latencies.append(time.perf_counter() - start)
+    return summary(latencies)
+
+
+def bench_functions(size: int, repeat: int, scans: int) -> Dict:
+    """
+    Times public functions of books.py and users.py against the loaded stores. Each call of
+    import_books imports `repeat` new books from its own csv file.
+    """
+    rng = random.Random(1)
+    user_count = max(1, int(size * USERS_PER_BOOK))
+    existing = [book_code(rng.randrange(size)) for _ in range(repeat)]
+    missing = [f'z{i:04x}' for i in range(repeat)]
+    people = [user_code(rng.randrange(user_count)) for _ in range(repeat)]
+    new_books = [f'y{i:04x}' for i in range(repeat)]
+    new_users = [f'n{i:05x}' for i in range(repeat)]
+    imports = []
+    for i in range(scans):
+        imports.append(f'import{i}.csv')
+        write_csv(imports[-1], (f'x{i * repeat + j:04x}' for j in range(repeat)))
+
+    results = {}
+    start = time.perf_counter()
+    books.get_store()
+    users.get_store()
+    results['load_stores'] = summary([time.perf_counter() - start])
+
+    results['find_book'] = measure(books.find_book, ((code,) for code in existing))
+    results['find_book_missing'] = measure(books.find_book, ((code,) for code in missing))
+    results['get_all_books'] = measure(books.get_all_books, [()] * scans)
+    results['iter_books'] = measure(lambda: list(books.iter_books(0, 100)), [()] * repeat)
+    results['add_book'] = measure(books.add_book,
+                                  ((code, 'BenchName', 'BenchAuthor', 5) for code in new_books))
+    results['give_book_to_user'] = measure(books.give_book_to_user,
+                                           ((code,) for code in new_books))
+    results['get_book_from_user'] = measure(books.get_book_from_user,
+                                            ((code,) for code in new_books))
+    results['delete_book'] = measure(books.delete_book, ((code,) for code in new_books))
+    results['import_books'] = measure(books.import_books, ((path,) for path in imports))
+
+    results['get_user_books'] = measure(users.get_user_books, ((code,) for code in people))
+    results['get_all_users'] = measure(users.get_all_users, [()] * scans)
+    results['iter_users'] = measure(lambda: list(users.iter_users(0, 100)), [()] * repeat)
+    results['add_user'] = measure(users.add_user, ((code,) for code in new_users))
+    results['get_book_from_library'] = measure(
+        users.get_book_from_library, ((user, book) for user, book in zip(new_users, existing)))
+    results['return_book_to_library'] = measure(
+        users.return_book_to_library, ((user, book) for user, book in zip(new_users, existing)))
+    results['delete_user'] = measure(users.delete_user, ((code,) for code in new_users))
+    return results
+
+
+def bench_app(size: int, repeat: int) -> Dict:
+    """Times end-to-end runs of app.py, each run is a new process, which loads data files."""
+    rng = random.Random(2)
+    user_count = max(1, int(size * USERS_PER_BOOK))
+    app = os.path.join(PROJECT, 'app.py')
+    operations = {
+        'find_book': lambda: ['--book', book_code(rng.randrange(size))],
+        'get_user_books': lambda: ['--user', user_code(rng.randrange(user_count))],
+        'get_book_from_library': lambda: ['--user', user_code(0), '--book', book_code(0)],
+        'return_book_to_library': lambda: ['--user', user_code(0), '--book', book_code(0)],
+    }
+
+    results = {}
+    for operation, arguments in operations.items():
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, app, '--o', operation, *arguments()],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            latencies.append(time.perf_counter() - start)
+        results[f'app.py {operation}'] = summary(latencies)
+    return results
+
+
+def bench_size(size: int, repeat: int, scans: int, app_repeat: int) -> Dict:
+    """Runs all benchmarks for one size in a temporary directory."""
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir(os.path.dirname(BOOKS))
+        start = time.perf_counter()
+        generate(size)
+        generated = time.perf_counter() - start
+        books_size = os.path.getsize(BOOKS)
+
+        functions = bench_functions(size, repeat, scans)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        app = bench_app(size, app_repeat) if app_repeat else {}
+        app_peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return {
+        'size': size,
+        'generate_sec': round(generated, 3),
+        'books_txt_mb': round(books_size / 2 ** 20, 1),
+        'functions': functions,
+        'app': app,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(peak_rss / 1024, 1),
+        'app_peak_rss_mb': round(app_peak_rss / 1024, 1),
+    }
+
+
+def _print(result: Dict):
+    print(f'\n{result["size"]} books, peak RSS {result["peak_rss_mb"]} MB, '
+          f'app.py peak RSS {result["app_peak_rss_mb"]} MB')
+    print(f'{"operation":<32} {"calls":>7} {"ops/sec":>12} {"p50, ms":>10} {"p99, ms":>10}')
+    for name, row in {**result['functions'], **result['app']}.items():
+        print(f'{name:<32} {row["calls"]:>7} {row["ops_per_sec"] or 0:>12.1f} '
+              f'{row["p50_ms"]:>10.3f} {row["p99_ms"]:>10.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Numbers of books, at most 16 ** 5.')
+    parser.add_argument('--repeat', type=int, default=1000,
+                        help='Number of calls of each function, which works with one book or user.')
+    parser.add_argument('--scans', type=int, default=3,
+                        help='Number of calls of functions, which return all books or users.')
+    parser.add_argument('--app-repeat', type=int, default=5,
+                        help='Number of app.py runs of each operation, 0 skips them.')
+    parser.add_argument('--out', type=str, default='bench.json', help='Json file for results.')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            result = pool.apply(bench_size, (size, args.repeat, args.scans, args.app_repeat))
+        _print(result)
+        results.append(result)
+
+    with open(args.out, 'w') as out_file:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results
+        }, out_file, indent=2)
+    print(f'\nResults are written to {args.out}.')
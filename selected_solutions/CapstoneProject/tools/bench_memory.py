@@ -0,0 +1,62 @@
+"""
+Memory benchmark of books kept in memory: dict per book (as it was before) versus slotted Book
+records, which are used by BookStore now. Memory is measured with tracemalloc:
+
+    python tools/bench_memory.py --sizes 100000 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.books import BookStore, _parse_from_line, _parse_to_line  # noqa: E402
+
+
+def _write_books(path: str, size: int):
+    """Writes the file with `size` synthetic books, their codes are 5 hex digits."""
+    with open(path, 'w') as out_file:
+        for i in range(size):
+            out_file.write(_parse_to_line(f'{i:05x}', f'Name{i}', f'Author{i % 1000}', 5, 3))
+
+
+def _load_dicts(path: str) -> Dict:
+    """Loads books in the old way: dict for every book."""
+    with open(path, 'r') as in_file:
+        return {book.code: book.to_dict() for book in map(_parse_from_line, in_file)}
+
+
+def _load_records(path: str) -> Dict:
+    """Loads books by BookStore: slotted Book record for every book."""
+    return BookStore(path).books
+
+
+def measure(load: Callable, path: str) -> int:
+    """Returns the number of bytes, which are allocated for the loaded data and kept alive."""
+    gc.collect()
+    tracemalloc.start()
+    data = load(path)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='Numbers of books, at most 16 ** 5.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'books.txt')
+        print(f'{"books":>10} {"dicts, MB":>12} {"records, MB":>12} {"reduction":>10}')
+        for size in args.sizes:
+            _write_books(path, size)
+            dicts, records = measure(_load_dicts, path), measure(_load_records, path)
+            print(f'{size:>10} {dicts / 2 ** 20:>12.1f} {records / 2 ** 20:>12.1f} '
+                  f'{dicts / records:>9.2f}x')
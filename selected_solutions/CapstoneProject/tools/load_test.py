@@ -0,0 +1,189 @@
+"""
+Load test of concurrent checkouts. It starts many processes, which share one database directory,
+like desks of one library node. Each process takes random books for random users and returns them
+back, only the `--keep` part of books stays at users. These are "get_book_from_library" and
+"return_book_to_library" operations of the application, they call give_book_to_user /
+get_book_from_library and return_book_to_library / get_book_from_user in one transaction. At the
+end it reports throughput, latency percentiles of both operations and checks that for every book
+its quantity equals its available quantity plus the loans of users:
+
+    python tools/load_test.py --processes 16 --pairs 200
+    python tools/load_test.py --processes 16 --duration 30 --store-args="--wal"
+
+It works in a temporary directory, so data of the project is not touched. `--store-args` are
+passed to app.py parser to choose stores, for example "--backend sqlite".
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import shlex
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import handle_request, parser as app_parser, setup_stores  # noqa: E402
+
+OPERATIONS = ('get_book_from_library', 'return_book_to_library')
+
+
+def _book_code(i: int) -> str:
+    return f'b{i:04d}'
+
+
+def _user_code(i: int) -> str:
+    return f'u{i:05d}'
+
+
+def _setup(store_args: List[str]):
+    """Chooses stores in this process, as app.py does with the same arguments."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup_stores(app_parser.parse_args(['--o', 'find_book', *store_args]))
+
+
+def _worker(worker: int, store_args: List[str], books: int, users: int, pairs: int,
+            duration: float, keep: float) -> Dict:
+    """
+    Runs checkout and return pairs until `pairs` are done or `duration` seconds pass, the `keep`
+    part of books is not returned. Returns latencies of operations, the number of errors and the
+    number of books, which are still held.
+    """
+    _setup(store_args)
+    rng = random.Random(worker)
+    latencies = {operation: [] for operation in OPERATIONS}
+    errors = {operation: 0 for operation in OPERATIONS}
+    held = 0
+
+    start = time.time()
+    done = 0
+    while done < pairs if pairs else time.time() - start < duration:
+        request = {'user': _user_code(rng.randrange(users)),
+                   'book': _book_code(rng.randrange(books))}
+        operations = OPERATIONS[:1] if rng.random() < keep else OPERATIONS
+        for operation in operations:
+            operation_start = time.perf_counter()
+            response = handle_request({'o': operation, **request})
+            latencies[operation].append(time.perf_counter() - operation_start)
+            if response['error'] is not None:
+                errors[operation] += 1
+                # a book, which has not been taken, is not returned
+                break
+            held += 1 if operation == 'get_book_from_library' else -1
+        done += 1
+
+    return {'start': start, 'end': time.time(), 'latencies': latencies, 'errors': errors,
+            'held': held}
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def check_consistency() -> Dict:
+    """
+    Compares available quantities of books with loans of users. Returns the numbers of books
+    and loans and the list of books, whose quantity differs from available quantity plus loans.
+    """
+    loans = {}
+    for user_books in handle_request({'o': 'get_all_users'})['result'].values():
+        for code in user_books:
+            loans[code] = loans.get(code, 0) + 1
+
+    mismatches = []
+    available = 0
+    for book in handle_request({'o': 'get_all_books'})['result']:
+        available += book['available_quantity']
+        if book['available_quantity'] + loans.get(book['code'], 0) != book['quantity'] \
+                or book['available_quantity'] < 0:
+            mismatches.append(book['code'])
+    return {'available': available, 'loans': sum(loans.values()), 'mismatches': mismatches}
+
+
+def run(processes: int, books: int, users: int, quantity: int, pairs: int, duration: float,
+        keep: float, store_args: List[str]) -> Dict:
+    """Runs the load test in the temporary directory and returns its report."""
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir('database')
+        _setup(store_args)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(books):
+                handle_request({'o': 'add_book', 'book': _book_code(i), 'name': f'Book{i}',
+                                'author': 'LoadTest', 'quantity': quantity})
+            for i in range(users):
+                handle_request({'o': 'add_user', 'user': _user_code(i)})
+
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            # each spawned process imports modules again, so it works in the same directory
+            results = pool.starmap(_worker, [
+                (worker, store_args, books, users, pairs, duration, keep)
+                for worker in range(processes)
+            ])
+        consistency = check_consistency()
+
+    elapsed = max(result['end'] for result in results) - min(result['start'] for result in results)
+    report = {'processes': processes, 'seconds': round(elapsed, 3), 'operations': {}}
+    for operation in OPERATIONS:
+        latencies = [latency for result in results for latency in result['latencies'][operation]]
+        report['operations'][operation] = {
+            'calls': len(latencies),
+            'errors': sum(result['errors'][operation] for result in results),
+            'ops_per_sec': round(len(latencies) / elapsed, 1),
+            **{f'p{q}_ms': round(percentile(latencies, q / 100) * 1000, 3) for q in (50, 90, 99)},
+            'max_ms': round(max(latencies, default=0) * 1000, 3),
+        }
+    report['held_by_workers'] = sum(result['held'] for result in results)
+    report['consistency'] = consistency
+    report['consistent'] = (not consistency['mismatches']
+                            and consistency['loans'] == report['held_by_workers']
+                            and consistency['available'] + consistency['loans'] == books * quantity)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8, help='Number of concurrent workers.')
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--quantity', type=int, default=3, help='Quantity of each book.')
+    parser.add_argument('--pairs', type=int, default=100,
+                        help='Number of checkout and return pairs of each worker.')
+    parser.add_argument('--duration', type=float,
+                        help='Run workers for the given number of seconds instead of --pairs.')
+    parser.add_argument('--keep', type=float, default=0.1,
+                        help='Part of checkouts, which are not returned, so loans remain.')
+    parser.add_argument('--store-args', type=str, default='',
+                        help='app.py arguments, which choose stores, for example "--wal".')
+    parser.add_argument('--out', type=str, help='Json file for the report.')
+    args = parser.parse_args()
+
+    result = run(args.processes, args.books, args.users, args.quantity,
+                 0 if args.duration else args.pairs, args.duration, args.keep,
+                 shlex.split(args.store_args))
+
+    print(f'{args.processes} processes, {result["seconds"]} s')
+    print(f'{"operation":<24} {"calls":>7} {"errors":>7} {"ops/sec":>9} {"p50, ms":>9} '
+          f'{"p90, ms":>9} {"p99, ms":>9} {"max, ms":>9}')
+    for name, row in result['operations'].items():
+        print(f'{name:<24} {row["calls"]:>7} {row["errors"]:>7} {row["ops_per_sec"]:>9.1f} '
+              f'{row["p50_ms"]:>9.3f} {row["p90_ms"]:>9.3f} {row["p99_ms"]:>9.3f} '
+              f'{row["max_ms"]:>9.3f}')
+    consistency = result['consistency']
+    print(f'Available: {consistency["available"]}, loans in users: {consistency["loans"]}, '
+          f'held by workers: {result["held_by_workers"]}, '
+          f'total quantity: {args.books * args.quantity}.')
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(result, out_file, indent=2)
+
+    if result['consistent']:
+        print('OK: quantities match loans.')
+    else:
+        sys.exit(f'FAILED: quantities do not match loans of books {consistency["mismatches"]}.')
@@ -0,0 +1,85 @@
+"""
+Stress test of concurrent access to the database. It starts many processes, which at the same time
+take the same book from library for their users and return part of them back, and then checks that
+no update was lost and the book was not over-lent:
+
+    python tools/stress_locking.py --processes 32 --operations 20
+
+It works in a temporary directory, so data of the project is not touched.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import handle_request  # noqa: E402
+from database.books import BOOKS, create_books_data, add_book, find_book  # noqa: E402
+from database.users import USERS, create_users_data, add_user  # noqa: E402
+
+BOOK = 'a0001'
+
+
+def _user_code(worker: int) -> str:
+    return f'u{worker:05d}'
+
+
+def _worker(worker: int, operations: int, returns: int) -> int:
+    """Tries to take the book `operations` times and returns `returns` of them back."""
+    taken = 0
+    for _ in range(operations):
+        response = handle_request({'o': 'get_book_from_library', 'user': _user_code(worker),
+                                   'book': BOOK})
+        taken += response['error'] is None
+    for _ in range(min(returns, taken)):
+        response = handle_request({'o': 'return_book_to_library', 'user': _user_code(worker),
+                                   'book': BOOK})
+        taken -= response['error'] is None
+    return taken
+
+
+def run(processes: int, operations: int, returns: int, quantity: int) -> bool:
+    """Runs the stress test and returns True, if the database stays consistent."""
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir(os.path.dirname(BOOKS))
+        create_books_data()
+        create_users_data()
+        with contextlib.redirect_stdout(io.StringIO()):
+            add_book(BOOK, 'StressTest', 'Author', quantity)
+            for worker in range(processes):
+                add_user(_user_code(worker))
+
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            # each spawned process imports modules again, so it works in the same directory
+            held = pool.starmap(_worker, [(worker, operations, returns)
+                                          for worker in range(processes)])
+
+        with open(USERS, 'r') as in_file:
+            loans = sum(user_loans.get(BOOK, 0) for user_loans in json.load(in_file).values())
+        available = find_book(BOOK)['available_quantity']
+
+    print(f'Held by workers: {sum(held)}, loans in users.json: {loans}, '
+          f'available: {available} of {quantity}.')
+    return sum(held) == loans and loans + available == quantity and available >= 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=32)
+    parser.add_argument('--operations', type=int, default=20,
+                        help='Number of attempts to take the book in each process.')
+    parser.add_argument('--returns', type=int, default=5,
+                        help='Number of books returned by each process.')
+    parser.add_argument('--quantity', type=int, default=400)
+    args = parser.parse_args()
+
+    if run(args.processes, args.operations, args.returns, args.quantity):
+        print('OK: no lost updates.')
+    else:
+        sys.exit('FAILED: updates were lost.')
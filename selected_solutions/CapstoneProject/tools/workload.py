@@ -0,0 +1,265 @@
+"""
+Synthetic workload of the library and its deterministic replay.
+
+`generate` writes a stream of operations as json lines in the format of batch scripts
+(see batch.py), so the same file can be run by `app.py --script`. The stream starts with adding
+books and users, then follows the given mix of operations. Books are chosen by Zipf popularity:
+the book of rank k is requested with the weight 1 / k ** s. The generator keeps the state of the
+library, so checkouts take available books and returns give back books, which users hold: every
+operation of the stream succeeds. All codes follow the rules of add_book and add_user. The same
+seed gives the same stream:
+
+    python tools/workload.py generate --out workload.jsonl --operations 100000 --seed 1 \\
+        --mix add_book=5,checkout=30,return=25,find_book=30,get_user_books=10
+
+`replay` runs the stream against an empty database in a temporary directory and reports the
+throughput and the number of operations, which have failed:
+
+    python tools/workload.py replay workload.jsonl --mode inprocess
+    python tools/workload.py replay workload.jsonl --mode batch
+    python tools/workload.py replay workload.jsonl --mode app --limit 200
+
+`inprocess` calls the database package in this process, `batch` runs one `app.py --script`
+process, `app` runs `app.py` process for each operation.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect
+from itertools import accumulate, islice
+from typing import Dict, Iterator, List
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+DEFAULT_MIX = 'add_book=5,checkout=30,return=25,find_book=30,get_user_books=10'
+OPERATIONS = ('add_book', 'checkout', 'return', 'find_book', 'get_user_books')
+CHECKOUT_ATTEMPTS = 10
+
+
+def _code(i: int, length: int) -> str:
+    """Returns alphanumeric code of the given length for the number i."""
+    digits = []
+    for _ in range(length):
+        i, digit = divmod(i, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+    return ''.join(reversed(digits))
+
+
+def book_code(i: int) -> str:
+    return _code(i, 5)
+
+
+def user_code(i: int) -> str:
+    return _code(i, 6)
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parses the mix of operations like "find_book=70,checkout=30"."""
+    weights = {}
+    for item in mix.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS:
+            raise ValueError(f'Unknown operation "{operation}", use one of: '
+                             f'{", ".join(OPERATIONS)}.')
+        weights[operation] = float(weight)
+    return weights
+
+
+class Generator:
+    """Generator of operations, which keeps the state of the library to produce valid ones."""
+
+    def __init__(self, books: int, users: int, quantity: int, zipf: float, seed: int):
+        self.random = random.Random(seed)
+        self.quantity = quantity
+        self.zipf = zipf
+        self.books = [book_code(i) for i in range(books)]
+        self.users = [user_code(i) for i in range(users)]
+        self.available = {code: quantity for code in self.books}
+        self.loans: Dict[str, List[str]] = {code: [] for code in self.users}
+        self.holders: List[str] = []
+        self._ranks()
+
+    def _ranks(self):
+        """Computes cumulative Zipf weights of books, the order of books is the popularity rank."""
+        self.cum_weights = list(accumulate(1 / rank ** self.zipf
+                                           for rank in range(1, len(self.books) + 1)))
+
+    def popular_book(self) -> str:
+        point = self.random.random() * self.cum_weights[-1]
+        return self.books[min(bisect(self.cum_weights, point), len(self.books) - 1)]
+
+    def setup(self) -> Iterator[Dict]:
+        """Yields operations, which add initial books and users."""
+        for i, code in enumerate(self.books):
+            yield {'o': 'add_book', 'book': code, 'name': f'Book{i}', 'author': f'Author{i % 997}',
+                   'quantity': self.quantity}
+        for code in self.users:
+            yield {'o': 'add_user', 'user': code}
+
+    def add_book(self) -> Dict:
+        code = book_code(len(self.books))
+        self.books.append(code)
+        self.available[code] = self.quantity
+        self.cum_weights.append(self.cum_weights[-1] + 1 / len(self.books) ** self.zipf)
+        return {'o': 'add_book', 'book': code, 'name': f'Book{len(self.books)}',
+                'author': 'NewAuthor', 'quantity': self.quantity}
+
+    def checkout(self) -> Dict:
+        """
+        Gives the popular book to the random user. If all copies of chosen books are given, some
+        book is returned instead.
+        """
+        for _ in range(CHECKOUT_ATTEMPTS):
+            book = self.popular_book()
+            if self.available[book]:
+                break
+        else:
+            return self.return_book()
+
+        user = self.random.choice(self.users)
+        self.available[book] -= 1
+        if not self.loans[user]:
+            self.holders.append(user)
+        self.loans[user].append(book)
+        return {'o': 'get_book_from_library', 'user': user, 'book': book}
+
+    def return_book(self) -> Dict:
+        """Returns the random book of the random user. If nobody has books, a book is found."""
+        if not self.holders:
+            return self.find_book()
+        i = self.random.randrange(len(self.holders))
+        user = self.holders[i]
+        books = self.loans[user]
+        book = books.pop(self.random.randrange(len(books)))
+        self.available[book] += 1
+        if not books:
+            self.holders[i] = self.holders[-1]
+            self.holders.pop()
+        return {'o': 'return_book_to_library', 'user': user, 'book': book}
+
+    def find_book(self) -> Dict:
+        return {'o': 'find_book', 'book': self.popular_book()}
+
+    def get_user_books(self) -> Dict:
+        return {'o': 'get_user_books', 'user': self.random.choice(self.users)}
+
+    def operations(self, count: int, mix: Dict[str, float]) -> Iterator[Dict]:
+        """Yields `count` operations with the given mix."""
+        functions = {'add_book': self.add_book, 'checkout': self.checkout,
+                     'return': self.return_book, 'find_book': self.find_book,
+                     'get_user_books': self.get_user_books}
+        names = list(mix)
+        cum_weights = list(accumulate(mix[name] for name in names))
+        for _ in range(count):
+            name = names[bisect(cum_weights, self.random.random() * cum_weights[-1])]
+            yield functions[name]()
+
+
+def generate(out: str, operations: int, books: int, users: int, quantity: int, zipf: float,
+             mix: str, seed: int):
+    """Writes the workload to the file."""
+    generator = Generator(books, users, quantity, zipf, seed)
+    with open(out, 'w') as out_file:
+        for operation in generator.setup():
+            out_file.write(json.dumps(operation) + '\n')
+        for operation in generator.operations(operations, parse_mix(mix)):
+            out_file.write(json.dumps(operation) + '\n')
+    print(f'{books + users} setup and {operations} operations are written to {out}.')
+
+
+def _replay_inprocess(requests: List[Dict]) -> int:
+    import app
+    app.setup_stores(app.parser.parse_args(['--o', 'find_book']))
+    errors = 0
+    for request in requests:
+        errors += app.handle_request(request)['error'] is not None
+    return errors
+
+
+def _replay_batch(path: str) -> int:
+    process = subprocess.run([sys.executable, os.path.join(PROJECT, 'app.py'), '--script', path],
+                             stdout=subprocess.PIPE, check=True, text=True)
+    return sum(json.loads(line)['error'] is not None for line in process.stdout.splitlines())
+
+
+def _replay_app(requests: List[Dict]) -> int:
+    errors = 0
+    for request in requests:
+        arguments = [sys.executable, os.path.join(PROJECT, 'app.py')]
+        for key, value in request.items():
+            arguments += ['--o' if key == 'o' else f'--{key}', str(value)]
+        errors += subprocess.run(arguments, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL).returncode != 0
+    return errors
+
+
+def replay(path: str, mode: str, limit: int = None) -> Dict:
+    """
+    Runs the workload against the empty database in a temporary directory. Returns the number of
+    operations, failed ones, elapsed time and throughput.
+    """
+    path = os.path.abspath(path)
+    with open(path, 'r') as in_file:
+        requests = [json.loads(line) for line in islice(in_file, limit) if line.strip()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir('database')
+        script = os.path.join(directory, 'workload.jsonl')
+        with open(script, 'w') as out_file:
+            out_file.writelines(json.dumps(request) + '\n' for request in requests)
+
+        start = time.perf_counter()
+        if mode == 'inprocess':
+            with contextlib.redirect_stdout(io.StringIO()):
+                errors = _replay_inprocess(requests)
+        elif mode == 'batch':
+            errors = _replay_batch(script)
+        else:
+            errors = _replay_app(requests)
+        elapsed = time.perf_counter() - start
+        os.chdir(PROJECT)
+
+    return {'mode': mode, 'operations': len(requests), 'errors': errors,
+            'seconds': round(elapsed, 3), 'ops_per_sec': round(len(requests) / elapsed, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='Write the workload to the file.')
+    generate_parser.add_argument('--out', type=str, default='workload.jsonl')
+    generate_parser.add_argument('--operations', type=int, default=10000)
+    generate_parser.add_argument('--books', type=int, default=1000,
+                                 help='Number of books, which are added at the start.')
+    generate_parser.add_argument('--users', type=int, default=100,
+                                 help='Number of users, which are added at the start.')
+    generate_parser.add_argument('--quantity', type=int, default=5, help='Quantity of each book.')
+    generate_parser.add_argument('--zipf', type=float, default=1.1,
+                                 help='Exponent s of Zipf popularity of books.')
+    generate_parser.add_argument('--mix', type=str, default=DEFAULT_MIX,
+                                 help='Weights of operations: ' + ', '.join(OPERATIONS) + '.')
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    replay_parser = commands.add_parser('replay', help='Run the workload and report throughput.')
+    replay_parser.add_argument('path', type=str)
+    replay_parser.add_argument('--mode', type=str, default='inprocess',
+                               choices=['inprocess', 'batch', 'app'])
+    replay_parser.add_argument('--limit', type=int, help='Replay only first LIMIT operations.')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        generate(args.out, args.operations, args.books, args.users, args.quantity, args.zipf,
+                 args.mix, args.seed)
+    else:
+        print(json.dumps(replay(args.path, args.mode, args.limit)))